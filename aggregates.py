@@ -0,0 +1,279 @@
+import re
+import heapq
+from operator import itemgetter
+import numpy as np
+
+# Aggregations behind the marks and ECA charts, kept free of pygame and
+# matplotlib so every chart backend and the report generator share them.
+
+GRADE_BANDS = ['A (90-100)', 'B (80-89)', 'C (70-79)', 'D (60-69)', 'F (<60)']
+
+
+def group_marks(marks):
+    # Returns ({username: [grades]}, {subject: [grades]}) in file order
+    student_marks = {}
+    subject_marks = {}
+    for username, subject, grade in marks:
+        grade = float(grade)
+        # For student averages
+        if username not in student_marks:
+            student_marks[username] = []
+        student_marks[username].append(grade)
+
+        # For subject averages
+        if subject not in subject_marks:
+            subject_marks[subject] = []
+        subject_marks[subject].append(grade)
+    return student_marks, subject_marks
+
+
+def averages(grouped):
+    # {key: [grades]} -> {key: mean}
+    return {key: sum(values) / len(values) for key, values in grouped.items()}
+
+
+def grade_band(grade):
+    if grade >= 90:
+        return 'A (90-100)'
+    elif grade >= 80:
+        return 'B (80-89)'
+    elif grade >= 70:
+        return 'C (70-79)'
+    elif grade >= 60:
+        return 'D (60-69)'
+    return 'F (<60)'
+
+
+def grade_distribution(student_marks):
+    grade_ranges = dict.fromkeys(GRADE_BANDS, 0)
+    for grades in student_marks.values():
+        for grade in grades:
+            grade_ranges[grade_band(grade)] += 1
+    return grade_ranges
+
+
+def activity_counts(activities):
+    # {activity: number of students}, in first-seen order
+    counts = {}
+    for username, activity in activities:
+        counts[activity] = counts.get(activity, 0) + 1
+    return counts
+
+
+# -- ECA chart at many clubs -------------------------------------------------
+#
+# The ECA pie gets one wedge per activity, which is unreadable (and slow to
+# lay out) with hundreds of clubs. The chart shows the ECA_TOP_K largest
+# activities, or categories, and folds the rest into "Other".
+
+ECA_TOP_K = 8  # plus "Other", which fills Pastel1's nine colours
+OTHER = 'Other'
+
+# Activities are matched to a category by keyword, so "Football Team" and
+# "Football" both land in Sports. Anything unmatched counts as Other.
+ACTIVITY_TYPES = {
+    'Sports': ['Football', 'Basketball', 'Cricket', 'Tennis'],
+    'Arts': ['Drama', 'Music', 'Dance', 'Art'],
+    'Academic': ['Debate', 'Science Club', 'Math Club'],
+    'Other': ['Community Service', 'Environmental Club']
+}
+
+_KEYWORD_CATEGORY = {keyword.lower(): category
+                     for category, keywords in ACTIVITY_TYPES.items() for keyword in keywords}
+# Longest keywords first so "Science Club" wins over any shorter keyword
+_KEYWORD_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(k) for k in sorted(_KEYWORD_CATEGORY, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE)
+_category_cache = {}
+
+
+def activity_category(activity):
+    category = _category_cache.get(activity)
+    if category is None:
+        match = _KEYWORD_PATTERN.search(activity)
+        category = _KEYWORD_CATEGORY[match.group(1).lower()] if match else OTHER
+        _category_cache[activity] = category
+    return category
+
+
+def category_counts(counts):
+    # Rolls {activity: count} up into {category: count}; works on the distinct
+    # activities, not on every (student, activity) row
+    rolled = {}
+    for activity, count in counts.items():
+        category = activity_category(activity)
+        rolled[category] = rolled.get(category, 0) + count
+    return rolled
+
+
+def top_k_counts(counts, k=ECA_TOP_K):
+    # The k largest entries in their original order, the rest summed into
+    # "Other" (merged with an existing "Other" entry)
+    if len(counts) <= k:
+        return dict(counts)
+    keep = set(heapq.nlargest(k, (key for key in counts if key != OTHER), key=counts.get))
+    top = {}
+    other = 0
+    for key, count in counts.items():
+        if key in keep:
+            top[key] = count
+        else:
+            other += count
+    if other:
+        top[OTHER] = other
+    return top
+
+
+def eca_summary(activities, by='activity', k=ECA_TOP_K):
+    # What the ECA pie draws: {label: count} with at most k + 1 entries
+    counts = activity_counts(activities)
+    if by == 'category':
+        counts = category_counts(counts)
+    elif by != 'activity':
+        raise ValueError(f"Unknown ECA grouping: {by}")
+    return top_k_counts(counts, k)
+
+
+def activities_by_student(activities):
+    grouped = {}
+    for username, activity in activities:
+        grouped.setdefault(username, []).append(activity)
+    return grouped
+
+
+def box_stats(grades):
+    # Quartiles, 1.5 IQR whiskers and outliers, computed the way matplotlib's
+    # boxplot does so both chart backends agree
+    values = np.asarray(grades, dtype=float)
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    low_limit = q1 - 1.5 * iqr
+    high_limit = q3 + 1.5 * iqr
+    inside = values[(values >= low_limit) & (values <= high_limit)]
+    return {
+        'q1': q1,
+        'med': med,
+        'q3': q3,
+        'whislo': inside.min() if inside.size else q1,
+        'whishi': inside.max() if inside.size else q3,
+        'fliers': values[(values < low_limit) | (values > high_limit)].tolist(),
+    }
+
+
+# -- student averages at large roster sizes ----------------------------------
+#
+# One bar per student stops being readable (and gets slow to lay out) long
+# before the roster is large, so above STUDENT_AVG_LIMIT students the chart
+# draws a fixed-size summary instead. Every summary has at most a few dozen
+# bars no matter how many students there are.
+
+STUDENT_AVG_LIMIT = 40
+STUDENT_AVG_MODES = ['auto', 'bars', 'histogram', 'top_bottom', 'bands']
+HISTOGRAM_BINS = 20
+TOP_BOTTOM_N = 10
+PERCENTILE_BANDS = 10
+
+STUDENT_AVG_LABELS = {
+    # view: (title, xlabel, ylabel)
+    'bars': ('Average Marks by Student', 'Student', 'Average Grade'),
+    'histogram': ('Distribution of Student Averages', 'Average Grade', 'Students'),
+    'top_bottom': ('Highest and Lowest Student Averages', 'Student', 'Average Grade'),
+    'bands': ('Student Averages by Percentile Band', 'Percentile Band', 'Average Grade'),
+}
+
+
+def students_in_range(student_avgs, low, high, closed=False):
+    # Students whose average is in [low, high), or [low, high] when closed
+    if closed:
+        return {u: a for u, a in student_avgs.items() if low <= a <= high}
+    return {u: a for u, a in student_avgs.items() if low <= a < high}
+
+
+def top_bottom(student_avgs, n=TOP_BOTTOM_N):
+    # n highest and n lowest averages, highest first. heapq keeps this
+    # O(students * log n) instead of sorting the whole roster.
+    if len(student_avgs) <= 2 * n:
+        return sorted(student_avgs.items(), key=itemgetter(1), reverse=True)
+    top = heapq.nlargest(n, student_avgs.items(), key=itemgetter(1))
+    bottom = heapq.nsmallest(n, student_avgs.items(), key=itemgetter(1))
+    return top + bottom[::-1]
+
+
+def average_histogram(values, bins=HISTOGRAM_BINS, value_range=(0, 100)):
+    counts, edges = np.histogram(values, bins=bins, range=value_range)
+    ranges = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+    return ranges, counts.tolist()
+
+
+def percentile_bands(values, bands=PERCENTILE_BANDS):
+    # Equal-count bands of the averages: [(label, low, high, mean), ...].
+    # Ties can make neighbouring percentiles equal; those bands are merged.
+    percents = np.linspace(0, 100, bands + 1)
+    edges = np.percentile(values, percents)
+    keep = [0] + [i for i in range(1, len(edges)) if edges[i] > edges[i - 1]]
+    if len(keep) == 1:
+        keep.append(len(edges) - 1)
+    percents, edges = percents[keep], edges[keep]
+
+    index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+    counts = np.bincount(index, minlength=len(edges) - 1)
+    sums = np.bincount(index, weights=values, minlength=len(edges) - 1)
+    result = []
+    for i in range(len(edges) - 1):
+        mean = sums[i] / counts[i] if counts[i] else 0.0
+        result.append((f'P{percents[i]:.0f}-{percents[i + 1]:.0f}', float(edges[i]), float(edges[i + 1]), float(mean)))
+    return result
+
+
+def summarize_student_avgs(student_avgs, mode='auto', limit=STUDENT_AVG_LIMIT, value_range=(0, 100)):
+    # What the student_avg chart draws: {'view', 'labels', 'values', 'ranges',
+    # 'title', 'xlabel', 'ylabel'}. ranges holds the (low, high) average range
+    # behind each bar for the aggregated views (None for single-student bars);
+    # see drill_range.
+    view = mode
+    if mode == 'auto':
+        view = 'bars' if len(student_avgs) <= limit else 'histogram'
+    if not student_avgs:
+        view = 'bars'
+
+    if view == 'bars':
+        labels, values = list(student_avgs), list(student_avgs.values())
+        ranges = None
+    elif view == 'top_bottom':
+        ranked = top_bottom(student_avgs)
+        labels, values = [u for u, _ in ranked], [a for _, a in ranked]
+        ranges = None
+    elif view == 'histogram':
+        values_array = np.fromiter(student_avgs.values(), dtype=float, count=len(student_avgs))
+        ranges, values = average_histogram(values_array, value_range=value_range)
+        labels = [f'{round(low, 2):g}-{round(high, 2):g}' for low, high in ranges]
+    elif view == 'bands':
+        values_array = np.fromiter(student_avgs.values(), dtype=float, count=len(student_avgs))
+        bands = percentile_bands(values_array)
+        labels = [label for label, _, _, _ in bands]
+        values = [mean for _, _, _, mean in bands]
+        ranges = [(low, high) for _, low, high, _ in bands]
+    else:
+        raise ValueError(f"Unknown student_avg mode: {mode}")
+
+    title, xlabel, ylabel = STUDENT_AVG_LABELS[view]
+    return {
+        'view': view,
+        'labels': labels,
+        'values': values,
+        'ranges': ranges,
+        'title': title,
+        'xlabel': xlabel,
+        'ylabel': ylabel,
+    }
+
+
+def drill_range(summary, index):
+    # (low, high, closed) of the students behind bar `index` of an aggregated
+    # view, for students_in_range / summarize_student_avgs(value_range=...).
+    # None for views where each bar already is one student.
+    ranges = summary['ranges']
+    if not ranges or not 0 <= index < len(ranges):
+        return None
+    low, high = ranges[index]
+    return low, high, index == len(ranges) - 1
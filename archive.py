@@ -0,0 +1,214 @@
+import os
+import bz2
+import sys
+import gzip
+import json
+import lzma
+import bisect
+import argparse
+import tempfile
+from dataset_io import replace_lines, count_read
+
+# Compressed dataset files, for archived data such as closed terms.
+#
+#   read_lines('dataset/terms/2024-T1.txt.xz')         # whole file
+#   lookup('dataset/terms/2024-T1.txt.xz', 'alice')     # one student's lines
+#   python -m archive compress dataset/terms/2024-T1.txt --codec xz
+#
+# The codec comes from the suffix (.gz, .xz, .bz2; stdlib gzip, lzma, bz2).
+# dataset.read_lines() and parallel_load read these files like plain ones,
+# so read_marks(path) etc. work on them unchanged. Whole files are
+# decompressed READ_BYTES at a time and split into lines per read, not
+# decoded line by line.
+#
+# write() stores the lines sorted by username in independently compressed
+# blocks of about BLOCK_BYTES, one after the other, and writes an index of
+# the blocks (first username, offset, compressed and plain length) to
+# <file>.idx. The file stays a valid .gz / .xz / .bz2 file (the formats
+# allow concatenated streams), so the usual command line tools open it; the
+# index lets lookup() decompress only the blocks that can hold a username,
+# and parallel_load hand whole blocks to its workers. An index whose size
+# doesn't match the file (the file was replaced without it) is ignored, and
+# the file is read from the start.
+#
+# Archives are written once, to a temporary file that then replaces the
+# old one, so readers take no locks. The live dataset files stay plain
+# text: the app appends to them.
+
+CODECS = {'.gz': gzip, '.xz': lzma, '.bz2': bz2}
+READ_BYTES = 1 << 20        # decompressed bytes per read when streaming a file
+BLOCK_BYTES = 256 << 10     # plain bytes per block written by write()
+INDEX_SUFFIX = '.idx'
+
+
+def codec_of(path):
+    # The stdlib module that decompresses `path`, or None for a plain file
+    return CODECS.get(os.path.splitext(path)[1])
+
+
+def username_of(line):
+    return line.split(',', 1)[0]
+
+
+def stream(path):
+    # Lists of the file's lines (newlines kept), one list per READ_BYTES of
+    # decompressed data
+    with open(path, 'rb') as raw, codec_of(path).open(raw, 'rb') as file:
+        rest = b''
+        counted = 0
+        while True:
+            data = file.read(READ_BYTES)
+            count_read(raw.tell() - counted)
+            counted = raw.tell()
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b'\n') + 1
+            rest = data[cut:]
+            if cut:
+                yield data[:cut].decode().splitlines(keepends=True)
+        if rest:
+            yield [rest.decode()]
+
+
+def read_lines(path):
+    lines = []
+    for block in stream(path):
+        lines.extend(block)
+    return lines
+
+
+def read_index(path):
+    # [[first username, offset, length, plain length], ...] of a block
+    # file, or None without a usable index
+    try:
+        with open(path + INDEX_SUFFIX) as f:
+            index = json.load(f)
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+    if index['size'] != size:
+        return None
+    return index['blocks']
+
+
+def read_range(path, start, end):
+    # Decompressed bytes of [start, end), which must hold whole blocks (or
+    # the whole file)
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    count_read(len(data))
+    return codec_of(path).decompress(data)
+
+
+def block_ranges(path, size, count):
+    # [(start, end), ...] covering the file in about `count` pieces of
+    # whole blocks; the whole file as one piece without an index
+    blocks = read_index(path)
+    if not blocks:
+        return [(0, size)]
+    offsets = [offset for _, offset, _, _ in blocks]
+    bounds = [0]
+    for i in range(1, count):
+        j = bisect.bisect_left(offsets, size * i // count)
+        if j < len(offsets) and offsets[j] > bounds[-1]:
+            bounds.append(offsets[j])
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def lookup(path, username):
+    # The lines of `username`, decompressing only the blocks that can hold
+    # them (all of the file without an index)
+    blocks = read_index(path)
+    if blocks is None:
+        return [line for block in stream(path) for line in block if username_of(line) == username]
+    firsts = [first for first, _, _, _ in blocks]
+    # The block before the first one starting at `username` may end with it
+    start = max(bisect.bisect_left(firsts, username) - 1, 0)
+    end = bisect.bisect_right(firsts, username)
+    lines = []
+    for first, offset, length, _ in blocks[start:end]:
+        for line in read_range(path, offset, offset + length).decode().splitlines(keepends=True):
+            if username_of(line) == username:
+                lines.append(line)
+    return lines
+
+
+def write(path, lines, blocks=True):
+    # Compresses lines into path, with the codec of its suffix. With blocks
+    # (the default) the lines are sorted by username and an index is written;
+    # without, they are one stream in their own order.
+    codec = codec_of(path)
+    if codec is None:
+        raise ValueError(f"No codec for {path!r} (use {', '.join(CODECS)})")
+    lines = [line if line.endswith('\n') else line + '\n' for line in lines if line.strip()]
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory or '.')
+    index = []
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            if not blocks:
+                with codec.open(file, 'wb') as compressed:
+                    compressed.write(''.join(lines).encode())
+            else:
+                lines.sort(key=username_of)
+                block, block_bytes = [], 0
+                for i, line in enumerate(lines):
+                    block.append(line)
+                    block_bytes += len(line)
+                    if block_bytes >= BLOCK_BYTES or i == len(lines) - 1:
+                        data = ''.join(block).encode()
+                        compressed = codec.compress(data)
+                        index.append([username_of(block[0]), file.tell(), len(compressed), len(data)])
+                        file.write(compressed)
+                        block, block_bytes = [], 0
+                if not lines:
+                    file.write(codec.compress(b''))   # still a valid, empty archive
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if blocks:
+        replace_lines(path + INDEX_SUFFIX, [json.dumps({'size': os.path.getsize(path), 'blocks': index}) + '\n'])
+    elif os.path.exists(path + INDEX_SUFFIX):
+        os.remove(path + INDEX_SUFFIX)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compress dataset files into indexed block archives")
+    commands = parser.add_subparsers(dest='command', required=True)
+    compress = commands.add_parser('compress', help="Write <file><suffix> next to a plain file")
+    compress.add_argument('files', nargs='+')
+    compress.add_argument('--codec', default='xz', choices=[suffix[1:] for suffix in CODECS])
+    compress.add_argument('--stream', action='store_true', help="One stream in file order, no index")
+    compress.add_argument('--remove', action='store_true', help="Remove the plain file afterwards")
+    decompress = commands.add_parser('decompress', help="Write the plain file next to an archive")
+    decompress.add_argument('files', nargs='+')
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        if args.command == 'compress':
+            with open(path) as f:
+                lines = f.readlines()
+            target = f"{path}.{args.codec}"
+            write(target, lines, blocks=not args.stream)
+            print(f"{target}: {os.path.getsize(path)} -> {os.path.getsize(target)} bytes")
+            if args.remove:
+                os.remove(path)
+        else:
+            if codec_of(path) is None:
+                print(f"Error: {path} has no compressed suffix")
+                return 1
+            target = os.path.splitext(path)[0]
+            replace_lines(target, read_lines(path))
+            print(f"{target}: {os.path.getsize(target)} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
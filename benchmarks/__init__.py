@@ -0,0 +1,4 @@
+# Benchmark suite for the Student Management System.
+#
+# Run with:  python -m benchmarks run --scales 1000,10000
+# Compare:   python -m benchmarks compare results.json
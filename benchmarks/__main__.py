@@ -0,0 +1,74 @@
+import sys
+import argparse
+
+from benchmarks.datagen import parse_scale
+from benchmarks.run import (
+    DEFAULT_BASELINE, run_benchmarks, compare, write_json, read_json
+)
+
+
+def cmd_run(args):
+    scales = [parse_scale(s) for s in args.scales.split(",")]
+    selected = set(args.cases.split(",")) if args.cases else None
+    report = run_benchmarks(scales, args.repeat, args.seed, selected)
+    write_json(args.output, report)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"Baseline saved to {args.baseline}")
+    return 0
+
+
+def cmd_compare(args):
+    current = read_json(args.results)
+    baseline = read_json(args.baseline)
+    rows, regressions = compare(current, baseline, args.threshold)
+
+    print(f"{'scale':>8}  {'case':<32} {'baseline':>11} {'current':>11} {'ratio':>7}")
+    for scale, name, base, cur, ratio in rows:
+        shown_base = f"{base * 1000:>9.2f}ms" if base is not None else f"{'-':>11}"
+        if cur is None:
+            entry = current["results"][scale].get(name, {})
+            print(f"{scale:>8}  {name:<32} {shown_base} {'-':>11} {'-':>7}  FAILED: {entry.get('error', 'missing')}")
+            continue
+        flag = "  REGRESSION" if ratio > 1 + args.threshold else ""
+        print(f"{scale:>8}  {name:<32} {shown_base} {cur * 1000:>9.2f}ms {ratio:>6.2f}x{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%} or failed case(s)")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Student Management System benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Generate datasets and time the app functions")
+    run_parser.add_argument("--scales", default="1k,10k",
+                            help="Comma separated student counts (1k, 10k, 100k, 1m or numbers)")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--cases", default="",
+                            help="Comma separated case names to run (default: all)")
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--save-baseline", action="store_true",
+                            help="Also store these results as the baseline")
+    run_parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    run_parser.set_defaults(func=cmd_run)
+
+    compare_parser = sub.add_parser("compare", help="Compare results against a stored baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="Allowed slowdown before flagging (0.2 = 20%%)")
+    compare_parser.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
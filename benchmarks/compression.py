@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+
+# Disk use and read speed of the compressed archive formats (archive.py)
+# against plain text, on generated grades.txt and eca.txt files.
+#
+#   python -m benchmarks.compression                       # 100k students
+#   python -m benchmarks.compression --students 1m --codecs xz --output compression.json
+#
+# For each file and codec it writes the block format (sorted, indexed) and a
+# single stream, then times a full read (dataset.read_lines), a full parse
+# into code arrays (parallel_load, one process) and one student's lines
+# (archive.lookup; a scan of the whole file for plain text and streams).
+# Throughput is in MB of plain text per second.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.datagen import generate_dataset, parse_scale, student_username
+
+LOOKUPS = 20   # students looked up per format; the median is reported
+
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def scan(path, username):
+    # One student's lines of a plain file, the way a reader without an index finds them
+    with open(path) as f:
+        return [line for line in f if line.split(",", 1)[0] == username]
+
+
+def measure(path, plain_bytes, usernames, repeat):
+    import archive
+    import parallel_load
+    from dataset import read_lines
+
+    find = archive.lookup if archive.codec_of(path) else scan
+    read = timed(lambda: read_lines(path), repeat)
+    parse = timed(lambda: parallel_load.read_grade_codes(path, workers=1), repeat) if "grades" in path else None
+    lookup = statistics.median(timed(lambda: find(path, username), 1) for username in usernames)
+    return {
+        "bytes": os.path.getsize(path),
+        "ratio": plain_bytes / os.path.getsize(path),
+        "read_s": read,
+        "read_mb_s": plain_bytes / read / 1e6,
+        "parse_s": parse,
+        "lookup_ms": lookup * 1000,
+    }
+
+
+def main(argv=None):
+    import archive
+
+    parser = argparse.ArgumentParser(description="Compare compressed archives with plain text dataset files")
+    parser.add_argument("--students", default="100k", help="Size of the generated dataset (10k, 100k, ...)")
+    parser.add_argument("--codecs", default=",".join(suffix[1:] for suffix in archive.CODECS),
+                        help="Comma separated codecs to compare (gz, xz, bz2)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    num_students = parse_scale(args.students)
+    step = max(num_students // LOOKUPS, 1)
+    usernames = [student_username(i) for i in range(0, num_students, step)][:LOOKUPS]
+    workdir = tempfile.mkdtemp(prefix="sms_compression_")
+    results = {"students": num_students, "files": {}}
+    try:
+        dataset = os.path.join(workdir, "dataset")
+        generate_dataset(dataset, num_students, args.seed)
+        for name in ("grades.txt", "eca.txt"):
+            plain = os.path.join(dataset, name)
+            plain_bytes = os.path.getsize(plain)
+            with open(plain) as f:
+                lines = f.readlines()
+            rows = results["files"][name] = {"plain": measure(plain, plain_bytes, usernames, args.repeat)}
+            for codec in args.codecs.split(","):
+                for blocks in (True, False):
+                    label = f"{codec} {'blocks' if blocks else 'stream'}"
+                    path = os.path.join(dataset, f"{name}.{'b' if blocks else 's'}.{codec}")
+                    start = time.perf_counter()
+                    archive.write(path, lines, blocks=blocks)
+                    rows[label] = dict(measure(path, plain_bytes, usernames, args.repeat),
+                                       write_s=time.perf_counter() - start)
+
+            print(f"{name}, {num_students} students, {plain_bytes / 1e6:.1f} MB plain")
+            print(f"  {'format':<13} {'size':>9} {'ratio':>6} {'write':>8} {'read':>8} {'MB/s':>7} "
+                  f"{'parse':>8} {'lookup':>9}")
+            for label, row in rows.items():
+                write = f"{row['write_s']:.2f}s" if "write_s" in row else "-"
+                parse = f"{row['parse_s']:.2f}s" if row["parse_s"] is not None else "-"
+                print(f"  {label:<13} {row['bytes'] / 1e6:>7.2f}MB {row['ratio']:>5.1f}x {write:>8} "
+                      f"{row['read_s']:>7.2f}s {row['read_mb_s']:>7.1f} {parse:>8} {row['lookup_ms']:>7.2f}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
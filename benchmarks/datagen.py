@@ -0,0 +1,123 @@
+import os
+import random
+import argparse
+
+# Seeded generator for synthetic school datasets. Writes the same four files
+# the app reads from dataset/ (users, passwords, grades, eca) so every
+# benchmark runs against the real parsing code.
+
+FIRST_NAMES = [
+    "John", "Michael", "Sarah", "Emma", "Olivia", "Liam", "Noah", "Ava", "Sophia", "Mia",
+    "James", "Lucas", "Amelia", "Ethan", "Harper", "Aarav", "Priya", "Sukrit", "Trisha", "Omar",
+    "Fatima", "Chen", "Yuki", "Carlos", "Maria", "Ivan", "Anya", "Kofi", "Zara", "Leo",
+]
+
+LAST_NAMES = [
+    "Smith", "Brown", "Davis", "Wilson", "Taylor", "Anderson", "Thomas", "Moore", "Martin", "Lee",
+    "Sharma", "Shrestha", "Gurung", "Khan", "Wang", "Tanaka", "Garcia", "Lopez", "Petrov", "Mensah",
+]
+
+SUBJECTS = ["Mathematics", "Science", "English", "History", "Computer Science"]
+
+ACTIVITIES = [
+    "Football Team", "Basketball Team", "Cricket Team", "Tennis Club", "Drama Club",
+    "Music Band", "Dance Team", "Art Club", "Debate Club", "Science Club",
+    "Math Club", "Chess Club", "Community Service", "Environmental Club", "Volunteer Club",
+]
+
+# Scale presets accepted on the command line (e.g. "10k")
+SCALES = {
+    "1k": 1_000,
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+DATASET_FILES = ("users.txt", "passwords.txt", "grades.txt", "eca.txt")
+
+
+def parse_scale(value):
+    value = str(value).strip().lower()
+    if value in SCALES:
+        return SCALES[value]
+    return int(value.replace("_", ""))
+
+
+def student_username(index):
+    # Deterministic so benchmarks can pick known users (first, last, middle)
+    return f"stu{index:07d}"
+
+
+def student_password(index):
+    return f"pw{index:07d}"
+
+
+def generate_dataset(directory, num_students, seed=42, admins=1):
+    """Write a synthetic dataset of num_students students into directory"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    # Files are written in batches so the 1M student scale doesn't build
+    # hundreds of MB of strings at once
+    batch = 10_000
+    paths = {name: os.path.join(directory, name) for name in DATASET_FILES}
+    with open(paths["users.txt"], "w") as users, \
+            open(paths["passwords.txt"], "w") as passwords, \
+            open(paths["grades.txt"], "w") as grades, \
+            open(paths["eca.txt"], "w") as eca:
+        for a in range(admins):
+            admin_name = "admin" if a == 0 else f"admin{a}"
+            users.write(f"{admin_name},admin123,admin,ADMIN{a + 1:03d},Admin User,{admin_name}@school.com,1234567890\n")
+            passwords.write(f"{admin_name},admin123\n")
+
+        for start in range(0, num_students, batch):
+            user_lines = []
+            password_lines = []
+            grade_lines = []
+            eca_lines = []
+            for i in range(start, min(start + batch, num_students)):
+                username = student_username(i)
+                password = student_password(i)
+                first = rng.choice(FIRST_NAMES)
+                last = rng.choice(LAST_NAMES)
+                phone = rng.randrange(10**9, 10**10)
+                user_lines.append(f"{username},{password},student,STU{i + 1:07d},{first} {last},"
+                                  f"{username}@school.com,{phone}\n")
+                password_lines.append(f"{username},{password}\n")
+
+                # Each student has an ability level so averages are spread out
+                # like a real class instead of all sitting at 50
+                ability = rng.gauss(72, 12)
+                for subject in SUBJECTS:
+                    # A few students are missing a mark (absent, transferred in)
+                    if rng.random() < 0.03:
+                        continue
+                    grade = int(min(100, max(0, rng.gauss(ability, 8))))
+                    grade_lines.append(f"{username},{subject},{grade}\n")
+
+                # Most students do 0-3 activities
+                for activity in rng.sample(ACTIVITIES, rng.choice((0, 1, 1, 2, 2, 3))):
+                    eca_lines.append(f"{username},{activity}\n")
+
+            users.writelines(user_lines)
+            passwords.writelines(password_lines)
+            grades.writelines(grade_lines)
+            eca.writelines(eca_lines)
+
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic school dataset")
+    parser.add_argument("directory", help="Output directory (e.g. dataset)")
+    parser.add_argument("--students", default="1k", help="Number of students or preset (1k, 10k, 100k, 1m)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    num_students = parse_scale(args.students)
+    generate_dataset(args.directory, num_students, args.seed)
+    print(f"Wrote {num_students} students to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from collections import deque
+
+# Headless scripted-session replay.
+#
+# Drives the real screens (MenuUI -> LoginUI -> UserManagement -> ...) with a
+# scripted or recorded stream of pygame events under SDL's dummy video driver,
+# and measures per-action latency (event injected -> next finished frame) and
+# frames per second.
+#
+#   python -m benchmarks.replay --students 10k                 # default admin session
+#   python -m benchmarks.replay --script my_session.json       # scripted steps
+#   python -m benchmarks.replay --record session.json          # record on a real display
+#   python -m benchmarks.replay --script session.json          # ...and replay it headless
+#
+# Script steps (JSON list or the DEFAULT_SCRIPT below):
+#   {"action": "click", "target": "marks_button_rect"}   attribute of the current screen
+#   {"action": "click", "target": "viz_buttons[grade_dist]"}
+#   {"action": "click", "target": "@add_form:username"}   see SPECIAL_TARGETS
+#   {"action": "click", "target": [400, 300]}             raw coordinates
+#   {"action": "type", "text": "admin"}
+#   {"action": "key", "key": "RETURN"}
+#   {"action": "wait", "frames": 10}
+#   {"action": "loaded"}             idle until the screen's background load is done
+#   {"action": "frame", "mouse": [x, y], "events": [...]} one recorded frame
+
+if "--record" not in sys.argv:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import pygame
+from instrumentation import metrics
+from benchmarks.datagen import generate_dataset, parse_scale
+
+
+class ReplayFinished(BaseException):
+    # BaseException so the screens' "except Exception" handlers don't swallow it
+    pass
+
+
+def _login_field(screen, field):
+    # simple_ui.LoginUI computes its input rects on the fly; login.LoginUI stores them
+    if hasattr(screen, 'input_x'):
+        y = screen.username_y if field == 'username' else screen.password_y
+        return pygame.Rect(screen.input_x, y, screen.input_width, screen.input_height)
+    return screen.username_box if field == 'username' else screen.password_box
+
+
+# Targets that are not plain attributes of the screen
+SPECIAL_TARGETS = {
+    "login": _login_field,
+    "add_form": lambda s, field: (
+        s.draw_add_student_form()[1] if field == "submit" else
+        s.draw_add_student_form()[2] if field == "back" else
+        s.draw_add_student_form()[0][field]
+    ),
+    "delete_form": lambda s, arg: (
+        s.draw_delete_student_form()[0] if arg == "delete" else
+        s.draw_delete_student_form()[1] if arg == "back" else
+        s.draw_delete_student_form()[2][arg]
+    ),
+}
+
+NEW_STUDENT = {
+    "username": "replay_student",
+    "password": "replay123",
+    "name": "Replay Student",
+    "email": "replay@school.com",
+    "phone": "5551234567",
+    "marks_math": "88",
+    "marks_science": "91",
+    "marks_english": "76",
+    "marks_history": "69",
+    "marks_computer": "95",
+    "eca": "Chess Club, Debate Club",
+}
+
+DEFAULT_SCRIPT = [
+    {"action": "click", "target": "button_rects[Login]", "label": "menu: open login"},
+    {"action": "click", "target": "@login:username"},
+    {"action": "type", "text": "admin"},
+    {"action": "click", "target": "@login:password"},
+    {"action": "type", "text": "admin123"},
+    {"action": "key", "key": "RETURN", "label": "login as admin"},
+
+    {"action": "click", "target": "marks_button_rect", "label": "open marks"},
+    {"action": "loaded", "label": "marks: loaded"},
+    {"action": "type", "text": "stu00001", "label": "marks: search"},
+    {"action": "key", "key": "RETURN", "label": "marks: pick first match"},
+    {"action": "click", "target": "header_button_rect", "label": "marks: leaderboard"},
+    {"action": "click", "target": "back_button_rect", "label": "leaderboard: back"},
+    {"action": "click", "target": "back_button_rect", "label": "marks: back"},
+
+    {"action": "click", "target": "eca_button_rect", "label": "open ECA"},
+    {"action": "loaded", "label": "ECA: loaded"},
+    {"action": "type", "text": "stu00002", "label": "ECA: search"},
+    {"action": "click", "target": "header_button_rect", "label": "ECA: club overlap"},
+    {"action": "click", "target": "back_button_rect", "label": "club overlap: back"},
+    {"action": "click", "target": "back_button_rect", "label": "ECA: back"},
+
+    {"action": "click", "target": "view_students_button_rect", "label": "open students"},
+    {"action": "loaded", "label": "students: loaded"},
+    {"action": "key", "key": "PAGEDOWN", "label": "students: page down"},
+    {"action": "click", "target": "header_button_rect", "label": "students: query"},
+    {"action": "type", "text": "Mathematics > 80 and clubs >= 1"},
+    {"action": "key", "key": "RETURN", "label": "run query"},
+    {"action": "key", "key": "PAGEDOWN", "label": "query: page down"},
+    {"action": "click", "target": "back_button_rect", "label": "query: back"},
+    {"action": "click", "target": "back_button_rect", "label": "students: back"},
+
+    {"action": "click", "target": "visualize_marks_button_rect", "label": "open charts"},
+    {"action": "click", "target": "viz_buttons[subject_perf]", "label": "chart: subject_perf"},
+    {"action": "click", "target": "viz_buttons[grade_dist]", "label": "chart: grade_dist"},
+    {"action": "click", "target": "viz_buttons[subject_dist]", "label": "chart: subject_dist"},
+    {"action": "click", "target": "viz_buttons[heatmap]", "label": "chart: heatmap"},
+    {"action": "click", "target": "viz_buttons[correlation]", "label": "chart: correlation"},
+    {"action": "click", "target": "viz_buttons[student_avg]", "label": "chart: student_avg"},
+    {"action": "click", "target": "back_button_rect", "label": "charts: back"},
+
+    {"action": "click", "target": "delete_student_button_rect", "label": "open delete screen"},
+    {"action": "wait", "frames": 5},
+    {"action": "type", "text": "stu0000", "label": "delete: search"},
+    {"action": "key", "key": "PAGEDOWN", "label": "delete: page down"},
+    {"action": "key", "key": "RETURN", "label": "delete: pick first match"},
+    {"action": "click", "target": "@delete_form:back", "label": "delete: back"},
+
+    {"action": "click", "target": "add_student_button_rect", "label": "open add form"},
+] + [
+    step
+    for field, value in NEW_STUDENT.items()
+    for step in (
+        {"action": "click", "target": f"@add_form:{field}"},
+        {"action": "type", "text": value, "label": f"type {field}"},
+    )
+] + [
+    {"action": "click", "target": "@add_form:submit", "label": "add student"},
+    {"action": "wait", "frames": 5},
+]
+
+
+class _NoWaitClock:
+    # Stand-in for pygame.time.Clock that never sleeps, so FPS measures how
+    # fast the screens can actually produce frames instead of the 60 FPS cap
+    def __init__(self):
+        self.last = time.perf_counter()
+
+    def tick(self, framerate=0):
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        return int(elapsed * 1000)
+
+    def get_fps(self):
+        return 0.0
+
+
+def resolve_target(screen, target):
+    if isinstance(target, (list, tuple)):
+        return tuple(target)
+    if target.startswith("@"):
+        name, _, arg = target[1:].partition(":")
+        rect = SPECIAL_TARGETS[name](screen, arg)
+    else:
+        match = re.fullmatch(r"(\w+)(?:\[(.+)\])?", target)
+        if not match:
+            raise ValueError(f"Bad target: {target}")
+        rect = getattr(screen, match.group(1))
+        if match.group(2) is not None:
+            rect = rect[match.group(2)]
+    return rect.center
+
+
+def key_event(key, char=""):
+    return pygame.event.Event(pygame.KEYDOWN, key=key, unicode=char, mod=0, scancode=0)
+
+
+def key_code(name):
+    return getattr(pygame, f"K_{name}")
+
+
+def decode_event(data):
+    data = dict(data)
+    event_type = data.pop("type")
+    for name in ("pos", "rel", "buttons"):
+        if name in data:
+            data[name] = tuple(data[name])
+    return pygame.event.Event(event_type, data)
+
+
+def encode_event(event):
+    data = {"type": event.type}
+    for name, value in event.dict.items():
+        if isinstance(value, (int, float, str, bool)):
+            data[name] = value
+        elif isinstance(value, tuple):
+            data[name] = list(value)
+    return data
+
+
+class SessionReplay:
+    def __init__(self, steps):
+        self.steps = deque(steps)
+        # Frames queued by the current step: (cursor, events, label)
+        self.frames = deque()
+        self.cursor = (0, 0)
+        self.pending = None  # (label, start time, start screen) waiting for a finished frame
+        self.loading = None  # (label, start time) of a "loaded" step in progress
+        self.actions = []
+        self.frame_count = 0
+        self.start = None
+
+    # -- hooks ---------------------------------------------------------------
+
+    def get_pos(self):
+        return self.cursor
+
+    def event_source(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+        pygame.event.pump()
+
+        # Don't inject anything until the previous action has produced a frame
+        if self.pending:
+            return []
+        while not self.frames and not self.loading:
+            if not self.steps:
+                raise ReplayFinished()
+            self.expand(self.steps.popleft())
+        if self.loading:
+            if getattr(metrics.active_screen, 'loading', None):
+                return []
+            label, started = self.loading
+            screen = metrics.active.name if metrics.active else ""
+            self.actions.append({
+                "action": label,
+                "latency_ms": (time.perf_counter() - started) * 1000,
+                "from_screen": screen,
+                "to_screen": screen,
+            })
+            self.loading = None
+            return []
+
+        cursor, events, label = self.frames.popleft()
+        if cursor is not None:
+            self.cursor = cursor
+        if label:
+            self.pending = (label, time.perf_counter(), metrics.active.name if metrics.active else "")
+        return events
+
+    def on_frame(self, timer, frame_time):
+        self.frame_count += 1
+        if self.pending:
+            label, started, screen = self.pending
+            self.actions.append({
+                "action": label,
+                "latency_ms": (time.perf_counter() - started) * 1000,
+                "from_screen": screen,
+                "to_screen": timer.name,
+            })
+            self.pending = None
+
+    # -- script steps --------------------------------------------------------
+
+    def expand(self, step):
+        action = step["action"]
+        label = step.get("label")
+        screen = metrics.active_screen
+
+        if action == "click":
+            pos = resolve_target(screen, step["target"])
+            label = label or f"click {step['target']}"
+            # Most screens read pygame.mouse.get_pos() before handling events,
+            # so the cursor moves one frame before the button press
+            motion = pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0))
+            press = pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1)
+            release = pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1)
+            self.frames.append((pos, [motion], None))
+            self.frames.append((pos, [press, release], label))
+        elif action == "type":
+            events = [key_event(ord(ch.lower()) if ch.isalnum() else 0, ch) for ch in step["text"]]
+            self.frames.append((None, events, label or f"type {step['text']!r}"))
+        elif action == "key":
+            self.frames.append((None, [key_event(key_code(step["key"]))], label or f"key {step['key']}"))
+        elif action == "wait":
+            for _ in range(step.get("frames", 1)):
+                self.frames.append((None, [], None))
+        elif action == "loaded":
+            self.loading = (label or "loaded", time.perf_counter())
+        elif action == "frame":
+            events = [decode_event(e) for e in step.get("events", [])]
+            interactive = any(e.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN) for e in events)
+            cursor = tuple(step["mouse"]) if "mouse" in step else None
+            self.frames.append((cursor, events, label or (f"recorded frame {step.get('frame')}" if interactive else None)))
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+    # -- running -------------------------------------------------------------
+
+    def run(self, entry, throttled=False):
+        original_get_pos = pygame.mouse.get_pos
+        original_clock = pygame.time.Clock
+        original_source = metrics.event_source
+        pygame.mouse.get_pos = self.get_pos
+        if not throttled:
+            pygame.time.Clock = _NoWaitClock
+        metrics.event_source = self.event_source
+        metrics.frame_listeners.append(self.on_frame)
+
+        error = None
+        try:
+            entry()
+        except ReplayFinished:
+            pass
+        except SystemExit:
+            error = "application exited before the script finished"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            elapsed = time.perf_counter() - (self.start or time.perf_counter())
+            pygame.mouse.get_pos = original_get_pos
+            pygame.time.Clock = original_clock
+            metrics.event_source = original_source
+            metrics.frame_listeners.remove(self.on_frame)
+            pygame.quit()
+
+        return {
+            "error": error,
+            "frames": self.frame_count,
+            "elapsed_s": elapsed,
+            "fps": self.frame_count / elapsed if elapsed else 0.0,
+            "actions": self.actions,
+            "screens": metrics.snapshot(),
+        }
+
+
+class SessionRecorder:
+    # Records the real event stream, one entry per frame that had input, in the
+    # same format the replayer accepts as "frame" steps
+    def __init__(self, path):
+        self.path = path
+        self.steps = []
+        self.frame = 0
+        self.idle = 0
+
+    def event_source(self):
+        events = pygame.event.get()
+        self.frame += 1
+        interesting = [e for e in events if e.type in (
+            pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.KEYDOWN, pygame.KEYUP, pygame.QUIT)]
+        if interesting:
+            if self.idle:
+                self.steps.append({"action": "wait", "frames": self.idle})
+                self.idle = 0
+            self.steps.append({
+                "action": "frame",
+                "frame": self.frame,
+                "mouse": list(pygame.mouse.get_pos()),
+                "events": [encode_event(e) for e in interesting if e.type != pygame.QUIT],
+            })
+            self.save()
+        else:
+            self.idle += 1
+        return events
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.steps, f, indent=1)
+
+
+def start_app():
+    from simple_ui import MenuUI
+    MenuUI()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a scripted UI session headless")
+    parser.add_argument("--students", default="1k", help="Generate a dataset of this size (1k, 10k, ...)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dataset", help="Use a copy of this dataset directory instead of generating one")
+    parser.add_argument("--script", help="JSON list of steps (default: built-in admin session)")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--realtime", action="store_true", help="Keep the screens' 60 FPS frame cap")
+    parser.add_argument("--record", metavar="PATH", help="Run the app on a real display and record input")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        recorder = SessionRecorder(args.record)
+        metrics.event_source = recorder.event_source
+        try:
+            start_app()
+        except SystemExit:
+            pass
+        recorder.save()
+        print(f"Recorded {len(recorder.steps)} steps to {args.record}")
+        return 0
+
+    steps = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            steps = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix="sms_replay_")
+    old_cwd = os.getcwd()
+    try:
+        if args.dataset:
+            shutil.copytree(args.dataset, os.path.join(workdir, "dataset"))
+        else:
+            generate_dataset(os.path.join(workdir, "dataset"), parse_scale(args.students), args.seed)
+        os.chdir(workdir)
+        result = SessionReplay(steps).run(start_app, throttled=args.realtime)
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for action in result["actions"]:
+        print(f"  {action['action']:<32} {action['latency_ms']:9.2f} ms  ({action['to_screen']})")
+    print(f"{result['frames']} frames in {result['elapsed_s']:.2f}s ({result['fps']:.1f} FPS)")
+    if result["error"]:
+        print(f"Replay stopped early: {result['error']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if result["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
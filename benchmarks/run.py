@@ -0,0 +1,433 @@
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import platform
+import tempfile
+import statistics
+import subprocess
+
+# Run headless: no window, no audio, Agg for matplotlib. These must be set
+# before pygame / pyplot are imported anywhere.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from benchmarks.datagen import generate_dataset, student_username, student_password
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+MARKS_CHARTS = ["student_avg", "subject_perf", "grade_dist", "subject_dist", "heatmap", "correlation"]
+
+
+class BenchContext:
+    """Apps and counters shared by the cases of one scale"""
+
+    def __init__(self, num_students):
+        from user_management import UserManagement
+        from login import LoginUI
+
+        self.num_students = num_students
+        self.admin = self.make_app(UserManagement, "admin")
+        # Last student in the file: worst case for the linear scans
+        self.student = self.make_app(UserManagement, student_username(num_students - 1))
+        # Same admin view drawn with the pygame chart renderer
+        self.native = self.make_app(UserManagement, "admin")
+        self.native.chart_backend = "native"
+
+        # LoginUI.__init__ opens a window and blocks in run(), so build the
+        # instance by hand and only set what validate_credentials needs
+        self.login = LoginUI.__new__(LoginUI)
+        self.login.username = student_username(num_students - 1)
+        self.login.password = student_password(num_students - 1)
+
+        self.added = 0
+        self.appended = 0
+        self.deleted = 0
+        self.service = None     # client of a data service on this dataset
+        self.snapshot_publisher = None
+        # Only case_snapshot_load uses a snapshot
+        import shared_snapshot
+        shared_snapshot._retry_at = time.monotonic() + 3600
+        self.processes = []     # started by start_process()
+
+    @staticmethod
+    def make_app(cls, username):
+        # Skip __init__: it creates the window and enters the event loop
+        app = cls.__new__(cls)
+        app.width = 800
+        app.height = 600
+        app.username = username
+        app.is_admin = app.check_if_admin()
+        app.error_message = ""
+        return app
+
+    def start_process(self, module, args, ready):
+        # Runs `python -m module args` on this dataset until close(), after
+        # waiting for ready() to be true
+        process = subprocess.Popen([sys.executable, "-m", module] + args,
+                                   env=dict(os.environ, PYTHONPATH=REPO_ROOT), stdout=subprocess.DEVNULL)
+        self.processes.append(process)
+        deadline = time.monotonic() + 120
+        while not ready():
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"{module} did not start")
+            time.sleep(0.05)
+        return process
+
+    def service_client(self):
+        # Client of a data service process serving this dataset, started on first use
+        if self.service is None:
+            from data_service import DataClient
+            path = os.path.join(os.getcwd(), "data_service.sock")
+            self.start_process("data_service", ["--socket", path], lambda: os.path.exists(path))
+            self.service = DataClient(path)
+        return self.service
+
+    def publish_snapshot(self):
+        # Starts a shared snapshot publisher on this dataset
+        import shared_snapshot
+
+        def published():
+            shared_snapshot._retry_at = 0.0
+            return shared_snapshot.latest() is not None
+        self.snapshot_publisher = self.start_process("shared_snapshot", [], published)
+
+    def stop_snapshot(self):
+        # Stops the publisher and forgets the snapshot, so later cases parse
+        # the files themselves again
+        import shared_snapshot, grade_matrix, eca_index
+        self.processes.remove(self.snapshot_publisher)
+        self.snapshot_publisher.terminate()
+        self.snapshot_publisher.wait()
+        shared_snapshot._reader = None
+        shared_snapshot._retry_at = time.monotonic() + 3600
+        grade_matrix._cache.clear()
+        eca_index._cache.clear()
+
+    def close(self):
+        if self.service:
+            self.service.close()
+        for process in self.processes:
+            process.terminate()
+            process.wait()
+
+
+def case_visualize_marks(kind):
+    def run(ctx):
+        # Drop the persistent charts so every run measures a cold build
+        ctx.admin.live_charts = {}
+        ctx.admin.current_marks_viz = kind
+        ctx.admin.visualize_marks()
+    return run
+
+
+def case_visualize_eca(ctx):
+    ctx.admin.live_charts = {}
+    ctx.admin.visualize_eca()
+
+
+def case_native_marks(kind):
+    def run(ctx):
+        ctx.native.current_marks_viz = kind
+        ctx.native.visualize_marks()
+    return run
+
+
+def case_chart_update(ctx):
+    # Warm path: every chart already open (setup), one student's marks added
+    admin = ctx.admin
+    ctx.updated = getattr(ctx, 'updated', 0) + 1
+    with open('dataset/grades.txt', 'a') as f:
+        f.write(f"{student_username(0)},Mathematics,{50 + ctx.updated % 50}\n")
+    for kind in MARKS_CHARTS:
+        admin.current_marks_viz = kind
+        admin.visualize_marks()
+
+
+def open_marks_charts(ctx):
+    # The visualize_marks cases leave cold charts behind; build them all here
+    # so no timed run includes a build
+    ctx.admin.live_charts = {}
+    for kind in MARKS_CHARTS:
+        ctx.admin.current_marks_viz = kind
+        ctx.admin.visualize_marks()
+
+
+case_chart_update.setup = open_marks_charts
+
+
+def case_load(kind):
+    def run(ctx):
+        # Forget the in-memory copy so every run measures a full parse
+        from data_store import store
+        from dataset import GRADES_FILE, ECA_FILE
+        store.files.pop(GRADES_FILE if kind == "marks" else ECA_FILE, None)
+        return ctx.admin.load_marks() if kind == "marks" else ctx.admin.load_eca()
+    return run
+
+
+def case_grade_matrix(kind):
+    # GradeMatrix straight from grades.txt: from row tuples ("rows"), from
+    # code arrays as load_grade_matrix would ("codes"), or coded by a worker
+    # per core whatever the file size ("parallel")
+    def run(ctx):
+        import parallel_load
+        from grade_matrix import GradeMatrix
+        from dataset import read_marks
+        if kind == "rows":
+            return GradeMatrix(read_marks())
+        return GradeMatrix.from_codes(*parallel_load.read_grade_codes())
+
+    if kind == "parallel":
+        def setup(ctx):
+            import parallel_load
+            ctx.parallel_limits = parallel_load.PARALLEL_BYTES, parallel_load.RANGE_BYTES
+            parallel_load.PARALLEL_BYTES = parallel_load.RANGE_BYTES = 1
+
+        def teardown(ctx):
+            import parallel_load
+            parallel_load.PARALLEL_BYTES, parallel_load.RANGE_BYTES = ctx.parallel_limits
+        run.setup = setup
+        run.teardown = teardown
+    return run
+
+
+def case_reload_append(ctx):
+    # Another session appends a mark; the open views pick up only the new line
+    from data_store import store
+    from dataset import GRADES_FILE
+    store.marks()
+    ctx.appended += 1
+    with open(GRADES_FILE, "a") as f:
+        f.write(f"bench_tail{ctx.appended},Mathematics,70\n")
+    store.marks()
+
+
+def case_add_student(ctx):
+    ctx.added += 1
+    ctx.admin.new_student_data = {
+        "username": f"bench_new{ctx.added}",
+        "password": "pw",
+        "name": "Bench Student",
+        "email": "bench@school.com",
+        "phone": "1234567890",
+        "marks_math": "75",
+        "marks_science": "80",
+        "marks_english": "68",
+        "marks_history": "90",
+        "marks_computer": "88",
+        "eca": "Chess Club, Debate Club",
+    }
+    if not ctx.admin.add_student():
+        raise RuntimeError(ctx.admin.error_message)
+
+
+def case_delete_student(ctx):
+    # Delete from the middle so each run removes a different, existing user
+    index = ctx.num_students // 2 + ctx.deleted
+    ctx.deleted += 1
+    if not ctx.admin.delete_student(student_username(index)):
+        raise RuntimeError("delete_student failed")
+
+
+def case_student_search(ctx):
+    # Typing a username into the delete screen's search box, one key at a time
+    ctx.admin.delete_search = ""
+    for char in student_username(ctx.num_students // 3):
+        ctx.admin.delete_search += char
+        ctx.admin.delete_matches()
+
+
+def case_service(calls):
+    # One batched round trip to a data service (started outside the timing)
+    def run(ctx):
+        ctx.service_client().batch(calls(ctx))
+    run.setup = lambda ctx: ctx.service_client()
+    return run
+
+
+def case_snapshot_load(ctx):
+    # A fresh instance attaching the published snapshot: the grade matrix and
+    # ECA index without parsing the files
+    import shared_snapshot, grade_matrix, eca_index
+    grade_matrix._cache.clear()
+    eca_index._cache.clear()
+    shared_snapshot._reader = None
+    grade_matrix.load_grade_matrix()
+    eca_index.load_eca_index()
+
+
+case_snapshot_load.setup = lambda ctx: ctx.publish_snapshot()
+case_snapshot_load.teardown = lambda ctx: ctx.stop_snapshot()
+
+
+def case_login(ctx):
+    if not ctx.login.validate_credentials():
+        raise RuntimeError("login validation failed")
+
+
+# Ordered: the read-only cases first, the ones that modify the dataset last
+CASES = [
+    ("load_marks", case_load("marks")),
+    ("load_eca", case_load("eca")),
+    ("load_all_students", lambda ctx: ctx.admin.load_all_students()),
+] + [
+    (f"grade_matrix[{kind}]", case_grade_matrix(kind)) for kind in ("rows", "codes", "parallel")
+] + [
+    ("check_if_admin", lambda ctx: ctx.student.check_if_admin()),
+    ("login_validate", case_login),
+    ("service_student_load", case_service(lambda ctx: [
+        ("role", {"username": ctx.student.username}),
+        ("marks", {"username": ctx.student.username}),
+        ("eca", {"username": ctx.student.username}),
+    ])),
+    ("service_marks", case_service(lambda ctx: [("marks", {})])),
+    ("snapshot_load", case_snapshot_load),
+    ("student_standing", lambda ctx: ctx.student.student_standing()),
+    ("leaderboard", lambda ctx: ctx.admin.leaderboard_data()),
+    ("student_search", case_student_search),
+    ("query_students", lambda ctx: ctx.admin.query_students("Mathematics < 60 and clubs >= 1")),
+] + [
+    (f"visualize_marks[{kind}]", case_visualize_marks(kind)) for kind in MARKS_CHARTS
+] + [
+    ("visualize_eca", case_visualize_eca),
+] + [
+    (f"native_marks[{kind}]", case_native_marks(kind)) for kind in MARKS_CHARTS
+] + [
+    ("native_eca", lambda ctx: ctx.native.visualize_eca()),
+    ("club_overlap", lambda ctx: ctx.admin.visualize_club_overlap()),
+    ("chart_update", case_chart_update),
+    ("reload_append", case_reload_append),
+    ("add_student", case_add_student),
+    ("delete_student", case_delete_student),
+]
+
+
+def time_case(fn, ctx, repeat):
+    if hasattr(fn, "setup"):
+        fn.setup(ctx)
+    runs = []
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            fn(ctx)
+            runs.append(time.perf_counter() - start)
+    finally:
+        if hasattr(fn, "teardown"):
+            fn.teardown(ctx)
+    return {
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "max": max(runs),
+        "runs": runs,
+    }
+
+
+def is_selected(name, selected):
+    # selected: case names given to --cases ("chart" also picks "chart[...]"), or None for all
+    return not selected or name in selected or name.split("[")[0] in selected
+
+
+def run_scale(num_students, repeat, seed, selected=None, verbose=True):
+    import pygame
+
+    workdir = tempfile.mkdtemp(prefix=f"sms_bench_{num_students}_")
+    old_cwd = os.getcwd()
+    results = {}
+    close = None
+    try:
+        generate_dataset(os.path.join(workdir, "dataset"), num_students, seed)
+        # The app uses paths relative to the working directory
+        os.chdir(workdir)
+        pygame.init()
+        pygame.display.set_mode((800, 600))
+
+        ctx = BenchContext(num_students)
+        close = ctx.close
+        for name, fn in CASES:
+            if not is_selected(name, selected):
+                continue
+            try:
+                results[name] = time_case(fn, ctx, repeat)
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            if verbose:
+                entry = results[name]
+                shown = entry["error"] if "error" in entry else f"{entry['median'] * 1000:.2f} ms"
+                print(f"  {name:<32} {shown}")
+    finally:
+        if close:
+            close()
+        os.chdir(old_cwd)
+        pygame.quit()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def run_benchmarks(scales, repeat=5, seed=42, selected=None, verbose=True):
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+            "cases": sorted(selected) if selected else None,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    for num_students in scales:
+        if verbose:
+            print(f"{num_students} students")
+        report["results"][str(num_students)] = run_scale(num_students, repeat, seed, selected, verbose)
+    return report
+
+
+def compare(current, baseline, threshold=0.2):
+    """Return (rows, regressions) comparing medians of two reports
+
+    A case that errored in the current report, or that the baseline has at
+    a scale the current report ran but it lacks although it was selected
+    (--cases), is a regression with a current median and ratio of None.
+    """
+    rows = []
+    regressions = []
+    selected = current.get("meta", {}).get("cases")
+    for scale, cases in current["results"].items():
+        base_cases = baseline["results"].get(scale, {})
+        missing = [name for name, base in base_cases.items()
+                   if name not in cases and "median" in base and is_selected(name, selected)]
+        for name in list(cases) + missing:
+            entry = cases.get(name, {})
+            base = base_cases.get(name)
+            if "median" not in entry:
+                row = (scale, name, base.get("median") if base else None, None, None)
+                rows.append(row)
+                regressions.append(row)
+                continue
+            if not base or "median" not in base:
+                continue
+            ratio = entry["median"] / base["median"] if base["median"] else float("inf")
+            row = (scale, name, base["median"], entry["median"], ratio)
+            rows.append(row)
+            if ratio > 1 + threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
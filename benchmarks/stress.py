@@ -0,0 +1,230 @@
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+
+# Concurrent multi-session stress test for the dataset files.
+#
+# Starts several writer processes, each an admin session calling the real
+# UserManagement.add_student / delete_student, and reader processes calling
+# the real readers (dataset.read_*, data_store, login validation), all on one
+# generated dataset directory. It then checks that no write was lost or
+# duplicated, that student IDs stayed unique, and that no reader ever hit a
+# partial or malformed line.
+#
+#   python -m benchmarks.stress                           # 4 writers, 4 readers, 1k students
+#   python -m benchmarks.stress --writers 8 --readers 8 --ops 50 --students 10k
+#   python -m benchmarks.stress --service                 # writes and logins through a data service
+#   python -m benchmarks.stress --shards 8                # on the sharded layout (shards.py)
+#
+# Exits with status 1 if any check fails.
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.datagen import generate_dataset, parse_scale, student_username, student_password
+
+SUBJECTS = ["Mathematics", "Science", "English", "History", "Computer Science"]
+ACTIVITIES = ["Chess Club", "Debate Club"]
+DELETE_EVERY = 3  # every third student a writer adds is deleted again
+
+
+def new_student(username):
+    return {
+        "username": username,
+        "password": "pw",
+        "name": "Stress Student",
+        "email": "stress@school.com",
+        "phone": "1234567890",
+        "marks_math": "75",
+        "marks_science": "80",
+        "marks_english": "68",
+        "marks_history": "90",
+        "marks_computer": "88",
+        "eca": ", ".join(ACTIVITIES),
+    }
+
+
+def writer(workdir, number, ops, results):
+    from benchmarks.run import BenchContext
+    from user_management import UserManagement
+
+    os.chdir(workdir)
+    app = BenchContext.make_app(UserManagement, "admin")
+    kept, deleted, failures = [], [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for op in range(ops):
+            username = f"stress{number}_{op}"
+            app.new_student_data = new_student(username)
+            if not app.add_student():
+                failures.append(f"add {username}: {app.error_message}")
+                continue
+            if op % DELETE_EVERY == DELETE_EVERY - 1:
+                if app.delete_student(username):
+                    deleted.append(username)
+                else:
+                    failures.append(f"delete {username}")
+                    kept.append(username)
+            else:
+                kept.append(username)
+    results.put(("writer", number, {"kept": kept, "deleted": deleted, "failures": failures}))
+
+
+def reader(workdir, number, stop, results):
+    from dataset import read_marks, read_eca, read_students
+    from data_store import store
+    from login import LoginUI
+
+    os.chdir(workdir)
+    login = LoginUI.__new__(LoginUI)
+    login.username = student_username(0)
+    login.password = student_password(0)
+    reads, errors = 0, []
+    while not stop.is_set():
+        try:
+            # The readers raise on a line with the wrong number of fields
+            for username, subject, grade in read_marks():
+                int(grade)
+            read_eca()
+            read_students()
+            for username, subject, grade in store.marks():
+                int(grade)
+            store.eca()
+            if not login.validate_credentials():
+                errors.append("login failed")
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        reads += 1
+    results.put(("reader", number, {"reads": reads, "errors": errors[:10], "error_count": len(errors)}))
+
+
+def count_lines(path, prefix_of):
+    # Over every shard of the file, in whichever layout the dataset has
+    import shards
+    counts = {}
+    for file_path in shards.paths(path):
+        with open(file_path) as f:
+            for line in f:
+                key = prefix_of(line)
+                counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def verify(workdir, writers):
+    problems = []
+    dataset = os.path.join(workdir, "dataset")
+    first_field = lambda line: line.split(",", 1)[0]
+    users = count_lines(os.path.join(dataset, "users.txt"), first_field)
+    passwords = count_lines(os.path.join(dataset, "passwords.txt"), first_field)
+    grades = count_lines(os.path.join(dataset, "grades.txt"), first_field)
+    eca = count_lines(os.path.join(dataset, "eca.txt"), first_field)
+
+    for result in writers:
+        problems += result["failures"]
+        for username in result["kept"]:
+            expected = (users.get(username), passwords.get(username), grades.get(username), eca.get(username))
+            if expected != (1, 1, len(SUBJECTS), len(ACTIVITIES)):
+                problems.append(f"{username}: users/passwords/grades/eca lines {expected}")
+        for username in result["deleted"]:
+            left = (users.get(username), passwords.get(username), grades.get(username), eca.get(username))
+            if any(left):
+                problems.append(f"{username} deleted but still has lines {left}")
+
+    from dataset import read_lines
+    ids = [line.split(",")[3] for line in read_lines(os.path.join(dataset, "users.txt")) if line.startswith("stress")]
+    if len(ids) != len(set(ids)):
+        problems.append(f"{len(ids) - len(set(ids))} duplicate student IDs")
+
+    leftovers = [name for _, _, names in os.walk(dataset) for name in names if name.endswith(".tmp")]
+    if leftovers:
+        problems.append(f"temporary files left behind: {leftovers}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent writer/reader stress test on one dataset")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=25, help="Students each writer adds")
+    parser.add_argument("--students", default="1k", help="Size of the generated dataset (1k, 10k, ...)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--service", action="store_true", help="Run a data service and go through it")
+    parser.add_argument("--shards", type=int, default=0, help="Migrate the dataset to N shards first")
+    args = parser.parse_args(argv)
+
+    # Separate interpreters, like separate kiosks
+    context = multiprocessing.get_context("spawn")
+    workdir = tempfile.mkdtemp(prefix="sms_stress_")
+    service = None
+    try:
+        generate_dataset(os.path.join(workdir, "dataset"), parse_scale(args.students), args.seed)
+        if args.shards:
+            import shards
+            dataset = os.path.join(workdir, "dataset")
+            shards.migrate(args.shards, [os.path.join(dataset, name)
+                                         for name in ("users.txt", "passwords.txt", "grades.txt", "eca.txt")])
+        if args.service:
+            # The spawned processes inherit the variable and connect to it
+            path = os.environ["SMS_DATA_SERVICE"] = os.path.join(workdir, "data_service.sock")
+            service = subprocess.Popen([sys.executable, "-m", "data_service", "--root", workdir, "--socket", path],
+                                       env=dict(os.environ, PYTHONPATH=REPO_ROOT), stdout=subprocess.DEVNULL)
+            while not os.path.exists(path):
+                if service.poll() is not None:
+                    print("FAILED: the data service did not start")
+                    return 1
+                time.sleep(0.05)
+        results = context.Queue()
+        stop = context.Event()
+        readers = [context.Process(target=reader, args=(workdir, i, stop, results)) for i in range(args.readers)]
+        writers = [context.Process(target=writer, args=(workdir, i, args.ops, results)) for i in range(args.writers)]
+
+        start = time.perf_counter()
+        for process in readers + writers:
+            process.start()
+        # Collect the writers' results before joining (a full queue blocks exit)
+        collected = [results.get() for _ in writers]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        collected += [results.get() for _ in readers]
+        for process in readers + writers:
+            process.join()
+
+        writer_results = [r for kind, _, r in collected if kind == "writer"]
+        reader_results = [r for kind, _, r in collected if kind == "reader"]
+        problems = verify(workdir, writer_results)
+        for result in reader_results:
+            problems += [f"reader: {error}" for error in result["errors"]]
+
+        writes = sum(len(r["kept"]) + 2 * len(r["deleted"]) for r in writer_results)
+        reads = sum(r["reads"] for r in reader_results)
+        print(f"{args.writers} writers, {args.readers} readers, {parse_scale(args.students)} students"
+              + (" through a data service" if service else "") + (f", {args.shards} shards" if args.shards else ""))
+        print(f"  {writes} writes in {elapsed:.2f}s ({writes / elapsed:.1f}/s), {reads} reader passes")
+        if problems:
+            print(f"FAILED: {len(problems)} problem(s)")
+            for problem in problems[:20]:
+                print(f"  {problem}")
+            return 1
+        print("OK: no lost or duplicated writes, unique IDs, no partial reads")
+        return 0
+    finally:
+        if service:
+            service.terminate()
+            service.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
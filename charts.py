@@ -0,0 +1,577 @@
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.artist import setp
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+from matplotlib.transforms import Bbox
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from aggregates import summarize_student_avgs, eca_summary
+from grade_matrix import GradeMatrix
+
+# Matplotlib chart builders shared by the pygame dashboard and the headless
+# report generator. Figures are created with matplotlib.figure.Figure rather
+# than pyplot so nothing is kept alive in pyplot's global figure list.
+
+# Chart colors (matching COLORS in user_management.py)
+CHART_COLORS = {
+    'primary': '#2980b9',
+    'secondary': '#2ecc71',
+    'accent': '#9b59b6',
+    'warning': '#e74c3c',
+    'background': '#f0f8ff',
+    'text': '#2f4f4f',
+    'button': '#ffb6c1',
+    'success': '#3cb371',
+}
+
+MARKS_CHARTS = ['student_avg', 'subject_perf', 'grade_dist', 'subject_dist', 'heatmap', 'correlation']
+
+
+def new_figure(figsize, dpi):
+    fig = Figure(figsize=figsize, dpi=dpi)
+    fig.patch.set_facecolor(CHART_COLORS['background'])
+    return fig
+
+
+def style_axes(ax, title, xlabel=None, ylabel=None, rotate=False, title_size=16):
+    ax.set_title(title, pad=20, color=CHART_COLORS['text'], fontsize=title_size)
+    if xlabel:
+        ax.set_xlabel(xlabel, color=CHART_COLORS['text'], fontsize=14)
+    if ylabel:
+        ax.set_ylabel(ylabel, color=CHART_COLORS['text'], fontsize=14)
+    if rotate:
+        setp(ax.get_xticklabels(), rotation=45, ha='right')
+
+
+def draw_marks_chart(ax, kind, matrix):
+    # matrix is a grade_matrix.GradeMatrix
+    if kind == 'student_avg':
+        # One bar per student, or a fixed-size summary for large rosters
+        draw_student_avg(ax, summarize_student_avgs(matrix.student_averages()))
+
+    elif kind == 'subject_perf':
+        # Line chart for subject performance
+        subject_avgs = matrix.subject_averages()
+        values = list(subject_avgs.values())
+        ax.plot(list(subject_avgs.keys()), values, marker='o', color=CHART_COLORS['secondary'], linewidth=2)
+        style_axes(ax, 'Subject-wise Performance', 'Subject', 'Average Grade', rotate=True)
+
+        # Add value labels on points
+        for i, value in enumerate(values):
+            ax.text(i, value, f'{value:.1f}', ha='center', va='bottom')
+
+    elif kind == 'grade_dist':
+        # Pie chart for grade distribution
+        grade_ranges = matrix.grade_distribution()
+        colors = [CHART_COLORS['success'], CHART_COLORS['primary'], CHART_COLORS['button'],
+                  CHART_COLORS['accent'], CHART_COLORS['warning']]
+        ax.pie(list(grade_ranges.values()), labels=list(grade_ranges.keys()), autopct='%1.1f%%',
+               colors=colors, startangle=90)
+        style_axes(ax, 'Grade Distribution')
+
+    elif kind == 'subject_dist':
+        draw_subject_dist(ax, matrix.subjects, matrix.subject_box_stats)
+
+    elif kind in HEATMAPS:
+        draw_heatmap(ax, *heatmap_data(kind, matrix), **HEATMAPS[kind])
+
+    else:
+        raise ValueError(f"Unknown marks chart: {kind}")
+
+
+def draw_subject_dist(ax, subjects, stats):
+    # Box plot for grade distribution by subject, drawn from precomputed
+    # statistics (aggregates.box_stats) rather than every grade
+    box = ax.bxp(stats, patch_artist=True)
+    ax.set_xticks(range(1, len(subjects) + 1), list(subjects))
+
+    # Customize box plot colors
+    for patch in box['boxes']:
+        patch.set_facecolor(CHART_COLORS['primary'])
+    style_axes(ax, 'Grade Distribution by Subject', 'Subject', 'Grade', rotate=True)
+    return box
+
+
+# Heatmap views of the grade matrix: styling per view, data from heatmap_data()
+HEATMAPS = {
+    'heatmap': {'title': 'Grades by Student and Subject', 'cmap': 'RdYlGn', 'vmin': 0, 'vmax': 100},
+    'correlation': {'title': 'Subject Correlation', 'cmap': 'coolwarm', 'vmin': -1, 'vmax': 1, 'fmt': '{:.2f}'},
+    'club_overlap': {'title': 'Club Overlap (students in both)', 'cmap': 'Blues'},
+}
+ANNOTATE_CELLS = 150  # value labels only up to this many cells
+
+
+def heatmap_data(kind, matrix):
+    # (row labels, column labels, values) for a grade matrix heatmap
+    if kind == 'heatmap':
+        rows, values = matrix.band_means()
+        return rows, matrix.subjects, values
+    elif kind == 'correlation':
+        return matrix.subjects, matrix.subjects, matrix.correlation
+    raise ValueError(f"Unknown heatmap: {kind}")
+
+
+def draw_heatmap(ax, rows, columns, values, title, cmap='Blues', vmin=None, vmax=None, fmt='{:.0f}'):
+    values = np.asarray(values, dtype=float)
+    image = ax.imshow(values, cmap=cmap, vmin=vmin, vmax=vmax, aspect='auto')
+    ax.set_xticks(range(len(columns)), list(columns))
+    # Every row label when they fit, otherwise about 10
+    step = max(1, len(rows) // 10) if len(rows) > 20 else 1
+    ax.set_yticks(range(0, len(rows), step), list(rows)[::step])
+    style_axes(ax, title, rotate=True)
+    cells = []
+    if values.size <= ANNOTATE_CELLS:
+        cells = [ax.text(j, i, '', ha='center', va='center', fontsize=10)
+                 for i in range(values.shape[0]) for j in range(values.shape[1])]
+        label_cells(image, cells, values, fmt)
+    return image, cells
+
+
+def label_cells(image, cells, values, fmt):
+    # Cell values, in white on dark cells and dark text on light ones
+    for cell, value in zip(cells, np.asarray(values, dtype=float).ravel()):
+        if np.isnan(value):
+            cell.set_text('')
+            continue
+        red, green, blue, _ = image.cmap(image.norm(value))
+        cell.set_text(fmt.format(value))
+        cell.set_color('white' if 0.299 * red + 0.587 * green + 0.114 * blue < 0.5 else CHART_COLORS['text'])
+
+
+def value_label(summary, value):
+    return f'{value:.0f}' if summary['view'] == 'histogram' else f'{value:.1f}'
+
+
+def draw_student_avg(ax, summary):
+    # Bar chart for a summarize_student_avgs() result
+    bars = ax.bar(summary['labels'], summary['values'], color=CHART_COLORS['primary'])
+    style_axes(ax, summary['title'], summary['xlabel'], summary['ylabel'], rotate=True)
+
+    # Add value labels on top of bars
+    labels = [
+        ax.text(bar.get_x() + bar.get_width() / 2., bar.get_height(), value_label(summary, bar.get_height()),
+                ha='center', va='bottom')
+        for bar in bars
+    ]
+    return bars, labels
+
+
+def marks_figure(kind, marks, figsize=(12, 8), dpi=150):
+    # marks: the grades rows, or a GradeMatrix already built from them
+    fig = new_figure(figsize, dpi)
+    matrix = marks if isinstance(marks, GradeMatrix) else GradeMatrix(marks)
+    ax = fig.add_subplot(111)
+    draw_marks_chart(ax, kind, matrix)
+    fig.tight_layout()
+    return fig
+
+
+ECA_TITLES = {
+    'activity': 'ECA Activity Distribution',
+    'category': 'ECA Category Distribution',
+}
+
+
+def draw_eca_chart(ax, counts, label_size=12, title_size=20, title=ECA_TITLES['activity']):
+    colors = colormaps['Pastel1'](np.linspace(0, 1, len(counts)))
+    ax.pie(list(counts.values()), labels=list(counts.keys()), autopct='%1.1f%%',
+           colors=colors, startangle=90, textprops={'fontsize': label_size})
+    style_axes(ax, title, title_size=title_size)
+
+
+def eca_figure(activities, figsize=(16, 10), dpi=150, by='activity'):
+    fig = new_figure(figsize, dpi)
+    ax = fig.add_subplot(111)
+    fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
+    # Top activities (or categories) plus "Other", so any number of clubs stays readable
+    draw_eca_chart(ax, eca_summary(activities, by), title=ECA_TITLES[by])
+    fig.tight_layout()
+    return fig
+
+
+def student_report_figure(username, name, student_marks, class_averages, activities,
+                          figsize=(8.27, 11.69), dpi=100):
+    # One A4 report card: the student's marks against the class average per
+    # subject, their overall average and their activities
+    fig = new_figure(figsize, dpi)
+    fig.suptitle(f"Report Card - {name} ({username})", fontsize=18, color=CHART_COLORS['text'])
+
+    ax = fig.add_axes([0.12, 0.45, 0.8, 0.42])
+    subjects = [subject for subject, _ in student_marks]
+    grades = [float(grade) for _, grade in student_marks]
+    x = np.arange(len(subjects))
+    ax.bar(x - 0.2, grades, 0.4, label='Student', color=CHART_COLORS['primary'])
+    ax.bar(x + 0.2, [class_averages.get(s, 0) for s in subjects], 0.4, label='Class average',
+           color=CHART_COLORS['button'])
+    ax.set_xticks(x, subjects)
+    # Headroom above 100 keeps the legend clear of the bars
+    ax.set_ylim(0, 115)
+    ax.set_yticks(range(0, 101, 20))
+    ax.legend(loc='upper right', ncol=2)
+    style_axes(ax, 'Marks by Subject', ylabel='Grade', rotate=True)
+
+    overall = sum(grades) / len(grades) if grades else 0
+    lines = [f"Overall average: {overall:.1f}" if grades else "No marks recorded"]
+    lines.append("Activities: " + (", ".join(activities) if activities else "none"))
+    fig.text(0.12, 0.28, "\n\n".join(lines), fontsize=13, color=CHART_COLORS['text'], va='top')
+    return fig
+
+
+class LiveChart:
+    """A chart that keeps its Figure, Axes and artists between updates.
+
+    Subclasses give prepare(data) -> (key, values), build(key, values) ->
+    the data artists, and update(values) -> what it changed (artists, or
+    display-space Bboxes of areas).
+
+    set_data() updates the existing artists in place when the categories are
+    unchanged and only rebuilds the axes when they are not. The axis limits
+    stay put while the values fit in them (y_range()). render() redraws the
+    Agg buffer: with blit=True the static parts (axes, ticks, titles) are
+    cached, and after an update only the area that changed is restored from
+    that cache and the data artists overlapping it are drawn again, clipped
+    to it.
+    """
+
+    def __init__(self, figsize, dpi, blit=True):
+        self.fig = new_figure(figsize, dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        self.blit = blit
+        self.key = None
+        self.values = None
+        self.dynamic = []
+        self.extents = None     # data artist -> its window extent when last drawn
+        self.changed = []       # what update() changed since the last render
+        self.background = None
+        self.full_draw = True
+        self.dirty = True
+
+    def y_range(self, values):
+        # (low, high) of the drawn values when the y axis follows them; None
+        # for charts with fixed axes (pies, heatmaps)
+        return None
+
+    def set_data(self, data):
+        key, values = self.prepare(data)
+        if key == self.key and values == self.values:
+            return False
+
+        if key != self.key:
+            self.ax.clear()
+            self.dynamic = self.build(key, values)
+            self.fig.tight_layout()
+            self.full_draw = True
+        else:
+            self.changed.extend(self.update(values))
+            y_range = self.y_range(values)
+            low, high = self.ax.get_ylim()
+            if y_range is not None and not low <= y_range[0] <= y_range[1] <= high:
+                # The values left the view: rescale, which invalidates the
+                # cached background
+                self.ax.relim()
+                self.ax.autoscale_view()
+                self.full_draw = True
+
+        for artist in self.dynamic:
+            artist.set_animated(self.blit)
+        self.key = key
+        self.values = values
+        self.dirty = True
+        return True
+
+    def render(self):
+        if not self.dirty:
+            return
+        if not self.blit:
+            self.canvas.draw()
+        elif self.full_draw or self.background is None:
+            # Animated artists are skipped here, leaving a clean background
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self.draw_dynamic()
+            self.extents = None
+        elif set(self.dynamic) <= set(self.changed):
+            # Everything moved (pies): no area is left to keep
+            self.canvas.restore_region(self.background)
+            self.draw_dynamic()
+            self.extents = None
+        elif self.extents is None:
+            # Where the artists were is not known yet; from now on it is
+            self.canvas.restore_region(self.background)
+            self.draw_dynamic()
+            renderer = self.canvas.get_renderer()
+            self.extents = {artist: artist.get_window_extent(renderer).frozen() for artist in self.dynamic}
+        else:
+            self.redraw()
+        self.changed = []
+        self.full_draw = False
+        self.dirty = False
+
+    def draw_dynamic(self):
+        for artist in self.dynamic:
+            self.ax.draw_artist(artist)
+
+    def redraw(self):
+        # Restores the cached background under everything that changed (where
+        # the artists were and where they are now) and draws the data
+        # artists there again
+        renderer = self.canvas.get_renderer()
+        boxes = []
+        for item in self.changed:
+            if isinstance(item, Bbox):
+                boxes.append(item)
+            else:
+                boxes.append(self.extents[item])
+                self.extents[item] = item.get_window_extent(renderer).frozen()
+                boxes.append(self.extents[item])
+        if not boxes:
+            return
+        # Whole pixels, with room for antialiased edges
+        x0, y0, x1, y1 = Bbox.union(boxes).padded(2).extents
+        width, height = self.canvas.get_width_height()
+        x0, y0 = max(int(np.floor(x0)), 0), max(int(np.floor(y0)), 0)
+        x1, y1 = min(int(np.ceil(x1)), width), min(int(np.ceil(y1)), height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = Bbox.from_extents(x0, y0, x1, y1)
+        # The background is in Agg's top-down pixel rows, bounds inclusive
+        self.canvas.restore_region(self.background, bbox=(x0, height - y1, x1 - 1, height - y0 - 1), xy=(0, 0))
+        for artist in self.dynamic:
+            if not self.extents[artist].overlaps(region):
+                continue
+            clip_box, clip_on = artist.get_clip_box(), artist.get_clip_on()
+            box = Bbox.intersection(clip_box, region) if clip_on and clip_box is not None else region
+            if box is None:
+                continue
+            artist.set_clip_box(box)
+            artist.set_clip_on(True)
+            self.ax.draw_artist(artist)
+            artist.set_clip_box(clip_box)
+            artist.set_clip_on(clip_on)
+
+    def index_at(self, pos):
+        # Category index under a pixel position on the rendered chart (top-left
+        # origin, as in pygame), or None outside the axes
+        width, height = self.canvas.get_width_height()
+        x, y = pos[0], height - pos[1]
+        if not self.ax.bbox.contains(x, y):
+            return None
+        return int(round(self.ax.transData.inverted().transform((x, y))[0]))
+
+
+class StudentAvgChart(LiveChart):
+    # Takes a summarize_student_avgs() result rather than the grouped marks
+    def prepare(self, summary):
+        self.summary = summary
+        return (summary['view'], tuple(summary['labels'])), tuple(summary['values'])
+
+    def build(self, key, values):
+        self.bars, self.labels = draw_student_avg(self.ax, self.summary)
+        return list(self.bars) + self.labels
+
+    def y_range(self, values):
+        return min(0, min(values, default=0)), max(values, default=0)
+
+    def update(self, values):
+        changed = []
+        for bar, label, old, value in zip(self.bars, self.labels, self.values, values):
+            if value != old:
+                bar.set_height(value)
+                label.set_y(value)
+                label.set_text(value_label(self.summary, value))
+                changed += [bar, label]
+        return changed
+
+
+# The marks charts take a GradeMatrix (student_avg: its summary, see above)
+
+class SubjectPerfChart(LiveChart):
+    def prepare(self, matrix):
+        subject_avgs = matrix.subject_averages()
+        return tuple(subject_avgs), tuple(subject_avgs.values())
+
+    def build(self, subjects, values):
+        self.line, = self.ax.plot(list(subjects), list(values), marker='o',
+                                  color=CHART_COLORS['secondary'], linewidth=2)
+        style_axes(self.ax, 'Subject-wise Performance', 'Subject', 'Average Grade', rotate=True)
+        self.labels = [self.ax.text(i, value, f'{value:.1f}', ha='center', va='bottom')
+                       for i, value in enumerate(values)]
+        return [self.line] + self.labels
+
+    def y_range(self, values):
+        return min(values, default=0), max(values, default=0)
+
+    def update(self, values):
+        self.line.set_ydata(list(values))
+        changed = [self.line]
+        for i, (label, old, value) in enumerate(zip(self.labels, self.values, values)):
+            if value != old:
+                label.set_position((i, value))
+                label.set_text(f'{value:.1f}')
+                changed.append(label)
+        return changed
+
+
+class PieChart(LiveChart):
+    startangle = 90
+
+    def build_pie(self, labels, values, colors, textprops=None):
+        self.wedges, self.texts, self.autotexts = self.ax.pie(
+            list(values), labels=list(labels), autopct='%1.1f%%', colors=colors,
+            startangle=self.startangle, textprops=textprops)
+        return list(self.wedges) + list(self.texts) + list(self.autotexts)
+
+    def update(self, values):
+        # Same geometry as Axes.pie: wedges from startangle counter-clockwise,
+        # labels at 1.1 radius, percentages at 0.6
+        total = float(sum(values)) or 1.0
+        theta1 = self.startangle
+        for wedge, text, autotext, value in zip(self.wedges, self.texts, self.autotexts, values):
+            theta2 = theta1 + 360.0 * value / total
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            middle = np.deg2rad((theta1 + theta2) / 2)
+            x, y = np.cos(middle), np.sin(middle)
+            text.set_position((1.1 * x, 1.1 * y))
+            text.set_horizontalalignment('left' if x > 0 else 'right')
+            autotext.set_position((0.6 * x, 0.6 * y))
+            autotext.set_text(f'{100.0 * value / total:1.1f}%')
+            theta1 = theta2
+        # Every wedge moves when one value does
+        return self.dynamic
+
+
+class GradeDistChart(PieChart):
+    def prepare(self, matrix):
+        grade_ranges = matrix.grade_distribution()
+        return tuple(grade_ranges), tuple(grade_ranges.values())
+
+    def build(self, bands, values):
+        colors = [CHART_COLORS['success'], CHART_COLORS['primary'], CHART_COLORS['button'],
+                  CHART_COLORS['accent'], CHART_COLORS['warning']]
+        artists = self.build_pie(bands, values, colors)
+        style_axes(self.ax, 'Grade Distribution')
+        return artists
+
+
+class SubjectDistChart(LiveChart):
+    def prepare(self, matrix):
+        self.stats = matrix.subject_box_stats
+        return tuple(matrix.subjects), tuple(
+            (st['q1'], st['med'], st['q3'], st['whislo'], st['whishi'], tuple(st['fliers'])) for st in self.stats)
+
+    def build(self, subjects, values):
+        self.box = draw_subject_dist(self.ax, subjects, self.stats)
+        return [artist for key in ('boxes', 'whiskers', 'caps', 'medians', 'fliers')
+                for artist in self.box[key]]
+
+    def y_range(self, values):
+        ends = [end for q1, med, q3, low, high, fliers in values for end in (low, high) + fliers]
+        return min(ends, default=0), max(ends, default=0)
+
+    def update(self, values):
+        # Move the existing box, whisker, cap, median and flier artists to the
+        # new statistics instead of building a new boxplot
+        changed = []
+        for i, (stats, old, value) in enumerate(zip(self.stats, self.values, values)):
+            if value == old:
+                continue
+            changed += [self.box['boxes'][i], self.box['medians'][i], self.box['fliers'][i],
+                        *self.box['whiskers'][2 * i:2 * i + 2], *self.box['caps'][2 * i:2 * i + 2]]
+            x = i + 1
+            box = self.box['boxes'][i]
+            left, right = box.get_path().vertices[:, 0].min(), box.get_path().vertices[:, 0].max()
+            q1, q3 = stats['q1'], stats['q3']
+            box.set_path(Path([(left, q1), (right, q1), (right, q3), (left, q3), (left, q1)], closed=True))
+            self.box['whiskers'][2 * i].set_ydata([q1, stats['whislo']])
+            self.box['whiskers'][2 * i + 1].set_ydata([q3, stats['whishi']])
+            self.box['caps'][2 * i].set_ydata([stats['whislo']] * 2)
+            self.box['caps'][2 * i + 1].set_ydata([stats['whishi']] * 2)
+            self.box['medians'][i].set_ydata([stats['med']] * 2)
+            fliers = stats['fliers']
+            self.box['fliers'][i].set_data([x] * len(fliers), fliers)
+        return changed
+
+
+class EcaChart(PieChart):
+    # Takes an eca_summary() result; set title before set_data() when the
+    # grouping changes
+    title = ECA_TITLES['activity']
+
+    def prepare(self, counts):
+        return (self.title,) + tuple(counts), tuple(counts.values())
+
+    def build(self, key, values):
+        activities = key[1:]
+        colors = colormaps['Pastel1'](np.linspace(0, 1, len(activities)))
+        artists = self.build_pie(activities, values, colors, textprops={'fontsize': 12})
+        style_axes(self.ax, self.title, title_size=20)
+        return artists
+
+
+class HeatmapChart(LiveChart):
+    # Takes (row labels, column labels, values); styled by HEATMAPS[kind]
+    kind = None
+
+    def prepare(self, data):
+        rows, columns, values = data
+        values = np.asarray(values, dtype=float)
+        # NaN != NaN, so compare with NaN replaced; the raw values are drawn
+        self.raw = values
+        return (tuple(rows), tuple(columns)), tuple(map(tuple, np.nan_to_num(values, nan=-np.inf).tolist()))
+
+    def build(self, key, values):
+        style = dict(HEATMAPS[self.kind])
+        self.fmt = style.get('fmt', '{:.0f}')
+        self.image, self.cells = draw_heatmap(self.ax, key[0], key[1], self.raw, **style)
+        return [self.image] + self.cells
+
+    def update(self, values):
+        scale = (self.image.norm.vmin, self.image.norm.vmax)
+        self.image.set_data(self.raw)
+        if HEATMAPS[self.kind].get('vmin') is None:
+            self.image.autoscale()
+        label_cells(self.image, self.cells, self.raw, self.fmt)
+        if (self.image.norm.vmin, self.image.norm.vmax) != scale:
+            return self.dynamic     # every cell's color moved
+        # Just the cells whose value changed
+        changed = []
+        for i, j in np.argwhere(np.array(self.values) != np.array(values)):
+            corners = self.ax.transData.transform([(j - 0.5, i - 0.5), (j + 0.5, i + 0.5)])
+            changed.append(Bbox([corners.min(axis=0), corners.max(axis=0)]))
+            if self.cells:
+                changed.append(self.cells[i * len(values[0]) + j])
+        return changed
+
+
+class GradeHeatmapChart(HeatmapChart):
+    kind = 'heatmap'
+
+    def prepare(self, matrix):
+        return super().prepare(heatmap_data(self.kind, matrix))
+
+
+class CorrelationChart(GradeHeatmapChart):
+    kind = 'correlation'
+
+
+class ClubOverlapChart(HeatmapChart):
+    # Takes (activities, overlap matrix) from EcaIndex.overlap_matrix()
+    kind = 'club_overlap'
+
+    def prepare(self, data):
+        activities, matrix = data
+        return super().prepare((activities, activities, matrix))
+
+
+LIVE_CHARTS = {
+    'student_avg': StudentAvgChart,
+    'subject_perf': SubjectPerfChart,
+    'grade_dist': GradeDistChart,
+    'subject_dist': SubjectDistChart,
+    'heatmap': GradeHeatmapChart,
+    'correlation': CorrelationChart,
+    'eca': EcaChart,
+    'club_overlap': ClubOverlapChart,
+}
@@ -0,0 +1,371 @@
+import os
+import sys
+import time
+import heapq
+import shutil
+import argparse
+import tempfile
+import itertools
+from contextlib import ExitStack
+from dataset import USERS_FILE, PASSWORDS_FILE, GRADES_FILE, ECA_FILE
+from dataset_io import writing, append_lines, replace_lines
+import shards
+
+# Cross-file consistency check and repair of users.txt, passwords.txt,
+# grades.txt and eca.txt.
+#
+#   python -m consistency                           # report
+#   python -m consistency --report problems.csv     # ... and list every problem
+#   python -m consistency --repair                  # fix what can be fixed
+#
+# Each file is sorted by username with an external merge sort: RUN_LINES
+# lines at a time are sorted in memory and written to a run file, and the
+# runs are merged FAN_IN at a time until one pass can merge them all. The
+# four sorted streams are then merge-joined in a single pass, one username
+# (all its case variants together) at a time. Memory stays within a few
+# times RUN_LINES lines whatever the size of the files, and the I/O is a
+# few sequential passes over them.
+#
+# Found per username:
+#   missing-password    a user with no passwords.txt line (login fails)
+#   password-mismatch   users.txt and passwords.txt disagree (login uses passwords.txt)
+#   duplicate-user      a username with more than one users.txt line
+#   duplicate-password  more than one passwords.txt line
+#   orphan-password     passwords, grades and ECA lines of no user
+#   orphan-grade
+#   orphan-eca
+#   case-duplicate      usernames differing only in case, e.g. john / John (noted when they share an ID)
+#   malformed           a line with the wrong number of fields
+#
+# and, from a second external sort of users.txt by its ID field:
+#   duplicate-id        different usernames with the same student ID
+#
+# --repair keeps who can log in unchanged where it can: a missing password
+# line is added from users.txt, a mismatched users.txt password is set to
+# the passwords.txt one, extra duplicate lines are dropped (the first one
+# in the file stays), and orphan lines are dropped. Case duplicates,
+# duplicate IDs and malformed lines need a person to decide and are only
+# reported. Repairs
+# are collected as (line, change) records, sorted by line the same way,
+# and each file is rewritten in one streaming pass keeping its order.
+#
+# The check reads the files without locks; an add or delete made while it
+# runs can show up as a problem that is gone on the next run. --repair
+# holds every file's writer lock from the first read to the last write, so
+# sessions trying to write meanwhile wait and then report the files busy.
+
+RUN_LINES = 200000   # lines sorted in memory per run
+FAN_IN = 64          # runs merged at once
+EXAMPLES = 5         # usernames printed per kind of problem
+
+# add_student stores this in users.txt instead of the password; only
+# passwords.txt holds a student's real password then
+PLACEHOLDER_PASSWORD = 'password'
+
+# (name, file, fields per line)
+SOURCES = [('users', USERS_FILE, 7), ('passwords', PASSWORDS_FILE, 2), ('grades', GRADES_FILE, 3), ('eca', ECA_FILE, 2)]
+
+
+# -- external sort -----------------------------------------------------------
+# Records are text lines ending in '\n' that sort as plain strings.
+
+def write_run(records, workdir):
+    fd, path = tempfile.mkstemp(suffix='.run', dir=workdir)
+    with os.fdopen(fd, 'w') as file:
+        file.writelines(records)
+    return path
+
+
+def merge_runs(paths):
+    # The records of sorted run files, in order; the files are removed once
+    # read to the end
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(path)) for path in paths]
+        yield from heapq.merge(*files)
+    for path in paths:
+        os.remove(path)
+
+
+def external_sort(records, workdir, run_lines=RUN_LINES):
+    # records in sorted order, holding at most run_lines of them in memory
+    runs = []
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= run_lines:
+            batch.sort()
+            runs.append(write_run(batch, workdir))
+            batch = []
+    if not runs:
+        batch.sort()
+        yield from batch
+        return
+    if batch:
+        batch.sort()
+        runs.append(write_run(batch, workdir))
+    del batch
+    while len(runs) > FAN_IN:
+        runs = [write_run(merge_runs(runs[i:i + FAN_IN]), workdir) for i in range(0, len(runs), FAN_IN)]
+    yield from merge_runs(runs)
+
+
+# -- join --------------------------------------------------------------------
+
+def position(shard, number):
+    # Where a line is: its shard of the file and its line number there,
+    # as a string that sorts in file order
+    return f"{shard:04d}.{number:012d}"
+
+
+def line_name(where):
+    # "line 12" / "shard 3 line 12" for a position, as people count lines
+    shard, number = int(where[:4]), int(where[5:])
+    return f"line {number + 1}" if shard == 0 else f"shard {shard} line {number + 1}"
+
+
+def keyed_lines(path):
+    # One record per non-blank line of every shard of `path`:
+    # "<casefolded username>\t<username>\t<position>\t<line>"
+    for shard, file_path in enumerate(shards.paths(path)):
+        try:
+            file = open(file_path)
+        except FileNotFoundError:
+            continue
+        with file:
+            for number, line in enumerate(file):
+                if not line.strip():
+                    continue
+                if not line.endswith('\n'):
+                    line += '\n'
+                username = line.split(',', 1)[0].strip()
+                yield f"{username.casefold()}\t{username}\t{position(shard, number)}\t{line}"
+
+
+def tagged(records, source):
+    for record in records:
+        yield record, source
+
+
+def groups(workdir, run_lines):
+    # Per case-folded username, in sorted order: {source: [(username,
+    # position, fields), ...]} with each source's lines in file order
+    streams = [tagged(external_sort(keyed_lines(path), workdir, run_lines), name) for name, path, _ in SOURCES]
+    joined = heapq.merge(*streams)
+    for _, group in itertools.groupby(joined, key=lambda item: item[0].split('\t', 1)[0]):
+        rows = {name: [] for name, _, _ in SOURCES}
+        for record, source in group:
+            _, username, where, line = record.split('\t', 3)
+            rows[source].append((username, where, line.strip().split(',')))
+        yield rows
+
+
+class Checker:
+    def __init__(self, workdir, report=None, repair=False):
+        self.workdir = workdir
+        self.report = report        # open CSV file for every problem, or None
+        self.repair = repair
+        self.lines = {name: 0 for name, _, _ in SOURCES}
+        self.counts = {}            # kind -> problems found
+        self.examples = {}          # kind -> first usernames
+        self.unrepaired = {}        # kind -> problems left for a person
+        # Repairs: per source, "<position>\t<new line or empty to drop>\n"
+        # records, and passwords.txt lines to append
+        self.changes = {}
+        self.added = None
+        self.repairs = 0            # lines to drop, change or add
+
+    def problem(self, kind, username, detail='', fixed=True):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        examples = self.examples.setdefault(kind, [])
+        if len(examples) < EXAMPLES:
+            examples.append(username)
+        if not (self.repair and fixed):
+            self.unrepaired[kind] = self.unrepaired.get(kind, 0) + 1
+        if self.report is not None:
+            self.report.write(f"{kind},{username},{detail}\n")
+
+    def change(self, source, where, line=''):
+        if self.repair:
+            if source not in self.changes:
+                self.changes[source] = open(os.path.join(self.workdir, f"{source}.changes"), 'w+')
+            self.changes[source].write(f"{where}\t{line}\n")
+            self.repairs += 1
+
+    def add_password(self, username, password):
+        if self.repair:
+            if self.added is None:
+                self.added = open(os.path.join(self.workdir, 'passwords.added'), 'w+')
+            self.added.write(f"{username},{password}\n")
+            self.repairs += 1
+
+    def check(self, rows):
+        for name, _, _ in SOURCES:
+            self.lines[name] += len(rows[name])
+        # Well-formed lines by exact username; the rest are reported
+        users, passwords, others = {}, {}, {'grades': {}, 'eca': {}}
+        for name, _, fields in SOURCES:
+            for username, where, parts in rows[name]:
+                if len(parts) != fields:
+                    self.problem('malformed', username, f"{name} line with {len(parts)} fields", fixed=False)
+                    continue
+                target = users if name == 'users' else passwords if name == 'passwords' else others[name]
+                target.setdefault(username, []).append((where, parts))
+
+        if len(users) > 1:
+            ids = {}
+            for username, lines in users.items():
+                ids.setdefault(lines[0][1][3], []).append(username)
+            shared = [f"{'/'.join(names)} share {user_id}" for user_id, names in ids.items() if len(names) > 1]
+            self.problem('case-duplicate', '/'.join(users), '; '.join(shared) or "different IDs", fixed=False)
+
+        for username, lines in users.items():
+            for where, _ in lines[1:]:
+                self.problem('duplicate-user', username, f"extra users.txt {line_name(where)}")
+                self.change('users', where)
+            where, user = lines[0]
+            stored = passwords.pop(username, [])
+            if not stored:
+                if user[1] == PLACEHOLDER_PASSWORD:
+                    self.problem('missing-password', username, "users.txt has no password either", fixed=False)
+                elif len(users) > 1:
+                    # Which of the case duplicates should log in is for a person to say
+                    self.problem('missing-password', username, "a case duplicate", fixed=False)
+                else:
+                    self.problem('missing-password', username)
+                    self.add_password(username, user[1])
+                continue
+            for extra, _ in stored[1:]:
+                self.problem('duplicate-password', username, f"extra passwords.txt {line_name(extra)}")
+                self.change('passwords', extra)
+            password = stored[0][1][1]
+            if user[1] != password and user[1] != PLACEHOLDER_PASSWORD:
+                self.problem('password-mismatch', username)
+                self.change('users', where, ','.join(user[:1] + [password] + user[2:]))
+
+        # Whatever is left belongs to no user
+        for kind, source, lines_by_user in [('orphan-password', 'passwords', passwords),
+                                            ('orphan-grade', 'grades', others['grades']),
+                                            ('orphan-eca', 'eca', others['eca'])]:
+            for username, lines in lines_by_user.items():
+                if username in users:
+                    continue
+                similar = [name for name in users if name != username]
+                detail = f"{len(lines)} lines" + (f"; users.txt has {'/'.join(similar)}" if similar else "")
+                self.problem(kind, username, detail)
+                for where, _ in lines:
+                    self.change(source, where)
+
+    def check_ids(self, run_lines=RUN_LINES):
+        # Usernames sharing an ID; which one keeps it is for a person to say
+        records = (f"{parts[3]}\t{where}\t{parts[0]}\n"
+                   for record in keyed_lines(USERS_FILE)
+                   for _, _, where, line in [record.split('\t', 3)]
+                   for parts in [line.strip().split(',')] if len(parts) == 7)
+        sorted_ids = external_sort(records, self.workdir, run_lines)
+        for user_id, group in itertools.groupby(sorted_ids, key=lambda record: record.split('\t', 1)[0]):
+            usernames = []
+            for record in group:
+                username = record.rstrip('\n').split('\t', 2)[2]
+                if username not in usernames:
+                    usernames.append(username)
+            if len(usernames) > 1:
+                self.problem('duplicate-id', '/'.join(usernames), f"share {user_id}", fixed=False)
+
+    def run(self, run_lines=RUN_LINES):
+        for rows in groups(self.workdir, run_lines):
+            self.check(rows)
+        self.check_ids(run_lines)
+
+    def apply(self, run_lines=RUN_LINES):
+        # Writes the collected repairs
+        for name, path, _ in SOURCES:
+            changes = self.changes.get(name)
+            if changes is None:
+                continue
+            changes.seek(0)
+            records = external_sort(changes, self.workdir, run_lines)
+            for shard, shard_changes in itertools.groupby(records, key=lambda record: int(record[:4])):
+                shard_path = shards.paths(path)[shard]
+                edits = ((int(record[5:17]), record[18:]) for record in shard_changes)
+                with open(shard_path) as file:
+                    replace_lines(shard_path, edited(file, edits))
+        if self.added is not None:
+            # Appended RUN_LINES lines at a time, one write per shard
+            self.added.seek(0)
+            shard_of = lambda line: shards.path_for(PASSWORDS_FILE, line.split(',', 1)[0])
+            while True:
+                batch = list(itertools.islice(self.added, run_lines))
+                if not batch:
+                    break
+                for shard_path, lines in itertools.groupby(sorted(batch, key=shard_of), key=shard_of):
+                    append_lines(shard_path, list(lines))
+
+    def close(self):
+        for file in list(self.changes.values()) + [self.added]:
+            if file is not None:
+                file.close()
+
+
+def edited(file, edits):
+    # The file's lines with the (line number, new line or '\n' to drop)
+    # edits applied; edits come in line order
+    edit = next(edits, None)
+    for number, line in enumerate(file):
+        if edit is not None and edit[0] == number:
+            if edit[1] != '\n':
+                yield edit[1]
+            edit = next(edits, None)
+        else:
+            yield line
+
+
+def check(repair=False, report=None, run_lines=RUN_LINES, temp_dir=None):
+    # Runs the check (and the repairs); returns the Checker with its counts
+    workdir = tempfile.mkdtemp(prefix='sms_consistency_', dir=temp_dir)
+    checker = Checker(workdir, report, repair)
+    try:
+        with ExitStack() as stack:
+            if repair:
+                for _, path, _ in SOURCES:
+                    for lock_path in [path] + shards.paths(path):
+                        stack.enter_context(writing(lock_path))
+            checker.run(run_lines)
+            if repair:
+                checker.apply(run_lines)
+    finally:
+        checker.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return checker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check (and repair) users, passwords, grades and ECA against each other")
+    parser.add_argument('--repair', action='store_true', help="Fix the problems that have a safe fix")
+    parser.add_argument('--report', help="Write every problem to this CSV file (kind,username,detail)")
+    parser.add_argument('--run-lines', type=int, default=RUN_LINES, help="Lines sorted in memory at once")
+    parser.add_argument('--temp', help="Directory for the sort runs (default: the system temp directory)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        report = stack.enter_context(open(args.report, 'w')) if args.report else None
+        if report is not None:
+            report.write("kind,username,detail\n")
+        checker = check(args.repair, report, args.run_lines, args.temp)
+    print(f"Checked {', '.join(f'{count} {name}' for name, count in checker.lines.items())} lines "
+          f"in {time.perf_counter() - start:.1f}s")
+    if not checker.counts:
+        print("No problems found")
+        return 0
+    for kind, count in sorted(checker.counts.items()):
+        print(f"  {kind:<20} {count:>8}   e.g. {', '.join(checker.examples[kind])}")
+    if args.repair:
+        print(f"Repaired: {checker.repairs} lines dropped, changed or added")
+        if checker.unrepaired:
+            left = ', '.join(f"{count} {kind}" for kind, count in sorted(checker.unrepaired.items()))
+            print(f"Left for review: {left}")
+    return 1 if checker.unrepaired else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import struct
+import asyncio
+import argparse
+import tempfile
+import threading
+from dataset import dataset_key, parse_marks, parse_eca, parse_users, parse_passwords, USERS_FILE, PASSWORDS_FILE, GRADES_FILE, ECA_FILE
+from data_store import store
+from shards import path_for
+import student_records
+from student_records import RecordError
+
+# Optional local data service: one process that owns the parsed dataset for
+# every UI session on the host, instead of each session parsing the files.
+#
+#   python -m data_service                  # from the directory holding dataset/
+#   python -m data_service --root /srv/school --socket /run/sms/data.sock
+#
+# It listens on a Unix socket. A request is one JSON line holding a batch of
+# calls, [name, kwargs] each, and the reply is one JSON line with a result
+# per call, so several loads cost one round trip. Reads are answered from the
+# service's data_store (plus per-username indexes built once per version of
+# a file) in worker threads, so a re-parse never holds up the event loop;
+# writes run one at a time, still under the dataset_io file locks, since
+# sessions on other hosts may write to the same files directly.
+#
+# The UI goes through call(), which keeps one connection per process and
+# uses it while a service is running. Without one (or if it goes away) the
+# same functions run in the session's own process, exactly as before, and
+# the row calls can report progress as the file is parsed (see loading.py).
+# SMS_DATA_SERVICE=<path> picks the socket, SMS_DATA_SERVICE=off never
+# connects.
+#
+# The socket answers logins and receives new passwords, so only a service
+# run by the same user is trusted: the default socket lives in a directory
+# only that user can open ($XDG_RUNTIME_DIR, else a 0700 sms-<uid>
+# directory in the temp directory), and clients check the owner of the
+# socket file and the peer credentials of the connection. A socket failing
+# the checks is treated as no service.
+
+SERVICE_ENV = 'SMS_DATA_SERVICE'
+CALL_TIMEOUT = 30.0      # seconds to wait for a reply before giving up on the service
+RECONNECT_DELAY = 5.0    # seconds between attempts to reach a service that wasn't running
+REQUEST_LIMIT = 1 << 20  # longest request line the service accepts
+CACHE_ROWS = 1000        # results with more rows keep their JSON encoding
+
+
+def private_dir():
+    # A directory only this user can use, for the default sockets; None if
+    # the one found belongs to someone else or others can write to it
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    path = os.path.join(base, f"sms-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not os.path.isdir(path) or os.path.islink(path) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        return None
+    return path
+
+
+def socket_path(dataset_dir='dataset'):
+    # One service per dataset directory: the default socket is named after
+    # it. None when there is no safe place for it.
+    configured = os.environ.get(SERVICE_ENV)
+    if configured:
+        return configured
+    directory = private_dir()
+    if directory is None:
+        return None
+    return os.path.join(directory, f"sms_data_{dataset_key(dataset_dir)}.sock")
+
+
+def check_peer(sock, path):
+    # Raises ServiceUnavailable unless this user owns the socket file and
+    # the process serving it
+    if os.stat(path).st_uid != os.getuid():
+        raise ServiceUnavailable(f"{path} belongs to another user")
+    if hasattr(socket, 'SO_PEERCRED'):
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', credentials)
+        if uid != os.getuid():
+            raise ServiceUnavailable(f"{path} is served by another user")
+
+
+# -- calls -------------------------------------------------------------------
+# Run by the service for its clients, or directly when there is no service.
+# Returned lists are shared with the caches and must not be modified. The
+# store parses each file one way, so everything from users.txt is derived
+# from parse_users rows. Lookups of one user read only the shard holding
+# them (shards.py), which is the whole file in the flat layout.
+
+_derived = {}
+
+
+def derived(path, parse, build, progress=None):
+    # build(rows of the file), rebuilt only when the file changes
+    watched = store.watch(path, parse)
+    watched.refresh(progress)
+    cached = _derived.get((path, build))
+    if cached is None or cached[0] != watched.generation:
+        cached = _derived[(path, build)] = (watched.generation, build(watched.rows))
+    return cached[1]
+
+
+def chunks_of(progress, convert):
+    # A progress callback for the file's rows that reports convert(rows)
+    # to progress instead, converting each new chunk once
+    if progress is None:
+        return None
+    converted = []
+    done = 0
+
+    def report(rows):
+        nonlocal done
+        converted.extend(convert(rows[done:]))
+        done = len(rows)
+        progress(converted)
+    return report
+
+
+def of_student(username):
+    return lambda rows: [row for row in rows if row[0] == username]
+
+
+def by_username(rows):
+    index = {}
+    for row in rows:
+        index.setdefault(row[0], []).append(row)
+    return index
+
+
+def password_sets(rows):
+    # username -> the passwords on any of their passwords.txt lines; like
+    # login.validate_credentials, any matching line lets a user in
+    passwords = {}
+    for username, password in rows:
+        passwords.setdefault(username, set()).add(password)
+    return passwords
+
+
+def roles(users):
+    return {user[0]: user[2] for user in users}
+
+
+def students_of(users):
+    return [(username, name, email, phone)
+            for username, password, role, user_id, name, email, phone in users if role == 'student']
+
+
+def marks(username=None, progress=None):
+    # [(username, subject, grade), ...] of everyone, or of one student
+    if username is None:
+        return store.marks(progress=progress)
+    return derived(path_for(GRADES_FILE, username), parse_marks, by_username,
+                   chunks_of(progress, of_student(username))).get(username, [])
+
+
+def eca(username=None, progress=None):
+    # [(username, activity), ...] of everyone, or of one student
+    if username is None:
+        return store.eca(progress=progress)
+    return derived(path_for(ECA_FILE, username), parse_eca, by_username,
+                   chunks_of(progress, of_student(username))).get(username, [])
+
+
+def students(progress=None):
+    # [(username, name, email, phone), ...]
+    return derived(USERS_FILE, parse_users, students_of, chunks_of(progress, students_of))
+
+
+def role(username):
+    # 'admin', 'student', ... or None for an unknown user
+    return derived(path_for(USERS_FILE, username), parse_users, roles).get(username)
+
+
+def login(username, password):
+    passwords = derived(path_for(PASSWORDS_FILE, username), parse_passwords, password_sets)
+    return password in passwords.get(username, ())
+
+
+def add_student(username, password, name, email, phone, marks=(), activities=()):
+    return student_records.add_student(username, password, name, email, phone, marks, activities)
+
+
+def delete_student(username):
+    return student_records.delete_student(username)
+
+
+def generations():
+    # Versions of the files in memory (path -> generation), for store.poll()
+    # style change checks
+    store.poll({})
+    return store.generations()
+
+
+CALLS = {
+    'marks': marks,
+    'eca': eca,
+    'students': students,
+    'role': role,
+    'login': login,
+    'add_student': add_student,
+    'delete_student': delete_student,
+    'generations': generations,
+}
+WRITE_CALLS = {'add_student', 'delete_student'}
+# Calls returning rows (lists of tuples) send them as columns: JSON has no
+# tuples, and a few long lists of strings decode several times faster than
+# one short list per row
+ROW_CALLS = {'marks', 'eca', 'students'}
+
+
+# -- client ------------------------------------------------------------------
+
+class ServiceUnavailable(ConnectionError):
+    pass
+
+
+class CallInterrupted(ServiceUnavailable):
+    # The connection failed after the request went out: the service may or
+    # may not have run it
+    pass
+
+
+class ServiceError(RuntimeError):
+    # A call the service ran and that raised
+    pass
+
+
+class DataClient:
+    def __init__(self, path, timeout=CALL_TIMEOUT):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+            check_peer(self.sock, path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile('rb')
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.file.close()
+        self.sock.close()
+
+    def batch(self, calls):
+        # Results of [(name, kwargs), ...] in one round trip
+        request = json.dumps({'calls': [[name, kwargs] for name, kwargs in calls]}).encode() + b'\n'
+        with self.lock:
+            if self.closed:
+                raise ServiceUnavailable("connection closed")
+            try:
+                self.sock.sendall(request)
+                line = self.file.readline()
+            except OSError as e:
+                self.close()
+                raise CallInterrupted(str(e))
+            if not line:
+                self.close()
+                raise CallInterrupted("service closed the connection")
+        results = []
+        for (name, _), result in zip(calls, json.loads(line)['results']):
+            if 'error' in result:
+                raise (RecordError if result.get('kind') == 'record' else ServiceError)(result['error'])
+            value = result['ok']
+            results.append(list(zip(*value)) if name in ROW_CALLS else value)
+        return results
+
+    def call(self, name, /, **kwargs):
+        return self.batch([(name, kwargs)])[0]
+
+
+_client = None
+_retry_at = 0.0
+_connecting = threading.Lock()   # background loads connect too
+
+
+def connect():
+    # This process's connection to the data service, or None if none is running
+    global _client, _retry_at
+    with _connecting:
+        if _client is not None and not _client.closed:
+            return _client
+        if not hasattr(socket, 'AF_UNIX') or time.monotonic() < _retry_at:
+            return None
+        path = socket_path()
+        if path is None or path == 'off':
+            return None
+        try:
+            _client = DataClient(path)
+        except OSError:
+            _client = None
+            _retry_at = time.monotonic() + RECONNECT_DELAY
+        return _client
+
+
+def call(name, /, progress=None, **kwargs):
+    # Runs a call on the data service if one is running, else in this
+    # process. progress (row calls only) is called with the rows parsed so
+    # far; the service sends its rows all at once and never calls it.
+    # A write whose connection fails after it was sent is not run again
+    # here, since the service may already have made it.
+    client = connect()
+    if client is not None:
+        try:
+            return client.call(name, **kwargs)
+        except CallInterrupted as e:
+            if name in WRITE_CALLS:
+                raise RecordError(f"Lost the data service during {name}; check whether it was saved: {e}")
+        except ServiceUnavailable:
+            pass
+    if progress is not None:
+        kwargs['progress'] = progress
+    return CALLS[name](**kwargs)
+
+
+# -- service -----------------------------------------------------------------
+
+class DataService:
+    def __init__(self):
+        self.write_lock = None
+        self.encoded = {}   # (name, kwargs) -> (result, its JSON) for large results
+
+    def preload(self):
+        # Parse every file up front so the first clients don't wait for it
+        for name in ('marks', 'eca', 'students', 'generations'):
+            CALLS[name]()
+        role('')
+        login('', '')
+
+    @staticmethod
+    def to_json(name, result):
+        if name in ROW_CALLS:
+            result = [list(column) for column in zip(*result)]
+        return json.dumps(result).encode()
+
+    def encode(self, name, kwargs, result):
+        if not isinstance(result, list) or len(result) <= CACHE_ROWS:
+            return self.to_json(name, result)
+        # The calls return the same list object until the file changes
+        key = (name, json.dumps(kwargs, sort_keys=True))
+        cached = self.encoded.get(key)
+        if cached is None or cached[0] is not result:
+            cached = self.encoded[key] = (result, self.to_json(name, result))
+        return cached[1]
+
+    def call(self, name, kwargs):
+        # The reply to one call; runs in a worker thread
+        return b'{"ok":' + self.encode(name, kwargs, CALLS[name](**kwargs)) + b'}'
+
+    async def run(self, name, kwargs):
+        # Every call runs off the event loop: a read may re-parse a changed
+        # file (or encode a large result), and the other clients' calls go on
+        # meanwhile. Writes also wait for each other.
+        try:
+            loop = asyncio.get_running_loop()
+            if name in WRITE_CALLS:
+                async with self.write_lock:
+                    return await loop.run_in_executor(None, self.call, name, kwargs)
+            return await loop.run_in_executor(None, self.call, name, kwargs)
+        except RecordError as e:
+            return json.dumps({'error': str(e), 'kind': 'record'}).encode()
+        except Exception as e:
+            return json.dumps({'error': f"{type(e).__name__}: {e}"}).encode()
+
+    async def handle(self, reader, writer):
+        # One client connection; requests are answered in order
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                calls = json.loads(line)['calls']
+                results = [await self.run(name, kwargs) for name, kwargs in calls]
+                writer.write(b'{"results":[' + b','.join(results) + b']}\n')
+                await writer.drain()
+        except (ConnectionError, ValueError, KeyError) as e:
+            print(f"Dropping client: {type(e).__name__}: {e}")
+        except asyncio.CancelledError:
+            pass    # shutting down
+        finally:
+            writer.close()
+
+    async def serve(self, path):
+        self.write_lock = asyncio.Lock()
+        self.preload()
+        server = await asyncio.start_unix_server(self.handle, path, limit=REQUEST_LIMIT)
+        os.chmod(path, 0o600)
+        print(f"Serving {os.path.abspath('dataset')} on {path}")
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def running(path):
+    # Whether a service answers on path
+    try:
+        DataClient(path, timeout=1.0).close()
+        return True
+    except OSError:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dataset to the UI sessions on this host")
+    parser.add_argument("--root", default=".", help="Directory holding dataset/")
+    parser.add_argument("--socket", help="Socket path (default: from SMS_DATA_SERVICE or the dataset path)")
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print("The data service needs Unix sockets; sessions will read the files directly.")
+        return 1
+    os.chdir(args.root)
+    path = args.socket or socket_path()
+    if path is None:
+        print(f"No private directory for the socket; pass --socket or set {SERVICE_ENV}")
+        return 1
+    if os.path.exists(path):
+        if running(path):
+            print(f"A data service is already running on {path}")
+            return 1
+        os.remove(path)   # left behind by a service that didn't exit cleanly
+    asyncio.run(DataService().serve(path))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import os
+import time
+import threading
+from dataset import parse_marks, parse_eca, GRADES_FILE, ECA_FILE
+from dataset_io import reading, count_read
+import shards
+
+# In-memory copies of the dataset files that follow changes made on disk.
+#
+# Each watched file remembers its identity (device, inode), size and mtime and
+# how far it has been parsed. A refresh is one os.stat() when nothing changed.
+# If the same file only grew past a line break, just the new tail bytes are
+# read and parsed and appended to the rows; anything else (a different
+# inode, a shrink, an mtime change without growth, or bytes before the old
+# end that no longer match) reloads the whole file.
+#
+# Consumers do not get callbacks: every change bumps the file's generation,
+# and the caches built from the rows compare generations with the ones they
+# were built from (store.generations() / store.poll()). Open screens only
+# compare dataset.file_version() on their frame loop and leave the reading
+# to a loading.Load.
+#
+# Full reloads are parsed CHUNK_LINES lines at a time. refresh(progress)
+# calls progress(rows parsed so far) after each chunk, which lets a
+# background load (loading.py) show rows as they arrive, or stop the parse
+# by raising; the file is then left as it was before the refresh, as it is
+# when parsing appended lines fails. One thread refreshes a file at a time;
+# poll() skips files another thread is loading instead of waiting for them.
+#
+# A sharded file (shards.py) is a ShardedFile over one WatchedFile per
+# shard; its rows are the shards' rows joined, rebuilt when any shard's
+# generation moves. The shards are also watched under their own paths, so
+# a per-student lookup of one shard shares them.
+#
+# Change detection polls os.stat() instead of using inotify: it costs a few
+# microseconds per file, needs no platform-specific code, and also sees
+# writes made by other machines to a dataset directory on a network share,
+# which inotify does not report.
+
+POLL_INTERVAL = 0.5  # seconds between polls from the screens' event loops
+CHECK_BYTES = 64     # bytes before the parsed end compared on append
+CHUNK_LINES = 20000  # lines parsed between progress() calls on a reload
+
+
+class WatchedFile:
+    def __init__(self, path, parse):
+        self.path = path
+        self.parse = parse      # lines -> rows, as dataset.parse_marks
+        self.rows = []          # replaced, never modified, when the file changes
+        self.generation = 0
+        self.stat = None        # (dev, inode, size, mtime_ns) as last parsed
+        self.offset = 0         # bytes parsed
+        self.tail = b''         # the last CHECK_BYTES bytes parsed
+        self.loaded = False
+        self.lock = threading.Lock()    # held by the thread refreshing the file
+
+    def refresh(self, progress=None, blocking=True):
+        # Brings rows up to date with the file; returns 'unchanged',
+        # 'appended' or 'reloaded', or 'busy' if blocking is false and
+        # another thread is refreshing it
+        if not self.lock.acquire(blocking):
+            return 'busy'
+        try:
+            return self.update(progress)
+        finally:
+            self.lock.release()
+
+    def update(self, progress):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None:
+            if self.loaded and self.stat is None:
+                return 'unchanged'
+        elif self.loaded and (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns) == self.stat:
+            return 'unchanged'
+
+        # Read the bytes under the reader lock (so no append is half
+        # written), parse them after releasing it
+        parsed = (self.stat, self.offset, self.tail)
+        with reading(self.path):
+            change, data = self.read()
+        if change == 'unchanged':
+            return change
+        rows = []
+        try:
+            lines = data.decode().splitlines()
+            if change == 'appended':
+                rows = self.rows + self.parse(lines)
+            else:
+                for start in range(0, len(lines), CHUNK_LINES):
+                    rows.extend(self.parse(lines[start:start + CHUNK_LINES]))
+                    if progress is not None:
+                        progress(rows)
+        except BaseException:
+            # read() already moved past these bytes; parse them again next time
+            self.stat, self.offset, self.tail = parsed
+            raise
+        return self.replace(rows, change)
+
+    def read(self):
+        # (change, bytes to parse) since the last read
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.stat, self.offset, self.tail = None, 0, b''
+            return 'reloaded', b''
+        stat = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        if self.loaded and stat == self.stat:
+            return 'unchanged', b''
+
+        appendable = (self.loaded and self.stat is not None
+                      and stat[:2] == self.stat[:2]
+                      and st.st_size > self.offset
+                      and self.tail.endswith(b'\n'))
+        with open(self.path, 'rb') as file:
+            if appendable:
+                file.seek(self.offset - len(self.tail))
+                data = file.read()
+                count_read(len(data))
+                if data[:len(self.tail)] == self.tail:
+                    new = data[len(self.tail):]
+                    self.stat = stat
+                    self.advance(new)
+                    return 'appended', new
+                file.seek(0)
+            data = file.read()
+            count_read(len(data))
+        self.stat = stat
+        self.offset = 0
+        self.tail = b''
+        self.advance(data)
+        return 'reloaded', data
+
+    def advance(self, data):
+        self.offset += len(data)
+        self.tail = (self.tail + data)[-CHECK_BYTES:]
+
+    def replace(self, rows, change='appended'):
+        if not self.loaded:
+            change = 'reloaded'
+        self.rows = rows
+        self.loaded = True
+        self.generation += 1
+        return change
+
+
+class ShardedFile:
+    def __init__(self, path, shards):
+        self.path = path
+        self.shards = shards    # WatchedFile per shard
+        self.rows = []
+        self.generation = 0
+        self.seen = None        # the shards' generations the rows were joined from
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def refresh(self, progress=None, blocking=True):
+        # Same results as WatchedFile.refresh; a change to any shard is
+        # reported as 'reloaded', since the joined rows change in the middle
+        if not self.lock.acquire(blocking):
+            return 'busy'
+        try:
+            # The first load reports progress shard by shard
+            rows = None if self.loaded else []
+            for shard in self.shards:
+                if shard.refresh(blocking=blocking) == 'busy':
+                    return 'busy'
+                if rows is not None:
+                    rows.extend(shard.rows)
+                    if progress is not None:
+                        progress(rows)
+            seen = tuple(shard.generation for shard in self.shards)
+            if self.loaded and seen == self.seen:
+                return 'unchanged'
+            if rows is None:
+                rows = [row for shard in self.shards for row in shard.rows]
+            self.rows = rows
+            self.seen = seen
+            self.loaded = True
+            self.generation += 1
+            return 'reloaded'
+        finally:
+            self.lock.release()
+
+
+class DataStore:
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.files = {}     # path -> WatchedFile
+        self.last_poll = 0.0
+
+    def watch(self, path, parse):
+        watched = self.files.get(path)
+        if watched is None:
+            if shards.sharded(path):
+                watched = ShardedFile(path, [self.watch(shard, parse) for shard in shards.paths(path)])
+            else:
+                watched = WatchedFile(path, parse)
+            # Two threads may get here at once; both keep the first one
+            watched = self.files.setdefault(path, watched)
+        return watched
+
+    def rows(self, path, parse, progress=None):
+        # The file's rows as they are on disk now
+        watched = self.watch(path, parse)
+        watched.refresh(progress)
+        return watched.rows
+
+    def marks(self, path=GRADES_FILE, progress=None):
+        return self.rows(path, parse_marks, progress)
+
+    def eca(self, path=ECA_FILE, progress=None):
+        return self.rows(path, parse_eca, progress)
+
+    def generations(self):
+        return {path: watched.generation for path, watched in list(self.files.items())}
+
+    def poll(self, seen):
+        # Refreshes the watched files at most once per interval and returns
+        # the paths whose generation differs from `seen` (path -> generation)
+        now = time.monotonic()
+        if now - self.last_poll >= self.interval:
+            self.last_poll = now
+            for watched in list(self.files.values()):
+                watched.refresh(blocking=False)
+        return {path for path, watched in list(self.files.items()) if seen.get(path) != watched.generation}
+
+
+# Shared by the screens and the cached matrices / indexes in this process
+store = DataStore()
@@ -0,0 +1,139 @@
+# Plain readers for the dataset files. These return the same tuples the
+# UserManagement loaders always have, without any pygame / UI state, so the
+# report generator and benchmarks can parse the data once and share it.
+
+import os
+import hashlib
+from dataset_io import reading
+import archive
+import shards
+
+USERS_FILE = 'dataset/users.txt'
+PASSWORDS_FILE = 'dataset/passwords.txt'
+GRADES_FILE = 'dataset/grades.txt'
+ECA_FILE = 'dataset/eca.txt'
+
+
+def file_version(path):
+    # Changes whenever the file is written; None if it doesn't exist.
+    # (mtime, size) of a flat file; for a sharded one the newest mtime,
+    # the total size and a hash of every shard's version.
+    if shards.sharded(path):
+        versions = tuple(file_version(shard) for shard in shards.paths(path))
+        present = [version for version in versions if version is not None]
+        if not present:
+            return None
+        return (max(mtime for mtime, _ in present), sum(size for _, size in present), hash(versions))
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def dataset_key(dataset_dir='dataset'):
+    # Short name for a dataset directory, the same in every process using it
+    return hashlib.sha1(os.path.abspath(dataset_dir).encode()).hexdigest()[:12]
+
+
+def parse_marks(lines):
+    # grades.txt lines -> [(username, subject, grade), ...]
+    marks = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        username, subject, grade = line.split(',')
+        marks.append((username, subject, grade))
+    return marks
+
+
+def parse_eca(lines):
+    # eca.txt lines -> [(username, activity), ...]
+    activities = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        username, activity = line.split(',')
+        activities.append((username, activity))
+    return activities
+
+
+def parse_users(lines):
+    # users.txt lines -> [(username, password, role, id, name, email, phone), ...]
+    users = []
+    for line_num, line in enumerate(lines):
+        line = line.strip()
+        if not line: # Skip empty lines
+            continue
+        parts = line.split(',')
+        # Expecting: username, password, role, id, name, email, phone
+        if len(parts) == 7:
+            users.append(tuple(parts))
+        else:
+            print(f"Warning: Skipping malformed line {line_num + 1} in users.txt: {line}")
+    return users
+
+
+def parse_students(lines):
+    # users.txt lines -> [(username, name, email, phone), ...] of the students
+    return [(username, name, email, phone)
+            for username, password, role, user_id, name, email, phone in parse_users(lines)
+            if role == 'student']
+
+
+def parse_passwords(lines):
+    # passwords.txt lines -> [(username, password), ...]
+    passwords = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        username, password = line.split(',')
+        passwords.append((username, password))
+    return passwords
+
+
+def read_lines(path):
+    # Lines of a dataset file, or of all its shards, or of a compressed
+    # archive (archive.py); FileNotFoundError if there are none
+    if archive.codec_of(path):
+        return archive.read_lines(path)
+    lines = []
+    found = False
+    for file_path in shards.paths(path):
+        try:
+            with reading(file_path), open(file_path, 'r') as file:
+                lines.extend(file.readlines())
+            found = True
+        except FileNotFoundError:
+            pass
+    if not found:
+        raise FileNotFoundError(path)
+    return lines
+
+
+def read_marks(path=GRADES_FILE):
+    # [(username, subject, grade), ...] with grade kept as a string
+    try:
+        return parse_marks(read_lines(path))
+    except FileNotFoundError:
+        return []
+
+
+def read_eca(path=ECA_FILE):
+    # [(username, activity), ...]
+    try:
+        return parse_eca(read_lines(path))
+    except FileNotFoundError:
+        return []
+
+
+def read_students(path=USERS_FILE):
+    # [(username, name, email, phone), ...] for users with the student role
+    try:
+        return parse_students(read_lines(path))
+    except FileNotFoundError:
+        print("Warning: users.txt not found.")
+        return []
@@ -0,0 +1,194 @@
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager, ExitStack
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Locking and atomic writes for the dataset files, so several sessions (or
+# kiosks sharing one dataset/ directory) can read and write them at once.
+#
+# Every dataset file has three lock files next to it:
+#
+#   <file>.lock   writer lock. Held exclusively for a whole read-modify-write
+#                 (writing()), so concurrent writers never lose each other's
+#                 changes.
+#   <file>.rlock  reader lock. Readers hold it shared while they read
+#                 (reading()); appends hold it exclusively for the append
+#                 itself, so nobody reads half a line.
+#   <file>.gate   taken exclusively by an append before it waits for the
+#                 reader lock. New readers pass the gate first, so a steady
+#                 stream of overlapping readers cannot starve an append.
+#
+# Rewrites never touch the file in place: the new contents go to a temporary
+# file in the same directory that then replaces the old one with os.replace()
+# (atomic on POSIX and Windows), so readers see either the old or the new file
+# and do not wait for a rewrite to finish.
+#
+# Locks are fcntl.flock() locks where available. Elsewhere a lock file
+# created with O_EXCL stands in, and shared locks are exclusive too.
+# Acquiring a lock the thread already holds in the same or a stronger mode
+# nests instead of deadlocking.
+
+LOCK_TIMEOUT = 10.0     # seconds to wait for a lock before giving up
+RETRY_DELAY = 0.002     # initial wait between attempts, doubled up to MAX_DELAY
+MAX_DELAY = 0.02
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+_local = threading.local()  # .held: lock path -> [fd, exclusive, depth]
+
+# Called with the size of every binary-mode dataset read (data_store,
+# parallel_load, archive); instrumentation sets it while it counts file I/O,
+# which it otherwise does through open() for text-mode files only
+read_hook = None
+
+
+def count_read(size):
+    if read_hook is not None:
+        read_hook(size)
+
+
+def _try_lock(lock_path, exclusive):
+    # fd of the acquired lock, or None if someone else holds it
+    if fcntl is not None:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+    try:
+        return os.open(lock_path + '.held', os.O_RDWR | os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+        return None
+
+
+def _unlock(lock_path, fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+    else:
+        os.close(fd)
+        os.remove(lock_path + '.held')
+
+
+@contextmanager
+def locked(lock_path, exclusive=True, timeout=LOCK_TIMEOUT):
+    if not hasattr(_local, 'held'):
+        _local.held = {}
+    held = _local.held.get(lock_path)
+    if held:
+        if exclusive and not held[1]:
+            raise RuntimeError(f"{lock_path} is held shared and cannot be upgraded")
+        held[2] += 1
+        try:
+            yield
+        finally:
+            held[2] -= 1
+        return
+
+    deadline = time.monotonic() + timeout
+    delay = RETRY_DELAY
+    fd = _try_lock(lock_path, exclusive)
+    while fd is None:
+        if time.monotonic() >= deadline:
+            raise LockTimeout(f"Timed out waiting for {lock_path}")
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_DELAY)
+        fd = _try_lock(lock_path, exclusive)
+
+    _local.held[lock_path] = [fd, exclusive, 1]
+    try:
+        yield
+    finally:
+        del _local.held[lock_path]
+        _unlock(lock_path, fd)
+
+
+def writing(path, timeout=LOCK_TIMEOUT):
+    # Exclusive writer lock on a dataset file: hold it around any
+    # check-then-write or read-modify-write of the file
+    return locked(path + '.lock', True, timeout)
+
+
+@contextmanager
+def reading(path, timeout=LOCK_TIMEOUT):
+    # Shared reader lock: only waits for an append in progress or queued.
+    # Hold it just to read the bytes; parse after releasing it.
+    with ExitStack() as stack:
+        with locked(path + '.gate', False, timeout):
+            stack.enter_context(locked(path + '.rlock', False, timeout))
+        yield
+
+
+def append_lines(path, lines):
+    # Appends complete lines ("...\n") in one write, starting a new line
+    # first if the file does not end with one
+    data = ''.join(lines).encode()
+    if not data:
+        return
+    with writing(path), locked(path + '.gate', True), locked(path + '.rlock', True):
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            size = os.fstat(fd).st_size
+            if size:
+                os.lseek(fd, size - 1, os.SEEK_SET)
+                if os.read(fd, 1) != b'\n':
+                    data = b'\n' + data
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+
+def replace_lines(path, lines):
+    # Atomically replaces the file's contents with lines
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def remove_lock_files(path):
+    # Drops the lock files next to a dataset file that has been removed for
+    # good. Only for files nobody opens any more: a session still waiting
+    # on one of these locks would go on holding a lock nobody else sees.
+    for suffix in ('.lock', '.rlock', '.gate'):
+        for lock_path in (path + suffix, path + suffix + '.held'):
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+def rewrite_lines(path, keep):
+    # Keeps the lines for which keep(line) is true; returns how many were
+    # dropped. The read and the replace happen under the writer lock.
+    with writing(path):
+        try:
+            with open(path, 'r') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return 0
+        kept = [line for line in lines if keep(line)]
+        if len(kept) != len(lines):
+            replace_lines(path, kept)
+        return len(lines) - len(kept)
@@ -0,0 +1,183 @@
+import heapq
+import numpy as np
+from aggregates import ECA_TOP_K
+from dataset import file_version, ECA_FILE
+from data_store import store
+import shared_snapshot
+
+# Student x activity incidence index for the ECA data.
+#
+# Students and activities are given integer codes in first-seen order. Each
+# activity keeps a bitset of its students as a plain Python int (bit i set =
+# student code i is a member), so "in both clubs" is one &, "in either" one |,
+# and an overlap count a popcount, instead of a scan over every eca.txt row.
+# Each student keeps the codes of their activities, in file order.
+#
+# Rows are added in batches (extend): the new members of each activity are
+# collected as student codes first and its bitset is built from them once,
+# through a NumPy bool mask, so a batch costs one pass over its rows plus one
+# bitset per activity it touches. OR-ing one bit per row into a growing int
+# would copy the whole bitset every time.
+
+
+if hasattr(int, 'bit_count'):
+    def popcount(bits):
+        return bits.bit_count()
+else:  # Python < 3.10
+    def popcount(bits):
+        return bin(bits).count('1')
+
+
+class EcaIndex:
+    def __init__(self, activities=()):
+        self.students = []          # code -> username
+        self.student_codes = {}     # username -> code
+        self.activities = []        # code -> activity
+        self.activity_codes = {}    # activity -> code
+        self.members = []           # activity code -> bitset of student codes
+        self.student_activities = []  # student code -> [activity codes]
+        self.extend(activities)
+
+    @classmethod
+    def from_arrays(cls, students, student_codes, activities, activity_codes, members, student_activities):
+        # A read-only EcaIndex over structures built elsewhere (a shared snapshot)
+        index = cls.__new__(cls)
+        index.students = students
+        index.student_codes = student_codes
+        index.activities = activities
+        index.activity_codes = activity_codes
+        index.members = members
+        index.student_activities = student_activities
+        return index
+
+    def student_code(self, username):
+        code = self.student_codes.get(username)
+        if code is None:
+            code = self.student_codes[username] = len(self.students)
+            self.students.append(username)
+            self.student_activities.append([])
+        return code
+
+    def activity_code(self, activity):
+        code = self.activity_codes.get(activity)
+        if code is None:
+            code = self.activity_codes[activity] = len(self.activities)
+            self.activities.append(activity)
+            self.members.append(0)
+        return code
+
+    def add(self, username, activity):
+        self.extend([(username, activity)])
+
+    def extend(self, activities):
+        # Adds (username, activity) rows; a student already in an activity is
+        # not added again
+        joined = {}     # activity code -> [new student codes]
+        student_codes, activity_codes = self.student_codes, self.activity_codes
+        for username, activity in activities:
+            # student_code / activity_code inlined for the common, known case
+            student = student_codes.get(username)
+            if student is None:
+                student = self.student_code(username)
+            code = activity_codes.get(activity)
+            if code is None:
+                code = self.activity_code(activity)
+            codes = self.student_activities[student]
+            if code not in codes:
+                codes.append(code)
+                joined.setdefault(code, []).append(student)
+        mask = np.zeros(len(self.students), dtype=bool)
+        for code, students in joined.items():
+            mask[students] = True
+            self.members[code] |= int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+            mask[students] = False
+
+    # -- lookups -------------------------------------------------------------
+
+    def bits(self, activity):
+        code = self.activity_codes.get(activity)
+        return self.members[code] if code is not None else 0
+
+    def usernames(self, bits):
+        # Usernames for the set bits, in student code order
+        # (one pass over the binary string; peeling off the lowest bit one at
+        # a time would copy the whole int per member)
+        students = self.students
+        digits = bin(bits)[:1:-1]
+        result = []
+        position = digits.find('1')
+        while position != -1:
+            result.append(students[position])
+            position = digits.find('1', position + 1)
+        return result
+
+    def activities_of(self, username):
+        code = self.student_codes.get(username)
+        if code is None:
+            return []
+        return [self.activities[a] for a in self.student_activities[code]]
+
+    def students_in(self, activity):
+        return self.usernames(self.bits(activity))
+
+    def students_in_all(self, activities):
+        # Students taking part in every one of the activities
+        activities = list(activities)
+        if not activities:
+            return []
+        bits = self.bits(activities[0])
+        for activity in activities[1:]:
+            bits &= self.bits(activity)
+        return self.usernames(bits)
+
+    def students_in_any(self, activities):
+        bits = 0
+        for activity in activities:
+            bits |= self.bits(activity)
+        return self.usernames(bits)
+
+    # -- counts --------------------------------------------------------------
+
+    def activity_counts(self):
+        # {activity: number of students}, like aggregates.activity_counts but
+        # with duplicate rows counted once
+        return {activity: popcount(bits) for activity, bits in zip(self.activities, self.members)}
+
+    def activity_count(self, username):
+        code = self.student_codes.get(username)
+        return len(self.student_activities[code]) if code is not None else 0
+
+    def student_activity_counts(self):
+        # {username: number of activities}
+        return {username: len(codes) for username, codes in zip(self.students, self.student_activities)}
+
+    def co_participation(self, first, second):
+        # Number of students in both activities
+        return popcount(self.bits(first) & self.bits(second))
+
+    def overlap_matrix(self, activities):
+        # Square matrix of co-participation counts; the diagonal is club size
+        bits = [self.bits(activity) for activity in activities]
+        return [[popcount(a & b) for b in bits] for a in bits]
+
+    def top_activities(self, k=ECA_TOP_K):
+        # The k largest activities, in first-seen order
+        counts = self.activity_counts()
+        keep = set(heapq.nlargest(k, counts, key=counts.get))
+        return [activity for activity in self.activities if activity in keep]
+
+
+_cache = {}
+
+
+def load_eca_index(path=ECA_FILE):
+    # EcaIndex of the ECA file as it is now, from a shared snapshot of the
+    # same version if there is one
+    version = file_version(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    snapshot = shared_snapshot.find(path, version)
+    index = snapshot.eca_index() if snapshot else EcaIndex(store.eca(path))
+    _cache[path] = (version, index)
+    return index
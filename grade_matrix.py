@@ -0,0 +1,215 @@
+from functools import cached_property
+import numpy as np
+from aggregates import GRADE_BANDS, box_stats
+from dataset import file_version, GRADES_FILE
+from data_store import store
+import shared_snapshot
+import parallel_load
+
+# Dense students x subjects view of grades.txt.
+#
+# The (username, subject, grade) rows are pivoted once into NumPy arrays and
+# every chart and statistic is computed from those with vectorized operations
+# instead of re-grouping the rows in Python dicts. Derived statistics are
+# cached on the instance; load_grade_matrix() keeps one instance per version
+# of the grades file, so they are computed once per change to the data.
+#
+# Cells hold the mean of a student's grades in a subject (normally exactly one
+# grade) and NaN where there is none. Per-student and per-subject means are
+# taken over the underlying rows, so they match aggregates.averages().
+#
+# A large grades file that isn't in data_store yet is parsed in parallel
+# straight into code arrays (parallel_load.py) instead of into row tuples.
+
+HEATMAP_ROWS = 40  # default number of student bands for band_means()
+
+
+class GradeMatrix:
+    def __init__(self, marks):
+        student_codes = {}
+        subject_codes = {}
+        n = len(marks)
+        rows = np.empty(n, dtype=np.int64)
+        columns = np.empty(n, dtype=np.int64)
+        for i, (username, subject, _) in enumerate(marks):
+            rows[i] = student_codes.setdefault(username, len(student_codes))
+            columns[i] = subject_codes.setdefault(subject, len(subject_codes))
+
+        self.pivot(student_codes, subject_codes, rows, columns,
+                   np.array([grade for _, _, grade in marks], dtype=float))
+
+    @classmethod
+    def from_codes(cls, student_index, subject_index, row_students, row_subjects, row_grades):
+        # A GradeMatrix over rows already coded (parallel_load.read_grade_codes)
+        matrix = cls.__new__(cls)
+        matrix.pivot(student_index, subject_index, row_students, row_subjects, row_grades)
+        return matrix
+
+    def pivot(self, student_codes, subject_codes, rows, columns, grades):
+        self.students = list(student_codes)     # row -> username, first-seen order
+        self.subjects = list(subject_codes)     # column -> subject, first-seen order
+        self.student_index = student_codes
+        self.subject_index = subject_codes
+
+        # The rows themselves, columnar, for the statistics that need every grade
+        self.row_students = rows
+        self.row_subjects = columns
+        self.row_grades = grades
+
+        shape = (len(self.students), len(self.subjects))
+        flat = rows * shape[1] + columns
+        size = shape[0] * shape[1]
+        self.sums = np.bincount(flat, weights=self.row_grades, minlength=size).reshape(shape)
+        self.counts = np.bincount(flat, minlength=size).reshape(shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.grades = self.sums / self.counts   # NaN where no mark
+
+    @classmethod
+    def from_arrays(cls, students, subjects, student_index, subject_index, row_students, row_subjects,
+                    row_grades, sums, counts, grades, student_means=None):
+        # A GradeMatrix over arrays built elsewhere (a shared snapshot)
+        matrix = cls.__new__(cls)
+        matrix.students = students
+        matrix.subjects = subjects
+        matrix.student_index = student_index
+        matrix.subject_index = subject_index
+        matrix.row_students = row_students
+        matrix.row_subjects = row_subjects
+        matrix.row_grades = row_grades
+        matrix.sums = sums
+        matrix.counts = counts
+        matrix.grades = grades
+        if student_means is not None:
+            matrix.student_means = student_means
+        return matrix
+
+    def __len__(self):
+        return len(self.students)
+
+    # -- per-student statistics ---------------------------------------------
+
+    @cached_property
+    def student_means(self):
+        return self.sums.sum(axis=1) / self.counts.sum(axis=1)
+
+    @cached_property
+    def student_stds(self):
+        # Population standard deviation over the subjects a student has marks in
+        return self.nan_std(self.grades, self.student_means[:, None], axis=1)
+
+    @cached_property
+    def percentile_ranks(self):
+        # Share of students (0-100) whose average is at or below each student's
+        means = self.student_means
+        if not means.size:
+            return means
+        ordered = np.sort(means)
+        return np.searchsorted(ordered, means, side='right') * 100.0 / means.size
+
+    # -- per-subject statistics ---------------------------------------------
+
+    @cached_property
+    def subject_means(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sums.sum(axis=0) / self.counts.sum(axis=0)
+
+    @cached_property
+    def subject_stds(self):
+        return self.nan_std(self.grades, self.subject_means[None, :], axis=0)
+
+    @cached_property
+    def zscores(self):
+        # Each cell relative to its subject: (grade - mean) / std, NaN if missing
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (self.grades - self.subject_means) / self.subject_stds
+
+    @cached_property
+    def correlation(self):
+        # Pearson correlation between subjects over the students who have a
+        # mark in both; NaN where there are fewer than two such students
+        n = len(self.subjects)
+        result = np.full((n, n), np.nan)
+        present = ~np.isnan(self.grades)
+        for i in range(n):
+            for j in range(i, n):
+                both = present[:, i] & present[:, j]
+                if both.sum() < 2:
+                    continue
+                x = self.grades[both, i] - self.grades[both, i].mean()
+                y = self.grades[both, j] - self.grades[both, j].mean()
+                denominator = np.sqrt((x * x).sum() * (y * y).sum())
+                if denominator:
+                    result[i, j] = result[j, i] = (x * y).sum() / denominator
+        return result
+
+    @cached_property
+    def subject_box_stats(self):
+        # box_stats() of every grade recorded per subject
+        order = np.argsort(self.row_subjects, kind='stable')
+        sizes = np.bincount(self.row_subjects, minlength=len(self.subjects))
+        groups = np.split(self.row_grades[order], np.cumsum(sizes)[:-1])
+        return [box_stats(grades) for grades in groups]
+
+    @staticmethod
+    def nan_std(values, means, axis):
+        present = ~np.isnan(values)
+        counts = present.sum(axis=axis)
+        squares = np.where(present, (values - means) ** 2, 0.0).sum(axis=axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(squares / counts)
+
+    # -- chart inputs, in the shapes the aggregates module uses ---------------
+
+    def student_averages(self):
+        # {username: average}
+        return dict(zip(self.students, self.student_means.tolist()))
+
+    def subject_averages(self):
+        # {subject: average}
+        return dict(zip(self.subjects, self.subject_means.tolist()))
+
+    def grade_distribution(self):
+        # {band: number of grades}, same bands as aggregates.grade_band
+        bands = np.searchsorted([60, 70, 80, 90], self.row_grades, side='right')
+        counts = np.bincount(bands, minlength=5)[::-1]
+        return dict(zip(GRADE_BANDS, counts.tolist()))
+
+    def band_means(self, max_rows=HEATMAP_ROWS):
+        # Students sorted best first and merged into at most max_rows bands;
+        # returns (row labels, bands x subjects matrix of mean grades)
+        order = np.argsort(-self.student_means, kind='stable')
+        if len(order) <= max_rows:
+            return [self.students[i] for i in order], self.grades[order]
+        labels = []
+        rows = []
+        start = 0
+        for group in np.array_split(order, max_rows):
+            labels.append(f'#{start + 1}-{start + len(group)}')
+            start += len(group)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rows.append(self.sums[group].sum(axis=0) / self.counts[group].sum(axis=0))
+        return labels, np.array(rows)
+
+
+_cache = {}
+
+
+def load_grade_matrix(path=GRADES_FILE):
+    # The GradeMatrix of the grades file as it is now, rebuilt only when the
+    # file has changed since the last call. A shared snapshot of the same
+    # version is used instead of parsing the file.
+    version = file_version(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    snapshot = shared_snapshot.find(path, version)
+    if snapshot:
+        matrix = snapshot.grade_matrix()
+    elif not getattr(store.files.get(path), 'loaded', False) and version and version[1] >= parallel_load.PARALLEL_BYTES:
+        # Rows in the store only need the new lines parsed; without them,
+        # coding the file in parallel beats building the rows first
+        matrix = GradeMatrix.from_codes(*parallel_load.read_grade_codes(path))
+    else:
+        matrix = GradeMatrix(store.marks(path))
+    _cache[path] = (version, matrix)
+    return matrix
@@ -0,0 +1,400 @@
+import os
+import io
+import sys
+import json
+import time
+import builtins
+import dataset_io
+import functools
+import threading
+from collections import deque, defaultdict
+import pygame
+
+# Frame-time and hot-path instrumentation.
+#
+# Every screen loop reports its frames here:
+#
+#     metrics.begin_frame("UserManagement", self)   # starts the "events" phase
+#     for event in metrics.poll_events(): ...
+#     metrics.mark("draw")
+#     ... drawing ...
+#     metrics.flip()                          # "flip" phase, then ends the frame
+#
+# Data loading and chart rendering are timed with the @metrics.timed("load") /
+# @metrics.timed("chart") decorators. Nested phases are exclusive, so time spent
+# in "load" during event handling is not also counted as "events".
+#
+# Environment variables:
+#   SMS_INSTRUMENT=1            count file opens / bytes read per frame
+#   SMS_METRICS_FILE=path       periodically write the numbers to this file
+#   SMS_METRICS_FORMAT=json     "json" (default) or "prom" (Prometheus text format)
+#   SMS_METRICS_INTERVAL=5      seconds between dumps
+#
+# F3 toggles the on-screen overlay (FPS, p50/p99 frame time, phase breakdown).
+
+OVERLAY_KEY = pygame.K_F3
+HISTORY = 600  # frames kept per screen for percentiles
+QUANTILES = {"p50": "0.5", "p90": "0.9", "p99": "0.99"}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _CountingFile:
+    # Thin proxy that counts what is read through a file object. Text-mode reads
+    # count characters, which equals bytes for the ASCII dataset files.
+    def __init__(self, f, counters):
+        self._f = f
+        self._counters = counters
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._counters["bytes_read"] += len(data)
+        return data
+
+    def readline(self, *args):
+        line = self._f.readline(*args)
+        self._counters["bytes_read"] += len(line)
+        return line
+
+    def readlines(self, *args):
+        lines = self._f.readlines(*args)
+        self._counters["bytes_read"] += sum(len(line) for line in lines)
+        return lines
+
+    def __iter__(self):
+        for line in self._f:
+            self._counters["bytes_read"] += len(line)
+            yield line
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._f.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class FrameTimer:
+    """Frame and phase timings for one screen"""
+
+    def __init__(self, name):
+        self.name = name
+        self.frame_times = deque(maxlen=HISTORY)
+        # Wall time between frame starts, including the clock.tick() wait
+        self.frame_intervals = deque(maxlen=HISTORY)
+        self.phase_times = defaultdict(lambda: deque(maxlen=HISTORY))
+        self.frames = 0
+        self.file_opens = 0
+        self.bytes_read = 0
+        self.last_file_opens = 0
+        self.last_bytes_read = 0
+
+        # Current frame state
+        self.in_frame = False
+        self.interrupted = False
+        self.frame_start = 0.0
+        self.previous_start = None
+        self.last = 0.0
+        self.stack = []
+        self.current = defaultdict(float)
+
+    def charge(self, now):
+        # Give the time since the last transition to the phase on top of the stack
+        if self.stack:
+            self.current[self.stack[-1]] += now - self.last
+        self.last = now
+
+    def fps(self):
+        total = sum(self.frame_intervals)
+        return len(self.frame_intervals) / total if total else 0.0
+
+    def summary(self):
+        frame_ms = [t * 1000 for t in self.frame_times]
+        phases = {}
+        for phase, times in self.phase_times.items():
+            phase_ms = [t * 1000 for t in times]
+            phases[phase] = {
+                "mean": sum(phase_ms) / len(phase_ms) if phase_ms else 0.0,
+                "p50": percentile(phase_ms, 50),
+                "p99": percentile(phase_ms, 99),
+            }
+        return {
+            "frames": self.frames,
+            "fps": self.fps(),
+            "frame_ms": {
+                "p50": percentile(frame_ms, 50),
+                "p90": percentile(frame_ms, 90),
+                "p99": percentile(frame_ms, 99),
+                "max": max(frame_ms) if frame_ms else 0.0,
+            },
+            "phases_ms": phases,
+            "file_opens_total": self.file_opens,
+            "bytes_read_total": self.bytes_read,
+            "file_opens_last_frame": self.last_file_opens,
+            "bytes_read_last_frame": self.last_bytes_read,
+        }
+
+
+class Instrumentation:
+    def __init__(self):
+        self.screens = {}
+        self.active = None
+        self.active_screen = None
+        self.overlay_visible = False
+        self.counting_files = False
+        self.counters = {"file_opens": 0, "bytes_read": 0}
+        self._original_open = builtins.open
+
+        # Replaceable event source (the replay harness feeds scripted events here)
+        self.event_source = pygame.event.get
+        self.frame_listeners = []
+        # Hotkeys handled here are swallowed before the screens see them
+        self.hotkeys = {OVERLAY_KEY: self.toggle_overlay}
+
+        self._overlay_font = None
+        self._overlay_surface = None
+
+        self.dump_path = os.environ.get("SMS_METRICS_FILE")
+        self.dump_format = os.environ.get("SMS_METRICS_FORMAT", "json")
+        self.dump_interval = float(os.environ.get("SMS_METRICS_INTERVAL", "5"))
+        self._last_dump = time.perf_counter()
+
+        if os.environ.get("SMS_INSTRUMENT", "") not in ("", "0") or self.dump_path:
+            self.enable_file_counting()
+
+    # -- file I/O counters ---------------------------------------------------
+
+    def enable_file_counting(self):
+        if self.counting_files:
+            return
+        original_open = self._original_open
+        counters = self.counters
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            f = original_open(file, mode, *args, **kwargs)
+            counters["file_opens"] += 1
+            # Only text reads are proxied; binary files (fonts, images) are
+            # handed straight to libraries that may type-check them, and the
+            # dataset readers count their binary reads (dataset_io.count_read)
+            if "r" in mode and "+" not in mode and "b" not in mode:
+                return _CountingFile(f, counters)
+            return f
+
+        builtins.open = counting_open
+        io.open = counting_open
+        dataset_io.read_hook = self.count_bytes
+        self.counting_files = True
+
+    def disable_file_counting(self):
+        builtins.open = self._original_open
+        io.open = self._original_open
+        dataset_io.read_hook = None
+        self.counting_files = False
+
+    def count_bytes(self, size):
+        self.counters["bytes_read"] += size
+
+    # -- frames and phases ---------------------------------------------------
+
+    def screen(self, name):
+        if name not in self.screens:
+            self.screens[name] = FrameTimer(name)
+        return self.screens[name]
+
+    def begin_frame(self, name, screen=None):
+        timer = self.screen(name)
+        self.active_screen = screen
+        now = time.perf_counter()
+        # A screen opened from inside another screen's event handler (e.g.
+        # DataDisplayWindow from UserManagement) runs its own loop there; the
+        # parent's frame is then meaningless and gets dropped.
+        if self.active is not None and self.active is not timer and self.active.in_frame:
+            self.active.interrupted = True
+        self.active = timer
+        if timer.previous_start is not None and not timer.interrupted and timer.in_frame is False:
+            timer.frame_intervals.append(now - timer.previous_start)
+        timer.previous_start = now
+        timer.in_frame = True
+        timer.interrupted = False
+        timer.frame_start = now
+        timer.last = now
+        timer.stack = ["events"]
+        timer.current = defaultdict(float)
+        self.counters["file_opens"] = 0
+        self.counters["bytes_read"] = 0
+
+    def mark(self, phase):
+        # Switch the top-level phase of the active frame
+        timer = self.active
+        if timer is None or not timer.in_frame:
+            return
+        timer.charge(time.perf_counter())
+        if timer.stack:
+            timer.stack[0] = phase
+        else:
+            timer.stack.append(phase)
+
+    def push(self, phase):
+        # Only the screen loop's thread is charged: time spent in background
+        # loads (loading.py) is not frame time
+        timer = self.active
+        if timer is None or not timer.in_frame or threading.current_thread() is not threading.main_thread():
+            return None
+        timer.charge(time.perf_counter())
+        timer.stack.append(phase)
+        return timer
+
+    def pop(self, timer):
+        if timer is None or not timer.in_frame:
+            return
+        timer.charge(time.perf_counter())
+        if len(timer.stack) > 1:
+            timer.stack.pop()
+
+    def timed(self, phase):
+        """Decorator that charges a function's run time to a phase"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                timer = self.push(phase)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.pop(timer)
+            return wrapper
+        return decorator
+
+    def end_frame(self):
+        timer = self.active
+        if timer is None or not timer.in_frame:
+            return
+        now = time.perf_counter()
+        timer.charge(now)
+        timer.in_frame = False
+        if timer.interrupted:
+            return
+
+        frame_time = now - timer.frame_start
+        timer.frames += 1
+        timer.frame_times.append(frame_time)
+        for phase, seconds in timer.current.items():
+            timer.phase_times[phase].append(seconds)
+        timer.last_file_opens = self.counters["file_opens"]
+        timer.last_bytes_read = self.counters["bytes_read"]
+        timer.file_opens += timer.last_file_opens
+        timer.bytes_read += timer.last_bytes_read
+
+        for listener in self.frame_listeners:
+            listener(timer, frame_time)
+
+        if self.dump_path and now - self._last_dump >= self.dump_interval:
+            self._last_dump = now
+            self.dump(self.dump_path, self.dump_format)
+
+    def poll_events(self):
+        events = []
+        for event in self.event_source():
+            if event.type == pygame.KEYDOWN and event.key in self.hotkeys:
+                self.hotkeys[event.key]()
+                continue
+            events.append(event)
+        return events
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+
+    def flip(self):
+        # Draw the overlay on top of the finished frame, then time the flip
+        if self.overlay_visible:
+            self.draw_overlay(pygame.display.get_surface())
+        self.mark("flip")
+        pygame.display.flip()
+        self.end_frame()
+
+    # -- overlay -------------------------------------------------------------
+
+    def draw_overlay(self, surface):
+        timer = self.active
+        if surface is None or timer is None:
+            return
+        # Every screen calls pygame.quit()/init(), which invalidates fonts, so
+        # the font is rebuilt whenever a new display surface shows up
+        if self._overlay_surface is not surface:
+            self._overlay_font = pygame.font.SysFont('Courier', 13, bold=True)
+            self._overlay_surface = surface
+
+        frame_ms = [t * 1000 for t in timer.frame_times]
+        lines = [
+            f"{timer.name}",
+            f"FPS {timer.fps():5.1f}  p50 {percentile(frame_ms, 50):5.1f}ms  p99 {percentile(frame_ms, 99):5.1f}ms",
+        ]
+        for phase, times in sorted(timer.phase_times.items()):
+            if times:
+                lines.append(f"{phase:<7} {times[-1] * 1000:6.2f}ms")
+        if self.counting_files:
+            lines.append(f"opens {timer.last_file_opens}  read {timer.last_bytes_read}B")
+
+        line_height = 15
+        panel = pygame.Surface((300, line_height * len(lines) + 8))
+        panel.set_alpha(200)
+        panel.fill((0, 0, 0))
+        surface.blit(panel, (5, 5))
+        for i, line in enumerate(lines):
+            text = self._overlay_font.render(line, True, (0, 255, 0))
+            surface.blit(text, (10, 9 + i * line_height))
+
+    # -- metrics dump --------------------------------------------------------
+
+    def snapshot(self):
+        return {name: timer.summary() for name, timer in self.screens.items()}
+
+    def to_prometheus(self):
+        lines = [
+            "# TYPE sms_frames_total counter",
+            "# TYPE sms_fps gauge",
+            "# TYPE sms_frame_time_ms gauge",
+            "# TYPE sms_phase_time_ms gauge",
+            "# TYPE sms_file_opens_total counter",
+            "# TYPE sms_bytes_read_total counter",
+        ]
+        for name, stats in self.snapshot().items():
+            label = f'screen="{name}"'
+            lines.append(f"sms_frames_total{{{label}}} {stats['frames']}")
+            lines.append(f"sms_fps{{{label}}} {stats['fps']:.3f}")
+            for quantile in ("p50", "p90", "p99"):
+                q = QUANTILES[quantile]
+                lines.append(f'sms_frame_time_ms{{{label},quantile="{q}"}} {stats["frame_ms"][quantile]:.3f}')
+            for phase, phase_stats in stats["phases_ms"].items():
+                for quantile in ("p50", "p99"):
+                    q = QUANTILES[quantile]
+                    lines.append(f'sms_phase_time_ms{{{label},phase="{phase}",quantile="{q}"}} '
+                                 f'{phase_stats[quantile]:.3f}')
+            lines.append(f"sms_file_opens_total{{{label}}} {stats['file_opens_total']}")
+            lines.append(f"sms_bytes_read_total{{{label}}} {stats['bytes_read_total']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, fmt="json"):
+        if fmt == "prom":
+            content = self.to_prometheus()
+        else:
+            content = json.dumps({"timestamp": time.time(), "screens": self.snapshot()}, indent=2)
+        # Write then rename so a reader never sees a half-written file
+        tmp_path = path + ".tmp"
+        try:
+            with self._original_open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write metrics to {path}: {e}", file=sys.stderr)
+
+
+metrics = Instrumentation()
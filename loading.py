@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Dataset loads that run on a worker thread, so opening a screen never waits
+# for the files (which can take seconds on a network share).
+#
+#   load = Load(app.load_marks)     # starts at once; returns immediately
+#   ...
+#   if load.done():                 # checked once per frame
+#       rows = load.result()
+#
+# The function is called with progress=load.progress. The data_service calls
+# pass it down to data_store, which calls it after each chunk of a parse:
+# load.rows then holds the rows parsed so far, for screens that show them as
+# they arrive. cancel() stops the load at the next chunk; the store keeps
+# what it had before, so a later load parses the file again.
+
+WORKERS = 2   # loads running at once; more queue up
+
+_executor = None
+_starting = threading.Lock()
+
+
+class Cancelled(Exception):
+    # Raised inside a load that was cancelled
+    pass
+
+
+def executor():
+    global _executor
+    with _starting:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='load')
+        return _executor
+
+
+class Load:
+    def __init__(self, function, *args, **kwargs):
+        self.rows = []   # rows parsed so far; grows until the load is done
+        self.cancelled = threading.Event()
+        self.future = executor().submit(self.run, function, args, kwargs)
+
+    def run(self, function, args, kwargs):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        return function(*args, progress=self.progress, **kwargs)
+
+    def progress(self, rows):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        self.rows = rows
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        # The function's result; raises what it raised
+        return self.future.result()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
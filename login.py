@@ -1,6 +1,9 @@
 import pygame
 import sys
 import os
+from instrumentation import metrics
+import data_service
+from profiling import profiler
 
 class LoginUI:
     def __init__(self):
@@ -101,27 +104,25 @@ class LoginUI:
         # Draw the main rectangle
         pygame.draw.rect(surface, color, rect, border, border_radius=radius)
     
+    @metrics.timed("load")
     def validate_credentials(self):
         # Simple validation - replace with your actual validation logic
         # For now, we'll check against the dataset/passwords.txt file
         try:
-            with open('dataset/passwords.txt', 'r') as file:
-                for line in file:
-                    username, password = line.strip().split(',')
-                    if username == self.username and password == self.password:
-                        return True
-            return False
+            return data_service.call('login', username=self.username, password=self.password)
         except FileNotFoundError:
             print("Passwords file not found")
             return False
     
+    @profiler.screen("LoginUI")
     def run(self):
         clock = pygame.time.Clock()
         running = True
         
         while running:
+            metrics.begin_frame("LoginUI", self)
             # Handle events
-            for event in pygame.event.get():
+            for event in metrics.poll_events():
                 if event.type == pygame.QUIT:
                     running = False
                 
@@ -193,6 +194,7 @@ class LoginUI:
                                 self.password += event.unicode
             
             # Clear the screen with white background
+            metrics.mark("draw")
             self.screen.fill(self.background_color)
             
             # Draw title
@@ -258,7 +260,7 @@ class LoginUI:
             self.screen.blit(back_text, back_text_rect)
             
             # Update the display
-            pygame.display.flip()
+            metrics.flip()
             
             # Cap the frame rate
             clock.tick(60)
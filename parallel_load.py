@@ -0,0 +1,138 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dataset import GRADES_FILE
+from dataset_io import reading, count_read
+import archive
+import shards
+
+# Parallel parse of grades.txt straight into code arrays.
+#
+#   students, subjects, row_students, row_subjects, row_grades = read_grade_codes()
+#
+# The file is split into byte ranges that start and end on line breaks, and
+# each range is parsed in a worker process into its own username / subject
+# dictionaries plus int32 code and float grade arrays; no per-row tuples are
+# kept. The parent merges the dictionaries in file order and remaps each
+# range's codes with one NumPy lookup, so codes are numbered in first-seen
+# order exactly as GradeMatrix numbers them.
+#
+# Files under PARALLEL_BYTES, or a single core, are parsed in this process:
+# starting workers costs more than it saves there. A sharded grades file
+# (shards.py) is split shard by shard, so the shards parse in parallel. A
+# compressed archive (archive.py) is split on its block boundaries, and each
+# worker decompresses its own blocks.
+
+PARALLEL_BYTES = 16 << 20   # smaller files are parsed in one process
+RANGE_BYTES = 4 << 20       # smallest range handed to a worker
+ATTEMPTS = 3                # parses retried when the file is replaced meanwhile
+
+
+class FileReplaced(Exception):
+    # The file a worker opened is not the one the parent split
+    pass
+
+
+def identity(st):
+    return (st.st_dev, st.st_ino, st.st_size)
+
+
+def line_ranges(path, size, count):
+    # [(start, end), ...] covering the first `size` bytes in about `count`
+    # pieces, each starting at the beginning of a line
+    bounds = [0]
+    with open(path, 'rb') as file:
+        for i in range(1, count):
+            file.seek(max(size * i // count - 1, bounds[-1]))
+            file.readline()
+            bound = min(file.tell(), size)
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def parse_range(path, expected, start, end):
+    # One range of grades.txt -> (usernames, subjects, student codes,
+    # subject codes, grades), codes indexing this range's own lists
+    with open(path, 'rb') as file:
+        if identity(os.fstat(file.fileno()))[:2] != expected[:2]:
+            raise FileReplaced(path)
+        file.seek(start)
+        data = file.read(end - start)
+    count_read(len(data))
+    codec = archive.codec_of(path)
+    if codec is not None:
+        data = codec.decompress(data)
+    students = {}
+    subjects = {}
+    student_codes = []
+    subject_codes = []
+    grades = []
+    for line in data.decode().splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        username, subject, grade = line.split(',')
+        student_codes.append(students.setdefault(username, len(students)))
+        subject_codes.append(subjects.setdefault(subject, len(subjects)))
+        grades.append(grade)
+    return (list(students), list(subjects), np.array(student_codes, dtype=np.int32),
+            np.array(subject_codes, dtype=np.int32), np.array(grades, dtype=float))
+
+
+def merge(parts):
+    # Per-range results, in file order -> (username -> code, subject -> code,
+    # student codes, subject codes, grades) over the whole file
+    students = {}
+    subjects = {}
+    row_students = []
+    row_subjects = []
+    row_grades = []
+    for names, subject_names, student_codes, subject_codes, grades in parts:
+        student_map = np.array([students.setdefault(name, len(students)) for name in names], dtype=np.int64)
+        subject_map = np.array([subjects.setdefault(name, len(subjects)) for name in subject_names], dtype=np.int64)
+        row_students.append(student_map[student_codes])
+        row_subjects.append(subject_map[subject_codes])
+        row_grades.append(grades)
+    if not parts:
+        return students, subjects, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return (students, subjects, np.concatenate(row_students), np.concatenate(row_subjects),
+            np.concatenate(row_grades))
+
+
+def read_grade_codes(path=GRADES_FILE, workers=None):
+    # The grades file (all its shards) as code arrays (see merge);
+    # workers=None uses every core
+    workers = workers or os.cpu_count() or 1
+    for attempt in range(ATTEMPTS):
+        try:
+            jobs = []   # parse_range arguments, in file order
+            for file_path in shards.paths(path):
+                try:
+                    with reading(file_path):
+                        st = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                count = min(workers, st.st_size // RANGE_BYTES) if st.st_size >= PARALLEL_BYTES else 1
+                split = archive.block_ranges if archive.codec_of(file_path) else line_ranges
+                jobs.extend((file_path, identity(st), start, end)
+                            for start, end in split(file_path, st.st_size, max(count, 1)))
+            total = sum(end - start for _, _, start, end in jobs)
+            if workers == 1 or len(jobs) <= 1 or total < PARALLEL_BYTES:
+                return merge([parse_range(*job) for job in jobs])
+
+            # fork hands the workers this module without re-importing the app
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as executor:
+                futures = [executor.submit(parse_range, *job) for job in jobs]
+                return merge([future.result() for future in futures])
+        except FileNotFoundError:
+            return merge([])
+        except FileReplaced:
+            # Rewritten (a delete) while the workers were reading; start over
+            if attempt == ATTEMPTS - 1:
+                raise
@@ -0,0 +1,205 @@
+import os
+import gc
+import sys
+import time
+import pstats
+import cProfile
+import functools
+import tracemalloc
+import pygame
+import shards
+from dataset import USERS_FILE
+from instrumentation import metrics
+
+# On-demand cProfile / tracemalloc capture per screen.
+#
+# Screen loops are wrapped with @profiler.screen("UserManagement"). Profiling is
+# switched on for every screen with an environment variable:
+#
+#   SMS_PROFILE=cpu         cProfile only
+#   SMS_PROFILE=mem         tracemalloc only
+#   SMS_PROFILE=cpu,mem     both (also "all")
+#   SMS_PROFILE_DIR=path    where reports go (default: profiles/)
+#
+# or for the current screen only by pressing F9 (press again to stop early).
+# When the screen exits the report is written, labelled by screen name and
+# dataset size:
+#
+#   <screen>_<N>users_<time>.pstats    load with pstats / snakeviz
+#   <screen>_<N>users_<time>.cpu.txt   top functions by cumulative time
+#   <screen>_<N>users_<time>.mem.txt   top allocations, growth while the screen
+#                                      was open, open figures and live windows
+
+PROFILE_KEY = pygame.K_F9
+TOP_N = 30
+
+# Objects we suspect of piling up over a long admin session
+SUSPECT_CLASSES = ("DataDisplayWindow", "UserManagement", "MenuUI", "LoginUI", "Figure")
+
+
+def dataset_scale(path=USERS_FILE):
+    # Count lines in binary chunks, over every shard of the file; cheap even
+    # for large user files
+    count = 0
+    for shard in shards.paths(path):
+        try:
+            with open(shard, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    count += chunk.count(b'\n')
+        except FileNotFoundError:
+            pass
+    return count
+
+
+def count_suspects():
+    counts = dict.fromkeys(SUSPECT_CLASSES, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+
+def open_pyplot_figures():
+    # Only look if pyplot is already in use; don't import it just for this
+    plt = sys.modules.get('matplotlib.pyplot')
+    return len(plt.get_fignums()) if plt else 0
+
+
+class ScreenProfile:
+    """One capture of a single screen's loop"""
+
+    def __init__(self, screen, cpu=True, mem=True, output_dir='profiles'):
+        self.screen = screen
+        self.cpu = cpu
+        self.mem = mem
+        self.output_dir = output_dir
+        self.profile = cProfile.Profile() if cpu else None
+        self.start_snapshot = None
+        self.started_tracemalloc = False
+        self.start_time = time.time()
+
+    def start(self):
+        if self.mem:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self.started_tracemalloc = True
+            self.start_snapshot = tracemalloc.take_snapshot()
+        if self.profile:
+            self.profile.enable()
+
+    def pause(self):
+        if self.profile:
+            self.profile.disable()
+
+    def resume(self):
+        if self.profile:
+            self.profile.enable()
+
+    def label(self):
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.start_time))
+        return f"{self.screen}_{dataset_scale()}users_{stamp}"
+
+    def stop(self):
+        if self.profile:
+            self.profile.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, self.label())
+
+        if self.profile:
+            self.profile.dump_stats(base + '.pstats')
+            with open(base + '.cpu.txt', 'w') as f:
+                stats = pstats.Stats(self.profile, stream=f)
+                stats.sort_stats('cumulative').print_stats(TOP_N)
+
+        if self.mem and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ])
+            current, peak = tracemalloc.get_traced_memory()
+            with open(base + '.mem.txt', 'w') as f:
+                f.write(f"Screen: {self.screen}\n")
+                f.write(f"Duration: {time.time() - self.start_time:.1f}s\n")
+                f.write(f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+                f.write(f"Open pyplot figures: {open_pyplot_figures()}\n")
+                f.write("Live objects: " + ", ".join(f"{k}={v}" for k, v in count_suspects().items()) + "\n")
+
+                f.write(f"\nTop {TOP_N} allocations by line:\n")
+                for stat in snapshot.statistics('lineno')[:TOP_N]:
+                    f.write(f"  {stat}\n")
+
+                if self.start_snapshot is not None:
+                    f.write(f"\nTop {TOP_N} growth since the screen opened:\n")
+                    for stat in snapshot.compare_to(self.start_snapshot, 'lineno')[:TOP_N]:
+                        f.write(f"  {stat}\n")
+
+                    # Full traceback for the biggest grower points at the caller
+                    growth = snapshot.compare_to(self.start_snapshot, 'traceback')
+                    if growth:
+                        f.write("\nLargest growth traceback:\n")
+                        for line in growth[0].traceback.format():
+                            f.write(f"  {line}\n")
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+
+        print(f"Profile for {self.screen} written to {base}.*")
+
+
+class Profiler:
+    def __init__(self):
+        modes = os.environ.get('SMS_PROFILE', '').lower()
+        if modes in ('1', 'all', 'true'):
+            modes = 'cpu,mem'
+        self.modes = {m.strip() for m in modes.split(',') if m.strip()}
+        self.output_dir = os.environ.get('SMS_PROFILE_DIR', 'profiles')
+        # One [screen, ScreenProfile or None] entry per nested screen loop
+        self.stack = []
+        metrics.hotkeys[PROFILE_KEY] = self.toggle
+
+    def new_session(self, screen, cpu=None, mem=None):
+        cpu = 'cpu' in self.modes if cpu is None else cpu
+        mem = 'mem' in self.modes if mem is None else mem
+        return ScreenProfile(screen, cpu, mem, self.output_dir)
+
+    def screen(self, name):
+        """Decorator for a screen's run loop"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                session = self.new_session(name) if self.modes else None
+                # Screens open other screens from inside their loop. Only one
+                # cProfile can run at a time, so the parent pauses meanwhile.
+                parent = next((e[1] for e in reversed(self.stack) if e[1]), None)
+                if parent:
+                    parent.pause()
+                entry = [name, session]
+                self.stack.append(entry)
+                if session:
+                    session.start()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.stack.pop()
+                    if entry[1]:
+                        entry[1].stop()
+                    if parent:
+                        parent.resume()
+            return wrapper
+        return decorator
+
+    def toggle(self):
+        # F9: start profiling the current screen, or stop and write it out
+        if not self.stack:
+            return
+        entry = self.stack[-1]
+        if entry[1] is None:
+            entry[1] = self.new_session(entry[0], cpu=True, mem=True)
+            entry[1].start()
+            print(f"Profiling {entry[0]}... press F9 again or leave the screen to save")
+        else:
+            entry[1].stop()
+            entry[1] = None
+
+
+profiler = Profiler()
@@ -0,0 +1,327 @@
+import math
+import numpy as np
+import pygame
+from aggregates import summarize_student_avgs
+from grade_matrix import GradeMatrix
+
+# Lightweight chart renderer that draws the dashboard charts with pygame.draw
+# primitives instead of going through matplotlib. It covers the four marks
+# charts and the ECA pie and is meant for interactive use on slow machines;
+# matplotlib (charts.py) is still used for the high-quality report exports.
+#
+# Select it with SMS_CHART_BACKEND=native.
+
+BACKGROUND = (240, 248, 255)  # AliceBlue
+TEXT = (47, 79, 79)           # DarkSlateGray
+AXIS = (0, 0, 0)
+GRID = (220, 220, 220)
+WHITE = (255, 255, 255)
+
+PRIMARY = (41, 128, 185)
+SECONDARY = (46, 204, 113)
+GRADE_COLORS = [(60, 179, 113), (41, 128, 185), (255, 182, 193), (155, 89, 182), (231, 76, 60)]
+# matplotlib's Pastel1 palette, as used for the ECA pie
+PASTEL1 = [(251, 180, 174), (179, 205, 227), (204, 235, 197), (222, 203, 228), (254, 217, 166),
+           (255, 255, 204), (229, 216, 189), (253, 218, 236), (242, 242, 242)]
+
+# Colour scales for the heatmaps, approximating matplotlib's Blues, RdYlGn and
+# coolwarm colormaps
+BLUES = [(247, 251, 255), (107, 174, 214), (8, 48, 107)]
+RDYLGN = [(215, 48, 39), (254, 224, 139), (26, 152, 80)]
+COOLWARM = [(59, 76, 192), (221, 221, 221), (180, 4, 38)]
+
+
+def color_scale(stops, t):
+    # Colour at t (0-1) along evenly spaced colour stops
+    t = min(1.0, max(0.0, t)) * (len(stops) - 1)
+    i = min(int(t), len(stops) - 2)
+    frac = t - i
+    return tuple(int(a + (b - a) * frac) for a, b in zip(stops[i], stops[i + 1]))
+
+
+# Grades are 0-100, so the value axis is fixed; no autoscaling per frame.
+# Only the student count histogram needs a data-dependent axis.
+Y_MAX = 100
+Y_STEPS = 5
+
+
+def nice_max(value):
+    # Smallest 1/2/5 x 10^k multiple of Y_STEPS at or above value
+    if value <= 0:
+        return Y_STEPS
+    magnitude = 10 ** max(0, math.floor(math.log10(value / Y_STEPS)))
+    for factor in (1, 2, 5, 10):
+        if factor * magnitude * Y_STEPS >= value:
+            return factor * magnitude * Y_STEPS
+    return 10 * magnitude * Y_STEPS
+
+
+class NativeChartRenderer:
+    def __init__(self, title_font=None, label_font=None, tick_font=None):
+        if not pygame.font.get_init():
+            pygame.font.init()
+        self.title_font = title_font or pygame.font.SysFont('Helvetica', 16)
+        self.label_font = label_font or pygame.font.SysFont('Helvetica', 14)
+        self.tick_font = tick_font or pygame.font.SysFont('Helvetica', 11)
+        # Rendered text is cached; the same tick and category labels are drawn
+        # again on every chart switch
+        self.text_cache = {}
+
+    def text(self, font, value, color=TEXT, angle=0):
+        key = (id(font), value, color, angle)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            surface = font.render(value, True, color)
+            if angle:
+                surface = pygame.transform.rotate(surface, angle)
+            if len(self.text_cache) > 4096:
+                self.text_cache.clear()
+            self.text_cache[key] = surface
+        return surface
+
+    # -- shared layout -------------------------------------------------------
+
+    def new_surface(self, size, title):
+        surface = pygame.Surface(size)
+        surface.fill(BACKGROUND)
+        title_surf = self.text(self.title_font, title)
+        surface.blit(title_surf, title_surf.get_rect(center=(size[0] // 2, 18)))
+        return surface
+
+    @staticmethod
+    def plot_rect(size):
+        return pygame.Rect(60, 40, size[0] - 80, size[1] - 130)
+
+    def plot_area(self, surface, xlabel, ylabel, y_max=Y_MAX):
+        width, height = surface.get_size()
+        plot = self.plot_rect((width, height))
+        pygame.draw.rect(surface, WHITE, plot)
+
+        # Y axis, fixed 0-100 for grades
+        for step in range(Y_STEPS + 1):
+            value = y_max * step // Y_STEPS
+            y = self.y_pos(plot, value, y_max)
+            pygame.draw.line(surface, GRID, (plot.left, y), (plot.right, y))
+            tick = self.text(self.tick_font, str(value))
+            surface.blit(tick, tick.get_rect(midright=(plot.left - 5, y)))
+        pygame.draw.rect(surface, AXIS, plot, 1)
+
+        ylabel_surf = self.text(self.label_font, ylabel, angle=90)
+        surface.blit(ylabel_surf, ylabel_surf.get_rect(center=(15, plot.centery)))
+        xlabel_surf = self.text(self.label_font, xlabel)
+        surface.blit(xlabel_surf, xlabel_surf.get_rect(center=(plot.centerx, height - 12)))
+        return plot
+
+    @staticmethod
+    def y_pos(plot, value, y_max=Y_MAX):
+        return plot.bottom - int(value / y_max * plot.height)
+
+    def bar_index_at(self, size, count, pos):
+        # Index of the bar / category under pos on a chart of this size, or None
+        plot = self.plot_rect(size)
+        if not count or not plot.collidepoint(pos):
+            return None
+        return min(count - 1, int((pos[0] - plot.left) * count / plot.width))
+
+    def category_labels(self, surface, plot, labels, slot):
+        # Rotated 45 degrees like the matplotlib charts; with many categories
+        # only every n-th label is drawn so they don't overlap
+        step = max(1, math.ceil(self.tick_font.get_height() / max(slot, 1)))
+        for i in range(0, len(labels), step):
+            label = self.text(self.tick_font, labels[i], angle=45)
+            x = plot.left + int((i + 0.5) * slot)
+            surface.blit(label, label.get_rect(topright=(x + 4, plot.bottom + 4)))
+
+    # -- chart types ---------------------------------------------------------
+
+    def bar_chart(self, size, title, xlabel, ylabel, labels, values, color=PRIMARY, y_max=Y_MAX, fmt='{:.1f}'):
+        surface = self.new_surface(size, title)
+        plot = self.plot_area(surface, xlabel, ylabel, y_max)
+        if not values:
+            return surface
+        slot = plot.width / len(values)
+        bar_width = max(1, int(slot * 0.8))
+        for i, value in enumerate(values):
+            x = plot.left + int(i * slot + (slot - bar_width) / 2)
+            top = self.y_pos(plot, value, y_max)
+            pygame.draw.rect(surface, color, (x, top, bar_width, plot.bottom - top))
+            # Value labels only when they fit above the bar
+            value_text = self.text(self.tick_font, fmt.format(value))
+            if value_text.get_width() <= slot:
+                surface.blit(value_text, value_text.get_rect(midbottom=(x + bar_width // 2, top)))
+        self.category_labels(surface, plot, labels, slot)
+        return surface
+
+    def line_chart(self, size, title, xlabel, ylabel, labels, values, color=SECONDARY):
+        surface = self.new_surface(size, title)
+        plot = self.plot_area(surface, xlabel, ylabel)
+        if not values:
+            return surface
+        slot = plot.width / len(values)
+        points = [(plot.left + int((i + 0.5) * slot), self.y_pos(plot, value)) for i, value in enumerate(values)]
+        if len(points) > 1:
+            pygame.draw.lines(surface, color, False, points, 2)
+        for point, value in zip(points, values):
+            pygame.draw.circle(surface, color, point, 4)
+            value_text = self.text(self.tick_font, f'{value:.1f}')
+            surface.blit(value_text, value_text.get_rect(midbottom=(point[0], point[1] - 5)))
+        self.category_labels(surface, plot, labels, slot)
+        return surface
+
+    def pie_chart(self, size, title, labels, values, colors):
+        surface = self.new_surface(size, title)
+        total = float(sum(values))
+        if not total:
+            return surface
+        width, height = size
+        center = (width // 2, height // 2 + 15)
+        radius = int(min(width, height - 40) * 0.38)
+
+        # Counter-clockwise from 12 o'clock, same as the matplotlib version
+        angle = 90.0
+        for i, (label, value) in enumerate(zip(labels, values)):
+            sweep = 360.0 * value / total
+            color = colors[i % len(colors)]
+            if sweep > 0:
+                steps = max(2, int(sweep / 3))
+                points = [center] + [
+                    (center[0] + radius * math.cos(math.radians(angle + sweep * s / steps)),
+                     center[1] - radius * math.sin(math.radians(angle + sweep * s / steps)))
+                    for s in range(steps + 1)
+                ]
+                pygame.draw.polygon(surface, color, points)
+
+            middle = math.radians(angle + sweep / 2)
+            dx, dy = math.cos(middle), -math.sin(middle)
+            label_surf = self.text(self.tick_font, label)
+            label_pos = (center[0] + 1.1 * radius * dx, center[1] + 1.1 * radius * dy)
+            if dx > 0:
+                surface.blit(label_surf, label_surf.get_rect(midleft=label_pos))
+            else:
+                surface.blit(label_surf, label_surf.get_rect(midright=label_pos))
+            pct = self.text(self.tick_font, f'{100.0 * value / total:.1f}%')
+            surface.blit(pct, pct.get_rect(center=(center[0] + 0.6 * radius * dx, center[1] + 0.6 * radius * dy)))
+            angle += sweep
+        return surface
+
+    def box_plot(self, size, title, xlabel, ylabel, labels, stats, color=PRIMARY):
+        surface = self.new_surface(size, title)
+        plot = self.plot_area(surface, xlabel, ylabel)
+        if not stats:
+            return surface
+        slot = plot.width / len(stats)
+        box_width = max(4, int(slot * 0.5))
+        for i, s in enumerate(stats):
+            x = plot.left + int((i + 0.5) * slot)
+            q1, q3 = self.y_pos(plot, s['q1']), self.y_pos(plot, s['q3'])
+            low, high = self.y_pos(plot, s['whislo']), self.y_pos(plot, s['whishi'])
+            cap = box_width // 4
+            pygame.draw.line(surface, AXIS, (x, q1), (x, low))
+            pygame.draw.line(surface, AXIS, (x, q3), (x, high))
+            pygame.draw.line(surface, AXIS, (x - cap, low), (x + cap, low))
+            pygame.draw.line(surface, AXIS, (x - cap, high), (x + cap, high))
+            box = pygame.Rect(x - box_width // 2, q3, box_width, max(1, q1 - q3))
+            pygame.draw.rect(surface, color, box)
+            pygame.draw.rect(surface, AXIS, box, 1)
+            median = self.y_pos(plot, s['med'])
+            pygame.draw.line(surface, (255, 127, 14), (box.left, median), (box.right, median), 2)
+            for flier in s['fliers']:
+                pygame.draw.circle(surface, AXIS, (x, self.y_pos(plot, flier)), 3, 1)
+        self.category_labels(surface, plot, labels, slot)
+        return surface
+
+    def heatmap(self, size, title, rows, columns, values, stops=BLUES, vmin=None, vmax=None, fmt='{:.0f}'):
+        surface = self.new_surface(size, title)
+        values = np.asarray(values, dtype=float)
+        if not values.size:
+            return surface
+        finite = values[~np.isnan(values)]
+        vmin = (finite.min() if finite.size else 0) if vmin is None else vmin
+        vmax = (finite.max() if finite.size else 1) if vmax is None else vmax
+        span = (vmax - vmin) or 1
+
+        column_labels = [self.text(self.tick_font, label, angle=45) for label in columns]
+        row_labels = [self.text(self.tick_font, label) for label in rows]
+        left = max(label.get_width() for label in row_labels) + 10
+        bottom = max(label.get_height() for label in column_labels) + 10
+        plot = pygame.Rect(left, 40, size[0] - left - 20, size[1] - 40 - bottom)
+        cell_w = plot.width / len(columns)
+        cell_h = plot.height / len(rows)
+        show_values = values.size <= 150 and self.tick_font.get_height() < cell_h
+
+        for i in range(len(rows)):
+            y = plot.top + int(i * cell_h)
+            height = plot.top + int((i + 1) * cell_h) - y
+            for j in range(len(columns)):
+                x = plot.left + int(j * cell_w)
+                rect = pygame.Rect(x, y, plot.left + int((j + 1) * cell_w) - x, height)
+                value = values[i, j]
+                if np.isnan(value):
+                    pygame.draw.rect(surface, WHITE, rect)
+                    continue
+                fill = color_scale(stops, (value - vmin) / span)
+                pygame.draw.rect(surface, fill, rect)
+                if show_values:
+                    dark = 0.299 * fill[0] + 0.587 * fill[1] + 0.114 * fill[2] < 128
+                    value_text = self.text(self.tick_font, fmt.format(value), WHITE if dark else TEXT)
+                    surface.blit(value_text, value_text.get_rect(center=rect.center))
+        pygame.draw.rect(surface, AXIS, plot, 1)
+
+        # As many row labels as fit without overlapping
+        step = max(1, math.ceil(self.tick_font.get_height() / cell_h))
+        for i in range(0, len(rows), step):
+            surface.blit(row_labels[i], row_labels[i].get_rect(midright=(plot.left - 5, plot.top + int((i + 0.5) * cell_h))))
+        for j, label in enumerate(column_labels):
+            surface.blit(label, label.get_rect(topright=(plot.left + int((j + 0.5) * cell_w) + 4, plot.bottom + 4)))
+        return surface
+
+    # -- dashboard charts ----------------------------------------------------
+
+    def student_avg_chart(self, summary, size):
+        # Draws a summarize_student_avgs() result
+        if summary['view'] == 'histogram':
+            y_max, fmt = nice_max(max(summary['values'], default=0)), '{:.0f}'
+        else:
+            y_max, fmt = Y_MAX, '{:.1f}'
+        return self.bar_chart(size, summary['title'], summary['xlabel'], summary['ylabel'],
+                              summary['labels'], summary['values'], y_max=y_max, fmt=fmt)
+
+    def marks_chart(self, kind, data, size):
+        # data is a GradeMatrix, or for student_avg a summarize_student_avgs()
+        # result (built from the matrix when not given)
+        if kind == 'student_avg':
+            if isinstance(data, GradeMatrix):
+                data = summarize_student_avgs(data.student_averages())
+            return self.student_avg_chart(data, size)
+
+        matrix = data
+        if kind == 'subject_perf':
+            subject_avgs = matrix.subject_averages()
+            return self.line_chart(size, 'Subject-wise Performance', 'Subject', 'Average Grade',
+                                   list(subject_avgs), list(subject_avgs.values()))
+        elif kind == 'grade_dist':
+            grade_ranges = matrix.grade_distribution()
+            return self.pie_chart(size, 'Grade Distribution', list(grade_ranges),
+                                  list(grade_ranges.values()), GRADE_COLORS)
+        elif kind == 'subject_dist':
+            return self.box_plot(size, 'Grade Distribution by Subject', 'Subject', 'Grade',
+                                 matrix.subjects, matrix.subject_box_stats)
+        elif kind == 'heatmap':
+            rows, values = matrix.band_means()
+            return self.heatmap(size, 'Grades by Student and Subject', rows, matrix.subjects, values,
+                                RDYLGN, 0, 100)
+        elif kind == 'correlation':
+            return self.heatmap(size, 'Subject Correlation', matrix.subjects, matrix.subjects,
+                                matrix.correlation, COOLWARM, -1, 1, '{:.2f}')
+        raise ValueError(f"Unknown marks chart: {kind}")
+
+    def eca_chart(self, counts, size, title='ECA Activity Distribution'):
+        # Pastel1 sampled evenly over the activities, as colormaps['Pastel1'](np.linspace(0, 1, n))
+        n = len(counts)
+        colors = [PASTEL1[min(len(PASTEL1) - 1, int(i / max(n - 1, 1) * len(PASTEL1)))]
+                  for i in range(n)] or PASTEL1
+        return self.pie_chart(size, title, list(counts), list(counts.values()), colors)
+
+    def club_overlap_chart(self, data, size):
+        activities, matrix = data
+        return self.heatmap(size, 'Club Overlap (students in both)', activities, activities, matrix)
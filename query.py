@@ -0,0 +1,166 @@
+import re
+import numpy as np
+from dataset import file_version, ECA_FILE, GRADES_FILE
+from eca_index import load_eca_index
+from grade_matrix import load_grade_matrix
+
+# Student queries over the grade matrix and the ECA index.
+#
+#   Mathematics < 60 and in Football Team
+#   average > 90
+#   3+ subjects > 90
+#   clubs >= 2 and not in Chess Club
+#
+# Clauses are joined with "and". Grade clauses become NumPy comparisons over
+# a whole column (one boolean mask per clause), ECA clauses are combined as
+# bitset intersections in the ECA index and turned into a mask once, so a
+# query costs a handful of vectorized passes however many students there are.
+
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '=': np.equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+_OP = r'(<=|>=|!=|==|<|>|=)'
+_NUMBER = r'(-?\d+(?:\.\d+)?)'
+
+IN_CLAUSE = re.compile(r'^(not\s+)?in\s+(.+)$', re.IGNORECASE)
+COUNT_CLAUSE = re.compile(r'^(\d+)\+\s*subjects?\s*' + _OP + r'\s*' + _NUMBER + '$', re.IGNORECASE)
+CLUBS_CLAUSE = re.compile(r'^clubs\s*' + _OP + r'\s*' + _NUMBER + '$', re.IGNORECASE)
+FIELD_CLAUSE = re.compile(r'^(.+?)\s*' + _OP + r'\s*' + _NUMBER + '$')
+AND = re.compile(r'\s+and\s+', re.IGNORECASE)
+
+
+class QueryError(ValueError):
+    pass
+
+
+class QueryData:
+    # Students from grades.txt and eca.txt as rows; the grade matrix rows come
+    # first in the same order, followed by students who only have activities
+
+    def __init__(self, matrix, eca):
+        self.matrix = matrix
+        self.eca = eca
+        self.subjects = matrix.subjects
+        row_of = {username: row for row, username in enumerate(matrix.students)}
+        extra = [username for username in eca.students if username not in row_of]
+        self.usernames = list(matrix.students) + extra
+        missing = np.full((len(extra), len(matrix.subjects)), np.nan)
+        self.grades = np.vstack([matrix.grades, missing])
+        self.averages = np.concatenate([matrix.student_means, np.full(len(extra), np.nan)])
+
+        row_of.update((username, len(matrix.students) + i) for i, username in enumerate(extra))
+        # ECA student code -> row here
+        self.eca_rows = np.array([row_of[username] for username in eca.students], dtype=np.int64)
+        self.clubs = np.zeros(len(self.usernames), dtype=np.int64)
+        self.clubs[self.eca_rows] = [len(codes) for codes in eca.student_activities]
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def bits_to_mask(self, bits):
+        # ECA bitset (bit = ECA student code) -> boolean mask over the rows
+        n = len(self.eca.students)
+        raw = np.frombuffer(bits.to_bytes((n + 7) // 8 or 1, 'little'), dtype=np.uint8)
+        members = np.unpackbits(raw, bitorder='little')[:n].astype(bool)
+        mask = np.zeros(len(self.usernames), dtype=bool)
+        mask[self.eca_rows[members]] = True
+        return mask
+
+    def subject_column(self, name):
+        for column, subject in enumerate(self.subjects):
+            if subject.lower() == name.lower():
+                return column
+        raise QueryError(f"Unknown subject: {name}")
+
+    def activity(self, name):
+        for activity in self.eca.activities:
+            if activity.lower() == name.lower():
+                return activity
+        raise QueryError(f"Unknown activity: {name}")
+
+
+class Query:
+    def __init__(self, text):
+        self.text = text.strip()
+        self.clauses = [self.parse_clause(clause) for clause in AND.split(self.text)] if self.text else []
+
+    @staticmethod
+    def parse_clause(clause):
+        clause = clause.strip()
+        match = IN_CLAUSE.match(clause)
+        if match:
+            return ('eca', match.group(2).strip(), bool(match.group(1)))
+        match = COUNT_CLAUSE.match(clause)
+        if match:
+            return ('count', int(match.group(1)), match.group(2), float(match.group(3)))
+        match = CLUBS_CLAUSE.match(clause)
+        if match:
+            return ('clubs', match.group(1), float(match.group(2)))
+        match = FIELD_CLAUSE.match(clause)
+        if match:
+            return ('field', match.group(1).strip(), match.group(2), float(match.group(3)))
+        raise QueryError(f"Can't read: {clause}")
+
+    def subjects(self, data):
+        # Subjects the query mentions, for showing next to the results
+        return [data.subjects[data.subject_column(c[1])] for c in self.clauses
+                if c[0] == 'field' and c[1].lower() not in ('average', 'avg')]
+
+    def mask(self, data):
+        mask = np.ones(len(data), dtype=bool)
+        members = None      # intersection of the "in" clauses, as a bitset
+        excluded = 0        # union of the "not in" clauses
+        with np.errstate(invalid='ignore'):
+            for clause in self.clauses:
+                kind = clause[0]
+                if kind == 'eca':
+                    bits = data.eca.bits(data.activity(clause[1]))
+                    if clause[2]:
+                        excluded |= bits
+                    else:
+                        members = bits if members is None else members & bits
+                elif kind == 'count':
+                    _, needed, op, value = clause
+                    mask &= OPERATORS[op](data.grades, value).sum(axis=1) >= needed
+                elif kind == 'clubs':
+                    _, op, value = clause
+                    mask &= OPERATORS[op](data.clubs, value)
+                else:
+                    _, field, op, value = clause
+                    if field.lower() in ('average', 'avg'):
+                        values = data.averages
+                    else:
+                        values = data.grades[:, data.subject_column(field)]
+                    # Comparisons with NaN (no mark) are False
+                    mask &= OPERATORS[op](values, value)
+        if members is not None:
+            mask &= data.bits_to_mask(members)
+        if excluded:
+            mask &= ~data.bits_to_mask(excluded)
+        return mask
+
+    def run(self, data):
+        # Matching rows, best average first (students without marks last)
+        rows = np.flatnonzero(self.mask(data))
+        order = np.argsort(-data.averages[rows], kind='stable')
+        return rows[order]
+
+
+_cache = {}
+
+
+def load_query_data(grades_path=GRADES_FILE, eca_path=ECA_FILE):
+    # QueryData for the current versions of the grades and ECA files
+    version = (file_version(grades_path), file_version(eca_path))
+    cached = _cache.get((grades_path, eca_path))
+    if cached and cached[0] == version:
+        return cached[1]
+    data = QueryData(load_grade_matrix(grades_path), load_eca_index(eca_path))
+    _cache[(grades_path, eca_path)] = (version, data)
+    return data
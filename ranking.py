@@ -0,0 +1,144 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+from dataset import GRADES_FILE, file_version
+from grade_matrix import load_grade_matrix
+
+# Class leaderboard: student averages and per-subject grades kept in sorted
+# arrays, so a student's rank or percentile is a binary search and the top or
+# bottom k students a slice, without re-aggregating grades.txt.
+#
+# load_leaderboard() keeps one Leaderboard per version of the grades file.
+# Writes that add or delete a student update it in place (record_change)
+# instead of rebuilding it from the whole file.
+
+
+class Ranking:
+    # Parallel lists sorted by score ascending, plus username -> score
+
+    def __init__(self, usernames=(), scores=()):
+        order = np.argsort(np.asarray(scores, dtype=float), kind='stable')
+        self.names = [usernames[i] for i in order]
+        self.scores = [float(scores[i]) for i in order]
+        self.by_name = dict(zip(self.names, self.scores))
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, username):
+        return username in self.by_name
+
+    def add(self, username, score):
+        if username in self.by_name:
+            self.remove(username)
+        index = bisect_right(self.scores, score)
+        self.scores.insert(index, score)
+        self.names.insert(index, username)
+        self.by_name[username] = score
+
+    def remove(self, username):
+        score = self.by_name.pop(username, None)
+        if score is None:
+            return False
+        # Search only among the entries with the same score
+        index = self.names.index(username, bisect_left(self.scores, score), bisect_right(self.scores, score))
+        del self.scores[index]
+        del self.names[index]
+        return True
+
+    def rank(self, username):
+        # 1 = best; students with equal scores share a rank
+        score = self.by_name.get(username)
+        if score is None:
+            return None
+        return len(self.scores) - bisect_right(self.scores, score) + 1
+
+    def percentile(self, username):
+        # Share of students (0-100) with this score or lower, as in
+        # GradeMatrix.percentile_ranks
+        score = self.by_name.get(username)
+        if score is None:
+            return None
+        return bisect_right(self.scores, score) * 100.0 / len(self.scores)
+
+    def top(self, k):
+        # [(username, score), ...] best first
+        start = max(0, len(self.scores) - k)
+        return list(zip(reversed(self.names[start:]), reversed(self.scores[start:])))
+
+    def bottom(self, k):
+        # [(username, score), ...] lowest first
+        return list(zip(self.names[:k], self.scores[:k]))
+
+
+class Leaderboard:
+    def __init__(self, matrix=None):
+        self.overall = Ranking()
+        self.subjects = {}  # subject -> Ranking
+        if matrix is None:
+            return
+        self.overall = Ranking(matrix.students, matrix.student_means)
+        for column, subject in enumerate(matrix.subjects):
+            present = ~np.isnan(matrix.grades[:, column])
+            rows = np.flatnonzero(present)
+            self.subjects[subject] = Ranking([matrix.students[i] for i in rows], matrix.grades[rows, column])
+
+    def add_student(self, username, marks):
+        # marks: [(subject, grade), ...] of a student with no marks yet. Returns
+        # False if the student is already ranked (their averages would need
+        # the existing marks); the caller then drops the cached leaderboard.
+        if username in self.overall:
+            return False
+        if not marks:
+            return True
+        by_subject = {}
+        for subject, grade in marks:
+            by_subject.setdefault(subject, []).append(float(grade))
+        self.overall.add(username, sum(g for grades in by_subject.values() for g in grades) / len(marks))
+        for subject, grades in by_subject.items():
+            self.subjects.setdefault(subject, Ranking()).add(username, sum(grades) / len(grades))
+        return True
+
+    def remove_student(self, username):
+        self.overall.remove(username)
+        for ranking in self.subjects.values():
+            ranking.remove(username)
+        return True
+
+    def standing(self, username):
+        # A student's place in the class, or None if they have no marks
+        rank = self.overall.rank(username)
+        if rank is None:
+            return None
+        return {
+            'rank': rank,
+            'of': len(self.overall),
+            'average': self.overall.by_name[username],
+            'percentile': self.overall.percentile(username),
+            'subjects': {subject: ranking.percentile(username)
+                         for subject, ranking in self.subjects.items() if username in ranking},
+        }
+
+
+_cache = {}
+
+
+def load_leaderboard(path=GRADES_FILE):
+    version = file_version(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    board = Leaderboard(load_grade_matrix(path))
+    _cache[path] = (version, board)
+    return board
+
+
+def record_change(before, apply, path=GRADES_FILE):
+    # Called after a write took the grades file from version `before` to its
+    # current version: apply(board) updates the cached leaderboard in place if
+    # it was built from `before`; otherwise (or if apply returns False) the
+    # cache is dropped and the next load rebuilds it.
+    cached = _cache.get(path)
+    if cached and cached[0] == before and apply(cached[1]) is not False:
+        _cache[path] = (file_version(path), cached[1])
+    else:
+        _cache.pop(path, None)
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Headless batch report generator.
+#
+#   python report_cards.py --output reports --format pdf --workers 8
+#
+# Writes the whole-school charts (the four marks charts and the ECA charts) and
+# one report card per student straight to PNG or PDF, without opening a window.
+# The dataset is parsed once in the parent process and handed to each worker
+# when it starts (inherited copy-on-write where fork is available), so workers
+# never re-read the dataset files.
+
+import matplotlib
+matplotlib.use('Agg')
+
+from charts import MARKS_CHARTS, marks_figure, eca_figure, student_report_figure
+from aggregates import activities_by_student
+from grade_matrix import GradeMatrix
+from dataset import read_marks, read_eca, read_students
+from terms import read_term_marks
+
+# Parsed dataset of this worker process, set once by init_worker
+_DATA = None
+
+# Report cards rendered per task; keeps inter-process traffic small
+CHUNK_SIZE = 50
+
+
+def load_report_data(terms=None):
+    # Marks of the current term, or of the given terms' partitions
+    marks = read_term_marks(terms) if terms else read_marks()
+    activities = read_eca()
+
+    marks_by_student = {}
+    for username, subject, grade in marks:
+        marks_by_student.setdefault(username, []).append((subject, grade))
+    matrix = GradeMatrix(marks)
+
+    return {
+        'marks': marks,
+        'matrix': matrix,
+        'activities': activities,
+        'names': {username: name for username, name, _, _ in read_students()},
+        'marks_by_student': marks_by_student,
+        'eca_by_student': activities_by_student(activities),
+        'class_averages': matrix.subject_averages(),
+    }
+
+
+def init_worker(data):
+    global _DATA
+    _DATA = data
+
+
+def safe_filename(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def save_figure(fig, path, fmt):
+    fig.savefig(path, format=fmt, facecolor=fig.get_facecolor())
+
+
+def render_school_chart(kind, output_dir, fmt, dpi):
+    if kind == 'eca':
+        fig = eca_figure(_DATA['activities'], figsize=(16, 10), dpi=dpi)
+    elif kind == 'eca_categories':
+        fig = eca_figure(_DATA['activities'], figsize=(16, 10), dpi=dpi, by='category')
+    else:
+        fig = marks_figure(kind, _DATA['matrix'], figsize=(12, 8), dpi=dpi)
+    path = os.path.join(output_dir, f"{kind}.{fmt}")
+    save_figure(fig, path, fmt)
+    return [path]
+
+
+def render_report_cards(usernames, output_dir, fmt, dpi):
+    paths = []
+    for username in usernames:
+        fig = student_report_figure(
+            username,
+            _DATA['names'].get(username, username),
+            _DATA['marks_by_student'].get(username, []),
+            _DATA['class_averages'],
+            _DATA['eca_by_student'].get(username, []),
+            dpi=dpi,
+        )
+        path = os.path.join(output_dir, f"{safe_filename(username)}.{fmt}")
+        save_figure(fig, path, fmt)
+        paths.append(path)
+    return paths
+
+
+def generate_reports(output_dir='reports', fmt='png', workers=None, usernames=None,
+                     school=True, students=True, dpi=100, terms=None):
+    data = load_report_data(terms)
+    school_dir = os.path.join(output_dir, 'school')
+    students_dir = os.path.join(output_dir, 'students')
+
+    tasks = []
+    if school:
+        os.makedirs(school_dir, exist_ok=True)
+        for kind in MARKS_CHARTS + ['eca', 'eca_categories']:
+            tasks.append((render_school_chart, kind, school_dir))
+    if students:
+        os.makedirs(students_dir, exist_ok=True)
+        if usernames is None:
+            # Everyone with a student account or any marks on record
+            usernames = sorted(set(data['names']) | set(data['marks_by_student']))
+        for start in range(0, len(usernames), CHUNK_SIZE):
+            tasks.append((render_report_cards, usernames[start:start + CHUNK_SIZE], students_dir))
+
+    workers = workers or os.cpu_count() or 1
+    written = []
+    if workers == 1 or len(tasks) <= 1:
+        init_worker(data)
+        for func, arg, directory in tasks:
+            written.extend(func(arg, directory, fmt, dpi))
+        return written
+
+    # fork shares the parsed data with the workers without pickling it
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(data,)) as executor:
+        futures = [executor.submit(func, arg, directory, fmt, dpi) for func, arg, directory in tasks]
+        for future in as_completed(futures):
+            written.extend(future.result())
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render school charts and student report cards to disk")
+    parser.add_argument('--output', default='reports', help="Output directory")
+    parser.add_argument('--format', default='png', choices=['png', 'pdf', 'svg'])
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--student', action='append', help="Only these students (repeatable)")
+    parser.add_argument('--term', action='append', help="Marks of this closed term (repeatable; default: current term)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--school-only', action='store_true', help="Only the whole-school charts")
+    group.add_argument('--students-only', action='store_true', help="Only the report cards")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    written = generate_reports(
+        output_dir=args.output,
+        fmt=args.format,
+        workers=args.workers,
+        usernames=args.student,
+        school=not args.students_only,
+        students=not args.school_only,
+        dpi=args.dpi,
+        terms=args.term,
+    )
+    print(f"Wrote {len(written)} files to {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from bisect import bisect_left
+from collections import Counter
+from functools import cached_property
+from dataset import read_students, file_version, USERS_FILE
+
+# Typeahead search over students by username and full name.
+#
+# Every username, full name and each later word of the name ("smith" in
+# "John Smith") is a lowercased key in one sorted list, so the students whose
+# username or name starts with the typed text are one bisect plus a slice.
+# When nothing matches by prefix, a trigram index finds near misses ("jhon"
+# -> "John Smith"); that path only runs on typos.
+
+FUZZY_MIN_SCORE = 0.3   # share of the query's trigrams a fuzzy match must have
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, entries=()):
+        # entries: (username, name) pairs; results are entry positions
+        self.usernames = []
+        self.names = []
+        keys = []
+        postings = {}
+        for username, name in entries:
+            entry = len(self.usernames)
+            self.usernames.append(username)
+            self.names.append(name)
+            words = name.lower().split()
+            keys.append((username.lower(), entry))
+            if words:
+                keys.append((" ".join(words), entry))
+                keys.extend((word, entry) for word in words[1:])
+            for gram in trigrams(username.lower()) | trigrams(" ".join(words)):
+                postings.setdefault(gram, []).append(entry)
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.entries = [entry for _, entry in keys]
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def prefix(self, text):
+        # Entries with a key starting with text, in key (alphabetical) order
+        start = bisect_left(self.keys, text)
+        end = bisect_left(self.keys, text + "\uffff", start)
+        return list(dict.fromkeys(self.entries[start:end]))
+
+    def fuzzy(self, text, limit=20):
+        # Entries sharing the most trigrams with text, best first. Trigrams
+        # found in over half the entries (the "stu" of every username) say
+        # nothing about the match and would dominate the cost, so are skipped.
+        common = len(self.usernames) // 2
+        grams = [gram for gram in trigrams(text) if len(self.postings.get(gram, ())) <= common]
+        scores = Counter()
+        for gram in grams:
+            scores.update(self.postings.get(gram, ()))
+        needed = FUZZY_MIN_SCORE * len(grams)
+        return [entry for entry, score in scores.most_common(limit) if score >= needed]
+
+    def search(self, text):
+        # Entry positions matching the typed text; all entries for empty text
+        text = " ".join(text.lower().split())
+        if not text:
+            return range(len(self.usernames))
+        matches = self.prefix(text)
+        if not matches and len(text) >= 3:
+            matches = self.fuzzy(text)
+        return matches
+
+
+class StudentIndex(SearchIndex):
+    # SearchIndex over users.txt that also keeps the full student rows
+
+    def __init__(self, students):
+        self.students = students    # [(username, name, email, phone), ...]
+        super().__init__((username, name) for username, name, _, _ in students)
+
+    @cached_property
+    def name_by_username(self):
+        return dict(zip(self.usernames, self.names))
+
+
+_cache = {}
+
+
+def load_student_index(path=USERS_FILE):
+    # StudentIndex of the users file as it is now, rebuilt when it changes
+    version = file_version(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    index = StudentIndex(read_students(path))
+    _cache[path] = (version, index)
+    return index
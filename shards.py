@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import zlib
+import argparse
+from contextlib import ExitStack
+from dataset_io import writing, replace_lines, remove_lock_files
+
+# Optional sharded layout of the dataset files.
+#
+# A large district can split users.txt, passwords.txt, grades.txt and
+# eca.txt into N shard files each, by a hash of the username:
+#
+#   python -m shards migrate 16      # flat -> dataset/shards_16/grades.03.txt, ...
+#   python -m shards migrate 0       # back to the flat files
+#   python -m shards status
+#
+# dataset/shards.json ({"shards": N}) switches the layout on. Code keeps
+# using the flat paths (dataset.GRADES_FILE, ...) as the names of the files:
+# paths(path) gives the files to read for a whole file, path_for(path,
+# username) the one file holding a student's lines. Per-student reads,
+# appends and deletes touch one shard; whole-file loads read every shard
+# (data_store joins them, parallel_load parses them in parallel).
+#
+# The writer lock of the flat path (dataset/users.txt.lock, ...) still
+# serializes the writes that need to see the whole file, such as picking
+# the next student ID. Migrate with no sessions running.
+
+CONFIG_NAME = 'shards.json'
+
+_layouts = {}   # dataset directory -> (config version, shard count)
+
+
+def shard_count(path):
+    # Number of shards of the dataset holding `path`; 0 for the flat layout
+    directory = os.path.dirname(path)
+    config = os.path.join(directory, CONFIG_NAME)
+    try:
+        st = os.stat(config)
+    except FileNotFoundError:
+        return 0
+    version = (st.st_mtime_ns, st.st_size)
+    cached = _layouts.get(directory)
+    if cached and cached[0] == version:
+        return cached[1]
+    with open(config) as f:
+        count = json.load(f)['shards']
+    _layouts[directory] = (version, count)
+    return count
+
+
+def sharded(path):
+    return shard_count(path) > 0
+
+
+def shard_of(username, count):
+    # crc32 rather than hash(): the same shard in every process
+    return zlib.crc32(username.encode()) % count
+
+
+def shard_path(path, index, count):
+    directory, name = os.path.split(path)
+    base, extension = os.path.splitext(name)
+    return os.path.join(directory, f"shards_{count}", f"{base}.{index:02d}{extension}")
+
+
+def paths(path):
+    # The files holding all of `path`'s lines
+    count = shard_count(path)
+    if not count:
+        return [path]
+    return [shard_path(path, index, count) for index in range(count)]
+
+
+def path_for(path, username):
+    # The file holding `username`'s lines of `path`
+    count = shard_count(path)
+    if not count:
+        return path
+    return shard_path(path, shard_of(username, count), count)
+
+
+def migrate(count, files):
+    # Rewrites `files` (flat paths) into `count` shards each, or back into
+    # the flat files for count 0. The new files are written before the
+    # layout switches, so an interrupted migration leaves the old layout.
+    directory = os.path.dirname(files[0])
+    old = {path: paths(path) for path in files}
+    old_count = shard_count(files[0])
+    with ExitStack() as stack:
+        for path in files:
+            stack.enter_context(writing(path))
+        written = set()
+        for path in files:
+            lines = []
+            for old_path in old[path]:
+                try:
+                    with open(old_path) as f:
+                        lines.extend(line if line.endswith('\n') else line + '\n' for line in f if line.strip())
+                except FileNotFoundError:
+                    pass
+            if not count:
+                replace_lines(path, lines)
+                written.add(path)
+                continue
+            buckets = [[] for _ in range(count)]
+            for line in lines:
+                buckets[shard_of(line.split(',', 1)[0], count)].append(line)
+            os.makedirs(os.path.dirname(shard_path(path, 0, count)), exist_ok=True)
+            for index, bucket in enumerate(buckets):
+                replace_lines(shard_path(path, index, count), bucket)
+                written.add(shard_path(path, index, count))
+
+        config = os.path.join(directory, CONFIG_NAME)
+        if count:
+            replace_lines(config, [json.dumps({'shards': count}) + '\n'])
+        elif os.path.exists(config):
+            os.remove(config)
+        for path in files:
+            for old_path in old[path]:
+                if old_path not in written and os.path.exists(old_path):
+                    os.remove(old_path)
+                # The flat paths' lock files stay: they still guard the files
+                if old_path not in written and old_path not in files:
+                    remove_lock_files(old_path)
+        if old_count and old_count != count:
+            try:
+                os.rmdir(os.path.dirname(shard_path(files[0], 0, old_count)))
+            except OSError:
+                pass    # something else was left in it
+
+
+def main(argv=None):
+    from dataset import USERS_FILE, PASSWORDS_FILE, GRADES_FILE, ECA_FILE
+    files = [USERS_FILE, PASSWORDS_FILE, GRADES_FILE, ECA_FILE]
+
+    parser = argparse.ArgumentParser(description="Move the dataset files between the flat and sharded layouts")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help="Rewrite the files into N shards (0: flat)")
+    migrate_parser.add_argument('shards', type=int)
+    commands.add_parser('status', help="Show the layout and the size of each file")
+    args = parser.parse_args(argv)
+
+    if args.command == 'migrate':
+        if args.shards < 0:
+            print("Error: the number of shards can't be negative")
+            return 1
+        if args.shards == shard_count(files[0]):
+            print("The dataset already has that layout")
+            return 0
+        migrate(args.shards, files)
+    count = shard_count(files[0])
+    print(f"{count} shards per file" if count else "Flat layout")
+    for path in files:
+        sizes = [os.path.getsize(p) for p in paths(path) if os.path.exists(p)]
+        print(f"  {os.path.basename(path):<14} {sum(sizes):>12} bytes in {len(sizes)} files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
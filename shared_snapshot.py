@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import time
+import struct
+import signal
+import argparse
+from collections.abc import Mapping, Sequence
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from dataset import dataset_key, file_version, GRADES_FILE, ECA_FILE
+
+# Grades and ECA data published once into shared memory for every app
+# instance on the machine.
+#
+#   python -m shared_snapshot          # from the directory holding dataset/
+#
+# The publisher keeps the parsed files (data_store) and, whenever grades.txt
+# or eca.txt changes, writes the grade matrix and ECA index arrays into a new
+# shared memory block: string tables, integer codes, the students x subjects
+# arrays and the ECA bitsets, plus a JSON header saying where each array is
+# and which file versions it was built from. A small fixed index block names
+# the current data block; it is updated under a sequence counter (odd while
+# being written), so readers never act on a half-written name.
+#
+# Instances find the index block by their dataset path and attach the data
+# block read-only: the NumPy arrays are views of the shared pages, and
+# strings are decoded when looked up, so an instance's memory does not grow
+# with the dataset. load_grade_matrix() / load_eca_index() use the snapshot
+# when it was built from the file versions on disk, and parse the files
+# themselves otherwise (no publisher, or one that hasn't caught up yet).
+# Checking for a new version is one read of the index block.
+#
+# SMS_SNAPSHOT=off never attaches.
+
+SNAPSHOT_ENV = 'SMS_SNAPSHOT'
+INDEX_SIZE = 256
+INDEX_FORMAT = '<QQ'         # sequence counter, version; then the data block name
+NAME_SIZE = INDEX_SIZE - struct.calcsize(INDEX_FORMAT)
+ALIGN = 64
+POLL_INTERVAL = 0.5          # seconds between the publisher's checks for changes
+RETRY_DELAY = 5.0            # seconds between looks for an index block that wasn't there
+
+
+def index_name(dataset_dir='dataset'):
+    return f"sms_{dataset_key(dataset_dir)}"
+
+
+class _Attached(shared_memory.SharedMemory):
+    # A block attached by a reader. Arrays handed out may outlive this object,
+    # in which case the mapping is released with the last of them.
+
+    def __init__(self, name):
+        if sys.version_info >= (3, 13):
+            super().__init__(name, track=False)
+        else:
+            super().__init__(name)
+            # Readers must not unlink the block when they exit
+            resource_tracker.unregister(self._name, 'shared_memory')
+
+    def __del__(self):
+        try:
+            self.close()
+        except (OSError, BufferError):
+            pass
+
+
+# -- string tables -----------------------------------------------------------
+
+def pack_strings(strings):
+    # (UTF-8 blob, end offsets, positions in sorted order) for a StringTable
+    encoded = [s.encode() for s in strings]
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    ends = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+    order = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int64)
+    return blob, ends, order
+
+
+class StringTable(Sequence):
+    # Read-only list of strings over pack_strings() arrays, decoded on access.
+    # UTF-8 byte order is code point order, so the sorted positions give a
+    # binary search for index().
+
+    def __init__(self, blob, ends, order):
+        self.blob = blob
+        self.ends = ends
+        self.order = order
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        start = int(self.ends[i - 1]) if i else 0
+        return self.blob[start:int(self.ends[i])].tobytes().decode()
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def index(self, value, *args):
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            position = int(self.order[mid])
+            found = self[position]
+            if found == value:
+                return position
+            if found < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        raise ValueError(f"{value!r} is not in the table")
+
+
+class StringCodes(Mapping):
+    # string -> position in a StringTable, like the code dicts it stands in for
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, key):
+        try:
+            return self.table.index(key)
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+
+class Ragged(Sequence):
+    # Read-only list of lists: row i is values[offsets[i]:offsets[i + 1]]
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.values[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+
+# -- data blocks -------------------------------------------------------------
+
+def snapshot_arrays(matrix, eca):
+    # The arrays of a GradeMatrix and an EcaIndex, by name
+    arrays = {}
+    for name, strings in (('students', matrix.students), ('subjects', matrix.subjects),
+                          ('eca_students', eca.students), ('activities', eca.activities)):
+        arrays[f'{name}_blob'], arrays[f'{name}_ends'], arrays[f'{name}_order'] = pack_strings(strings)
+    for name in ('row_students', 'row_subjects', 'row_grades', 'sums', 'counts', 'grades', 'student_means'):
+        arrays[name] = np.ascontiguousarray(getattr(matrix, name))
+    lengths = [len(codes) for codes in eca.student_activities]
+    arrays['eca_offsets'] = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+    arrays['eca_codes'] = np.array([code for codes in eca.student_activities for code in codes], dtype=np.int64)
+    width = (len(eca.students) + 7) // 8 or 1
+    arrays['members'] = np.frombuffer(b''.join(bits.to_bytes(width, 'little') for bits in eca.members),
+                                      dtype=np.uint8).reshape(len(eca.members), width)
+    return arrays
+
+
+def write_block(name, version, files, arrays):
+    # A new shared memory block holding the arrays after a JSON header
+    layout = {}
+    offset = 0
+    for key, array in arrays.items():
+        layout[key] = [array.dtype.str, list(array.shape), offset]
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({'version': version, 'files': files, 'arrays': layout}).encode()
+    start = -(-(8 + len(header)) // ALIGN) * ALIGN
+    block = shared_memory.SharedMemory(name, create=True, size=max(start + offset, 1))
+    block.buf[:8] = struct.pack('<Q', len(header))
+    block.buf[8:8 + len(header)] = header
+    for key, array in arrays.items():
+        begin = start + layout[key][2]
+        block.buf[begin:begin + array.nbytes] = array.tobytes()
+    return block
+
+
+class Snapshot:
+    # An attached data block: read-only arrays plus the structures built on them
+
+    def __init__(self, name):
+        self.block = _Attached(name)
+        buf = self.block.buf
+        size, = struct.unpack_from('<Q', buf)
+        header = json.loads(bytes(buf[8:8 + size]))
+        start = -(-(8 + size) // ALIGN) * ALIGN
+        self.version = header['version']
+        self.files = {path: tuple(version) for path, version in header['files'].items()}
+        self.arrays = {}
+        for key, (dtype, shape, offset) in header['arrays'].items():
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=start + offset)
+            array.flags.writeable = False
+            self.arrays[key] = array
+        self.matrix = None
+        self.eca = None
+
+    def strings(self, name):
+        a = self.arrays
+        return StringTable(a[f'{name}_blob'], a[f'{name}_ends'], a[f'{name}_order'])
+
+    def grade_matrix(self):
+        if self.matrix is None:
+            from grade_matrix import GradeMatrix
+            students = self.strings('students')
+            subjects = list(self.strings('subjects'))
+            self.matrix = GradeMatrix.from_arrays(
+                students, subjects, StringCodes(students), {s: i for i, s in enumerate(subjects)},
+                **{key: self.arrays[key] for key in ('row_students', 'row_subjects', 'row_grades',
+                                                     'sums', 'counts', 'grades', 'student_means')})
+        return self.matrix
+
+    def eca_index(self):
+        if self.eca is None:
+            from eca_index import EcaIndex
+            students = self.strings('eca_students')
+            activities = list(self.strings('activities'))
+            members = [int.from_bytes(row.tobytes(), 'little') for row in self.arrays['members']]
+            self.eca = EcaIndex.from_arrays(students, StringCodes(students), activities,
+                                            {a: i for i, a in enumerate(activities)}, members,
+                                            Ragged(self.arrays['eca_offsets'], self.arrays['eca_codes']))
+        return self.eca
+
+
+# -- readers -----------------------------------------------------------------
+
+class SnapshotReader:
+    def __init__(self, name):
+        self.index = _Attached(name)
+        self.current = None
+
+    def read_index(self):
+        # (version, data block name) of the published snapshot
+        while True:
+            before, version = struct.unpack_from(INDEX_FORMAT, self.index.buf)
+            name = bytes(self.index.buf[struct.calcsize(INDEX_FORMAT):INDEX_SIZE]).rstrip(b'\0').decode()
+            after, = struct.unpack_from('<Q', self.index.buf)
+            if before == after and not before % 2:
+                return version, name
+            time.sleep(0)
+
+    def latest(self):
+        # The newest Snapshot, attaching it if it's new; None before the first
+        version, name = self.read_index()
+        if not name:
+            return None
+        if self.current is None or self.current.version != version:
+            try:
+                self.current = Snapshot(name)
+            except FileNotFoundError:
+                # Replaced again between reading the index and attaching
+                return self.current
+        return self.current
+
+
+_reader = None
+_retry_at = 0.0
+
+
+def latest():
+    # This process's view of the published snapshot, or None
+    global _reader, _retry_at
+    if _reader is None:
+        if os.environ.get(SNAPSHOT_ENV) == 'off' or time.monotonic() < _retry_at:
+            return None
+        try:
+            _reader = SnapshotReader(index_name())
+        except FileNotFoundError:
+            _retry_at = time.monotonic() + RETRY_DELAY
+            return None
+    return _reader.latest()
+
+
+def find(path, version):
+    # The published snapshot if it was built from this version of path
+    snapshot = latest()
+    if snapshot is not None and version is not None and snapshot.files.get(path) == version:
+        return snapshot
+    return None
+
+
+# -- publisher ---------------------------------------------------------------
+
+class Publisher:
+    def __init__(self, name):
+        self.name = name
+        self.index = shared_memory.SharedMemory(name, create=True, size=INDEX_SIZE)
+        self.index.buf[:INDEX_SIZE] = bytes(INDEX_SIZE)
+        self.block = None
+        self.version = 0
+        self.files = None
+
+    def set_index(self, version, block_name):
+        counter, _ = struct.unpack_from(INDEX_FORMAT, self.index.buf)
+        struct.pack_into('<Q', self.index.buf, 0, counter + 1)
+        encoded = block_name.encode().ljust(NAME_SIZE, b'\0')
+        self.index.buf[struct.calcsize(INDEX_FORMAT):INDEX_SIZE] = encoded
+        struct.pack_into(INDEX_FORMAT, self.index.buf, 0, counter + 2, version)
+
+    def publish(self):
+        # Publishes the files if they changed since the last snapshot;
+        # returns whether it did
+        from data_store import store
+        from eca_index import EcaIndex
+        from grade_matrix import GradeMatrix
+        files = {GRADES_FILE: file_version(GRADES_FILE), ECA_FILE: file_version(ECA_FILE)}
+        if files == self.files or None in files.values():
+            return False
+        matrix = GradeMatrix(store.marks())
+        eca = EcaIndex(store.eca())
+        self.version += 1
+        block = write_block(f"{self.name}_{self.version}", self.version, files, snapshot_arrays(matrix, eca))
+        self.set_index(self.version, block.name)
+        # Instances still using the old block keep their mapping
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+        self.block = block
+        self.files = files
+        return True
+
+    def close(self):
+        for block in (self.block, self.index):
+            if block is not None:
+                block.close()
+                block.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish the grades and ECA data into shared memory")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="Seconds between checks for changes")
+    args = parser.parse_args(argv)
+
+    name = index_name()
+    try:
+        publisher = Publisher(name)
+    except FileExistsError:
+        print(f"A snapshot publisher is already running for this dataset ({name})")
+        return 1
+    stop = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.append(True))
+    try:
+        while not stop:
+            if publisher.publish():
+                print(f"Published version {publisher.version} ({publisher.block.size / 1e6:.1f} MB)")
+            time.sleep(args.interval)
+    finally:
+        publisher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
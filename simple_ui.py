@@ -3,6 +3,10 @@ import sys
 import subprocess
 import os
 from user_management import UserManagement
+import data_service
+import shards
+from instrumentation import metrics
+from profiling import profiler
 
 # Color schemes
 COLORS = {
@@ -41,20 +45,22 @@ if not os.path.exists('assets'):
 if not os.path.exists('dataset'):
     os.makedirs('dataset')
 
-# Check for necessary files and create them if missing
-if not os.path.exists('dataset/users.txt'):
+# Check for necessary files and create them if missing (a sharded dataset
+# has its files under dataset/shards_N instead)
+flat = not shards.sharded('dataset/users.txt')
+if flat and not os.path.exists('dataset/users.txt'):
     with open('dataset/users.txt', 'w') as f:
         f.write("admin,admin123,admin,ADM001,Admin User,admin@example.com,1234567890\n")
 
-if not os.path.exists('dataset/passwords.txt'):
+if flat and not os.path.exists('dataset/passwords.txt'):
     with open('dataset/passwords.txt', 'w') as f:
         f.write("admin,admin123\n")
 
-if not os.path.exists('dataset/grades.txt'):
+if flat and not os.path.exists('dataset/grades.txt'):
     with open('dataset/grades.txt', 'w') as f:
         pass # Create empty file
 
-if not os.path.exists('dataset/eca.txt'):
+if flat and not os.path.exists('dataset/eca.txt'):
     with open('dataset/eca.txt', 'w') as f:
         pass # Create empty file
 
@@ -232,32 +238,32 @@ class BaseUI:
 
     def login(self):
         try:
-            with open('dataset/passwords.txt', 'r') as file:
-                for line in file:
-                    stored_username, stored_password = line.strip().split(',')
-                    if stored_username == self.username_text and stored_password == self.password_text:
-                        print(f"Login successful for {self.username_text}")
-                        pygame.quit() # Quit Pygame before launching the next window
-                        UserManagement(self.username_text)
-                        return
+            if data_service.call('login', username=self.username_text, password=self.password_text):
+                print(f"Login successful for {self.username_text}")
+                pygame.quit() # Quit Pygame before launching the next window
+                UserManagement(self.username_text)
+                return
             self.error_message = "Invalid username or password"
         except FileNotFoundError:
             self.error_message = "Password file not found."
         except Exception as e:
             self.error_message = f"An error occurred: {e}"
 
+    @profiler.screen("LoginUI")
     def run(self):
         clock = pygame.time.Clock()
         running = True
         
         while running:
-            for event in pygame.event.get():
+            metrics.begin_frame(type(self).__name__, self)
+            for event in metrics.poll_events():
                 if event.type == pygame.QUIT:
                     running = False
                 self.handle_login_input(event)
             
+            metrics.mark("draw")
             self.draw_login_screen()
-            pygame.display.flip()
+            metrics.flip()
             clock.tick(60)
             
         pygame.quit()
@@ -327,12 +333,14 @@ class MenuUI(BaseUI):
             text_rect = text.get_rect(center=rect.center)
             self.screen.blit(text, text_rect)
             
+    @profiler.screen("MenuUI")
     def run_menu(self):
         clock = pygame.time.Clock()
         running = True
         
         while running:
-            for event in pygame.event.get():
+            metrics.begin_frame("MenuUI", self)
+            for event in metrics.poll_events():
                 if event.type == pygame.QUIT:
                     running = False
                 if event.type == pygame.MOUSEBUTTONDOWN:
@@ -344,8 +352,9 @@ class MenuUI(BaseUI):
                             elif button_name == "Exit":
                                 running = False
             
+            metrics.mark("draw")
             self.draw_menu()
-            pygame.display.flip()
+            metrics.flip()
             clock.tick(60)
         
         pygame.quit()
@@ -0,0 +1,111 @@
+from dataset import file_version, read_lines, USERS_FILE, PASSWORDS_FILE, GRADES_FILE, ECA_FILE
+from dataset_io import writing, append_lines, rewrite_lines, LockTimeout
+from ranking import record_change
+from shards import path_for
+
+# Writes that add or remove a student across the dataset files, without any
+# pygame / UI state. UserManagement validates the form and calls these either
+# directly or through the data service (data_service.py), which runs the same
+# functions one at a time for all its clients.
+#
+# A student's lines go to (and are deleted from) the shard of each file that
+# holds their username (shards.path_for); with the flat layout that is the
+# file itself. The flat paths' writer locks still guard the whole files.
+
+STUDENT_ID_PREFIX = "STU"
+
+
+class RecordError(Exception):
+    # A write that failed in a way the user should be told about
+    pass
+
+
+def next_student_id(path=USERS_FILE):
+    # STU001, STU002, ... one past the highest ID in users.txt
+    next_id = 1
+    try:
+        existing_ids = [line.split(',')[3] for line in read_lines(path) if line.strip() and len(line.split(',')) > 3]
+        stu_ids = [int(id[len(STUDENT_ID_PREFIX):]) for id in existing_ids
+                   if id.startswith(STUDENT_ID_PREFIX) and id[len(STUDENT_ID_PREFIX):].isdigit()]
+        if stu_ids:
+            next_id = max(stu_ids) + 1
+    except FileNotFoundError:
+        pass # Start with ID 1 if file doesn't exist
+    return f"{STUDENT_ID_PREFIX}{next_id:03d}"
+
+
+def add_student(username, password, name, email, phone, marks=(), activities=()):
+    # Adds an already validated student; marks are (subject, mark) pairs.
+    # Returns the new student ID.
+
+    # The username check, the ID and the new users.txt line happen under
+    # the users.txt writer lock, so two sessions can't claim the same ones
+    try:
+        with writing(USERS_FILE):
+            # Check if username already exists
+            try:
+                with open(path_for(USERS_FILE, username), 'r') as f:
+                    for line in f:
+                        if line.startswith(username + ','):
+                            raise RecordError(f"Username '{username}' already exists.")
+            except FileNotFoundError:
+                pass # File doesn't exist, so username can't exist yet
+
+            user_id = next_student_id()
+
+            # Append new user to users.txt
+            user_data_line = f"{username},password,student,{user_id},{name},{email},{phone}\n" # Note: Storing plain password temporarily
+            try:
+                append_lines(path_for(USERS_FILE, username), [user_data_line])
+            except IOError as e:
+                raise RecordError(f"Error writing to users file: {e}")
+    except LockTimeout as e:
+        raise RecordError(f"Users file is busy, try again: {e}")
+
+    # Append new user to passwords.txt
+    try:
+        append_lines(path_for(PASSWORDS_FILE, username), [f"{username},{password}\n"])
+    except IOError as e:
+        # Attempt to clean up the entry in users.txt if password writing failed
+        try:
+            rewrite_lines(path_for(USERS_FILE, username), lambda line: not line.startswith(username + ','))
+        except Exception as cleanup_e:
+            print(f"Error during cleanup: {cleanup_e}")
+        raise RecordError(f"Error writing to passwords file: {e}")
+
+    # Add marks to grades.txt if provided
+    try:
+        with writing(GRADES_FILE):
+            before = file_version(GRADES_FILE)
+            append_lines(path_for(GRADES_FILE, username), [f"{username},{subject},{mark}\n" for subject, mark in marks])
+            record_change(before, lambda board: board.add_student(username, list(marks)))
+    except IOError as e:
+        # We don't delete the user at this point, just report the error
+        print(f"Warning: User created but grades not saved: {e}")
+
+    # Add ECA activities to eca.txt if provided
+    try:
+        append_lines(path_for(ECA_FILE, username), [f"{username},{activity}\n" for activity in activities])
+    except IOError as e:
+        # We don't delete the user at this point, just report the error
+        print(f"Warning: User created but ECA not saved: {e}")
+
+    return user_id
+
+
+def delete_student(username):
+    # Drops the student's lines from each file; every file is rewritten
+    # atomically under its writer lock
+    def keep(line):
+        return not line.startswith(f"{username},")
+
+    rewrite_lines(path_for(USERS_FILE, username), keep)
+    rewrite_lines(path_for(PASSWORDS_FILE, username), keep)
+
+    with writing(GRADES_FILE):
+        before = file_version(GRADES_FILE)
+        rewrite_lines(path_for(GRADES_FILE, username), keep)
+        record_change(before, lambda board: board.remove_student(username))
+
+    rewrite_lines(path_for(ECA_FILE, username), keep)
+    return True
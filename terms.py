@@ -0,0 +1,308 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from dataset import file_version, read_lines, read_marks, parse_marks, GRADES_FILE
+from dataset_io import writing, reading, replace_lines, remove_lock_files
+import parallel_load
+import archive
+import shards
+
+# Grades by academic term.
+#
+# grades.txt holds the current term only; it is what the screens, charts,
+# queries and writers use, so their cost follows the current term. Closing
+# a term moves its rows into a partition file of their own and empties
+# grades.txt:
+#
+#   python -m terms close 2025-T2 --term 2025-T1   # first close: name the term being closed
+#   python -m terms close 2025-T3                  # 2025-T2 -> dataset/terms/2025-T2.txt
+#   python -m terms compact                        # closed text partitions -> .npz
+#   python -m terms compact --format xz            # ... or -> indexed .txt.xz (archive.py)
+#   python -m terms student alice                  # one student's marks in every term
+#   python -m terms list
+#
+# dataset/terms/manifest.json names the current term and lists the closed
+# partitions with their row counts and per-subject stats (rows, min, max,
+# mean). Loaders read only the partitions a request needs (select()), and
+# the stats let a request skip partitions that cannot contain a match, e.g.
+# no Mathematics mark under 60. Compacted partitions are the code arrays of
+# parallel_load saved with np.savez, which load without parsing, or block
+# compressed text (gz, xz, bz2), which takes the least disk and still reads
+# one student's marks without decompressing the whole term.
+#
+# Closed partitions are history: deleting a student only changes the
+# current term. They are flat files whatever the layout of grades.txt.
+
+TERMS_DIR = 'dataset/terms'
+MANIFEST = os.path.join(TERMS_DIR, 'manifest.json')
+TERM_PATTERN = re.compile(r'^[\w.-]+$')   # term names become file names
+FORMATS = ['npz'] + [suffix[1:] for suffix in archive.CODECS]   # compact() targets
+
+
+class TermError(Exception):
+    pass
+
+
+def read_manifest(path=MANIFEST):
+    # {'current': term or None, 'partitions': [{'term', 'file', 'format', 'rows', ...}, ...]}
+    try:
+        with reading(path), open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'current': None, 'partitions': []}
+
+
+def write_manifest(manifest, path=MANIFEST):
+    replace_lines(path, [json.dumps(manifest, indent=1) + '\n'])
+
+
+def current_term():
+    return read_manifest()['current']
+
+
+def partition_stats(codes):
+    # Row count and per-subject stats of parallel_load code arrays
+    students, subjects, row_students, row_subjects, row_grades = codes
+    stats = {'rows': len(row_grades), 'students': len(students), 'subjects': {}}
+    for subject, code in subjects.items():
+        grades = row_grades[row_subjects == code]
+        stats['subjects'][subject] = {'rows': len(grades), 'min': float(grades.min()),
+                                      'max': float(grades.max()), 'mean': float(grades.mean())}
+    return stats
+
+
+# -- reading -----------------------------------------------------------------
+
+def select(terms=None, subject=None, below=None, above=None):
+    # Manifest entries of the partitions a request needs: the given terms
+    # (default: the current one). With a subject, partitions whose stats show
+    # no mark of it below `below` / above `above` are skipped. The current
+    # term has no stats and is never skipped; its entry has file None.
+    manifest = read_manifest()
+    if terms is None:
+        terms = [manifest['current']]
+    closed = {entry['term']: entry for entry in manifest['partitions']}
+    selected = []
+    for term in terms:
+        if term == manifest['current']:
+            selected.append({'term': term, 'file': None})
+            continue
+        entry = closed.get(term)
+        if entry is None:
+            raise TermError(f"No partition for term {term!r}")
+        if subject is not None:
+            stats = entry['subjects'].get(subject)
+            if stats is None:
+                continue
+            if below is not None and stats['min'] >= below:
+                continue
+            if above is not None and stats['max'] <= above:
+                continue
+        selected.append(entry)
+    return selected
+
+
+def partition_codes(entry):
+    # parallel_load code arrays of one selected partition
+    if entry['file'] is None:
+        return parallel_load.read_grade_codes(GRADES_FILE)
+    path = os.path.join(TERMS_DIR, entry['file'])
+    if entry['format'] != 'npz':
+        return parallel_load.read_grade_codes(path)
+    with np.load(path, allow_pickle=False) as arrays:
+        students = {name: code for code, name in enumerate(arrays['students'].tolist())}
+        subjects = {name: code for code, name in enumerate(arrays['subjects'].tolist())}
+        return (students, subjects, arrays['row_students'].astype(np.int64),
+                arrays['row_subjects'].astype(np.int64), arrays['row_grades'])
+
+
+def partition_marks(entry):
+    # [(username, subject, grade), ...] of one selected partition
+    if entry['file'] is None:
+        return read_marks(GRADES_FILE)
+    if entry['format'] != 'npz':
+        return read_marks(os.path.join(TERMS_DIR, entry['file']))
+    students, subjects, row_students, row_subjects, row_grades = partition_codes(entry)
+    students, subjects = list(students), list(subjects)
+    return [(students[s], subjects[j], f"{grade:g}")
+            for s, j, grade in zip(row_students.tolist(), row_subjects.tolist(), row_grades.tolist())]
+
+
+def read_term_marks(terms=None, **prune):
+    # Rows of the selected partitions, oldest term first as listed
+    marks = []
+    for entry in select(terms, **prune):
+        marks.extend(partition_marks(entry))
+    return marks
+
+
+def read_student_marks(username, terms=None):
+    # {term: [(username, subject, grade), ...]} of one student in the given
+    # terms (default: every closed term and the current one). Compressed
+    # partitions decompress only the blocks holding the student.
+    manifest = read_manifest()
+    if terms is None:
+        terms = [entry['term'] for entry in manifest['partitions']] + [manifest['current']]
+    marks = {}
+    for entry in select(terms):
+        if entry['file'] is None:
+            rows = read_marks(shards.path_for(GRADES_FILE, username))
+        elif archive.codec_of(entry['file']):
+            rows = parse_marks(archive.lookup(os.path.join(TERMS_DIR, entry['file']), username))
+        else:
+            rows = partition_marks(entry)
+        marks[entry['term']] = [row for row in rows if row[0] == username]
+    return marks
+
+
+_cache = {}
+
+
+def load_term_matrix(terms=None, **prune):
+    # GradeMatrix over the selected partitions; the current term alone is
+    # load_grade_matrix(). Cached per manifest and grades.txt version.
+    from grade_matrix import GradeMatrix, load_grade_matrix
+    entries = select(terms, **prune)
+    if [entry['file'] for entry in entries] == [None]:
+        return load_grade_matrix()
+    key = tuple(entry['term'] for entry in entries)
+    version = (file_version(MANIFEST), file_version(GRADES_FILE))
+    cached = _cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    parts = []
+    for entry in entries:
+        students, subjects, row_students, row_subjects, row_grades = partition_codes(entry)
+        parts.append((list(students), list(subjects), row_students, row_subjects, row_grades))
+    matrix = GradeMatrix.from_codes(*parallel_load.merge(parts))
+    _cache[key] = (version, matrix)
+    return matrix
+
+
+# -- maintenance -------------------------------------------------------------
+
+def close_term(next_term, term=None):
+    # Moves grades.txt into the partition of the current term (or `term`
+    # when the manifest doesn't name one yet) and starts next_term
+    os.makedirs(TERMS_DIR, exist_ok=True)
+    with writing(MANIFEST), writing(GRADES_FILE):
+        manifest = read_manifest()
+        term = manifest['current'] or term
+        if term is None:
+            raise TermError("The manifest names no current term; pass the term being closed")
+        for name in (term, next_term):
+            if not TERM_PATTERN.match(name):
+                raise TermError(f"Invalid term name {name!r}")
+        if term == next_term:
+            raise TermError(f"{term!r} is already the current term")
+        for entry in manifest['partitions']:
+            if entry['term'] in (term, next_term):
+                raise TermError(f"Term {entry['term']!r} already has a partition")
+
+        try:
+            lines = [line if line.endswith('\n') else line + '\n' for line in read_lines(GRADES_FILE)]
+        except FileNotFoundError:
+            lines = []
+        file_name = f"{term}.txt"
+        replace_lines(os.path.join(TERMS_DIR, file_name), lines)
+        entry = {'term': term, 'file': file_name, 'format': 'text', 'closed': time.strftime('%Y-%m-%d')}
+        entry.update(partition_stats(parallel_load.read_grade_codes(os.path.join(TERMS_DIR, file_name))))
+
+        # Listed before grades.txt is emptied: a crash in between leaves the
+        # rows in both places rather than in neither
+        manifest['partitions'].append(entry)
+        manifest['current'] = next_term
+        write_manifest(manifest)
+        for path in shards.paths(GRADES_FILE):
+            replace_lines(path, [])
+        return entry
+
+
+def compact(terms=None, format='npz'):
+    # Rewrites closed text partitions (default: all) as .npz code arrays, or
+    # as block compressed text with format 'gz', 'xz' or 'bz2'; returns the
+    # terms compacted
+    if format not in FORMATS:
+        raise TermError(f"Unknown format {format!r} (use {', '.join(FORMATS)})")
+    compacted = []
+    if not os.path.exists(MANIFEST):
+        return compacted
+    with writing(MANIFEST):
+        manifest = read_manifest()
+        for entry in manifest['partitions']:
+            if entry['format'] != 'text' or (terms is not None and entry['term'] not in terms):
+                continue
+            text_path = os.path.join(TERMS_DIR, entry['file'])
+            if format != 'npz':
+                file_name = f"{entry['file']}.{format}"
+                with open(text_path) as f:
+                    archive.write(os.path.join(TERMS_DIR, file_name), f.readlines())
+                entry['file'] = file_name
+                entry['format'] = format
+                write_manifest(manifest)
+                os.remove(text_path)
+                remove_lock_files(text_path)
+                compacted.append(entry['term'])
+                continue
+            students, subjects, row_students, row_subjects, row_grades = parallel_load.read_grade_codes(text_path)
+            file_name = f"{entry['term']}.npz"
+            temp_path = os.path.join(TERMS_DIR, f".{file_name}.tmp")
+            with open(temp_path, 'wb') as f:
+                np.savez(f, students=np.array(list(students), dtype=str), subjects=np.array(list(subjects), dtype=str),
+                         row_students=row_students.astype(np.int32), row_subjects=row_subjects.astype(np.int16),
+                         row_grades=row_grades)
+            os.replace(temp_path, os.path.join(TERMS_DIR, file_name))
+            entry['file'] = file_name
+            entry['format'] = 'npz'
+            write_manifest(manifest)
+            os.remove(text_path)
+            remove_lock_files(text_path)
+            compacted.append(entry['term'])
+    return compacted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Close, compact and list grade terms")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Show the current term and the closed partitions")
+    close = commands.add_parser('close', help="Move grades.txt into a partition and start a new term")
+    close.add_argument('next_term', help="Name of the term starting now, e.g. 2025-T2")
+    close.add_argument('--term', help="Name of the term being closed, if the manifest has none yet")
+    compact_parser = commands.add_parser('compact', help="Convert closed text partitions to .npz")
+    compact_parser.add_argument('terms', nargs='*', help="Terms to compact (default: all)")
+    compact_parser.add_argument('--format', default='npz', choices=FORMATS,
+                                help="npz code arrays (fastest to load) or compressed text (smallest)")
+    student = commands.add_parser('student', help="Show one student's marks in every term")
+    student.add_argument('username')
+    student.add_argument('--term', action='append', help="Only this term (repeatable)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'close':
+            entry = close_term(args.next_term, args.term)
+            print(f"Closed {entry['term']} ({entry['rows']} rows); current term is now {args.next_term}")
+        elif args.command == 'compact':
+            done = compact(args.terms or None, args.format)
+            print(f"Compacted {', '.join(done)}" if done else "Nothing to compact")
+        elif args.command == 'student':
+            for term, marks in read_student_marks(args.username, args.term).items():
+                print(f"{term or '(current)'}: " + (", ".join(f"{subject} {grade}" for _, subject, grade in marks)
+                                                    or "no marks"))
+        else:
+            manifest = read_manifest()
+            print(f"Current term: {manifest['current'] or '(not named)'}")
+            for entry in manifest['partitions']:
+                print(f"  {entry['term']:<12} {entry['rows']:>10} rows  {entry['students']:>8} students  "
+                      f"{entry['format']:<5} closed {entry['closed']}")
+    except TermError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,22 @@
 import pygame
 import sys
 import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-import numpy as np
+import time
+from charts import LIVE_CHARTS, ECA_TITLES
+from pygame_charts import NativeChartRenderer
+from aggregates import eca_summary, summarize_student_avgs, students_in_range, drill_range, STUDENT_AVG_MODES, STUDENT_AVG_LIMIT
+from eca_index import EcaIndex, load_eca_index
+from grade_matrix import GradeMatrix, load_grade_matrix
+from ranking import load_leaderboard
+from query import Query, QueryError, load_query_data
+from search_index import SearchIndex, load_student_index
+from dataset import file_version, GRADES_FILE, ECA_FILE
+from data_store import POLL_INTERVAL
+from student_records import RecordError
+import data_service
+from loading import Load, Cancelled
+from instrumentation import metrics
+from profiling import profiler
 
 # Color schemes
 COLORS = {
@@ -41,6 +54,32 @@ def rgb_to_hex(rgb):
 # Create matplotlib color dictionary
 MPL_COLORS = {k: rgb_to_hex(v) for k, v in COLORS.items()}
 
+# Charts are rendered at the pixel size they are displayed at. 72 DPI makes one
+# point one pixel, so the chart fonts read the same as the pygame labels.
+CHART_DPI = 72
+
+def chart_figsize(width, height, dpi=CHART_DPI):
+    return (width / dpi, height / dpi)
+
+def chart_surface(chart):
+    # Wrap the chart's Agg RGBA buffer as a Surface without copying it. The
+    # Surface holds a reference to the buffer, and later renders of the same
+    # chart draw into that buffer in place.
+    return pygame.image.frombuffer(chart.canvas.buffer_rgba(), chart.canvas.get_width_height(), "RGBA")
+
+def draw_search_box(screen, font, rect, text, placeholder="Search by username or name"):
+    pygame.draw.rect(screen, COLORS['input_bg'], rect, 0, border_radius=10)
+    pygame.draw.rect(screen, COLORS['input_border'], rect, 2, border_radius=10)
+    if text:
+        surface = font.render(text + "|", True, COLORS['input_text'])
+    else:
+        surface = font.render(placeholder, True, COLORS['input_border'])
+    screen.blit(surface, surface.get_rect(midleft=(rect.x + 10, rect.centery)))
+
+# 'matplotlib' (default) or 'native', which draws the charts with pygame.draw
+# and skips matplotlib entirely; much faster, but plainer
+CHART_BACKEND = os.environ.get('SMS_CHART_BACKEND', 'matplotlib')
+
 class DataDisplayWindow:
     def __init__(self, data, display_type, is_admin=False, parent_window=None):
         # Initialize Pygame
@@ -77,35 +116,42 @@ class DataDisplayWindow:
         self.is_admin = is_admin
         self.parent_window = parent_window
         
+        self.loading = None     # loading.Load of the rows until they are in
+        self.refreshing = None  # loading.Load rebuilding the view after a file changed
+        
         # Create title text
         titles = {
             "marks": "Student Marks",
             "eca": "ECA Activities",
             "achievements": "Student Achievements",
             "students": "All Students",
-            "visualization": "Marks Visualization"
+            "visualization": "Marks Visualization",
+            "club_overlap": "Club Overlap",
+            "leaderboard": "Class Leaderboard",
+            "query": "Query Students"
         }
         self.title_text = titles[display_type]
         self.title_surface = self.title_font.render(self.title_text, True, COLORS['text'])
         
         # Create visualization buttons if needed
         self.viz_buttons = {}
+        self.graph_y = 145
         if display_type == "visualization":
             # For marks visualization
             if isinstance(data, pygame.Surface) and hasattr(parent_window, 'visualize_marks'):
-                # Center the buttons
+                # Two centered rows of three buttons
                 button_width = 150
-                button_height = 30
+                button_height = 28
                 button_spacing = 20
-                total_width = 4 * button_width + 3 * button_spacing
+                total_width = 3 * button_width + 2 * button_spacing
                 start_x = (self.width - total_width) // 2
                 
-                self.viz_buttons = {
-                    'student_avg': pygame.Rect(start_x, 100, button_width, button_height),
-                    'subject_perf': pygame.Rect(start_x + button_width + button_spacing, 100, button_width, button_height),
-                    'grade_dist': pygame.Rect(start_x + 2 * (button_width + button_spacing), 100, button_width, button_height),
-                    'subject_dist': pygame.Rect(start_x + 3 * (button_width + button_spacing), 100, button_width, button_height)
-                }
+                self.viz_buttons = {}
+                for i, key in enumerate(['student_avg', 'subject_perf', 'grade_dist',
+                                         'subject_dist', 'heatmap', 'correlation']):
+                    row, col = divmod(i, 3)
+                    self.viz_buttons[key] = pygame.Rect(start_x + col * (button_width + button_spacing),
+                                                        72 + row * (button_height + 6), button_width, button_height)
                 
                 # Remove subject-specific buttons
                 if not hasattr(parent_window, 'current_marks_viz'):
@@ -116,6 +162,49 @@ class DataDisplayWindow:
                 # No buttons for ECA visualization
                 pass
         
+        # The UserManagement screen behind any windows opened from this one
+        self.app = getattr(parent_window, 'app', parent_window)
+        
+        # Admin marks/ECA views pick students through a search box
+        self.student_search = "" if display_type in ("marks", "eca") and is_admin else None
+        
+        # Dataset files this view is drawn from; when another session or a
+        # script changes one of them, the view reloads itself. The frame
+        # loop only compares their versions (an os.stat() each); reading and
+        # rebuilding happen in a loading.Load (see refresh_data).
+        self.watching = {
+            "marks": {GRADES_FILE},
+            "eca": {ECA_FILE},
+            "visualization": {GRADES_FILE} if self.viz_buttons else {ECA_FILE},
+            "club_overlap": {ECA_FILE},
+            "leaderboard": {GRADES_FILE},
+            "query": {GRADES_FILE, ECA_FILE},
+        }.get(display_type, set())
+        self.versions = self.file_versions()
+        self.next_poll = time.monotonic() + POLL_INTERVAL
+        
+        # Marks, ECA and the student list come as the function loading them.
+        # It runs in a loading.Load, so the window opens at once and shows
+        # the rows when they are in (the student list as they are parsed)
+        if callable(data):
+            self.loading = Load(self.load_rows, data)
+            self.data = self.loading.rows
+        self.index_data()
+        
+        # Button in the top-right corner opening a related view (admin only)
+        self.header_button_rect = None
+        self.header_button_label, opens = {"eca": ("Club Overlap", 'visualize_club_overlap'),
+                                           "marks": ("Leaderboard", 'leaderboard_data'),
+                                           "students": ("Query", 'query_students')}.get(display_type, (None, None))
+        if opens and is_admin and hasattr(parent_window, opens):
+            self.header_button_rect = pygame.Rect(self.width - 190, 35, 160, 30)
+        
+        # Long lists (students, query results) only render the rows in view
+        self.scrolling = display_type in ("students", "query")
+        self.scroll = 0
+        self.row_height = 28
+        self.query_text = data['text'] if display_type == "query" else ""
+        
         # Back button
         self.button_width = 200
         self.button_height = 40
@@ -144,6 +233,266 @@ class DataDisplayWindow:
     def draw_rounded_rect(self, surface, color, rect, radius, border=0):
         pygame.draw.rect(surface, color, rect, border, border_radius=radius)
     
+    def showing_student_avg(self):
+        return (self.display_type == "visualization" and bool(self.viz_buttons)
+                and getattr(self.parent_window, 'current_marks_viz', None) == 'student_avg'
+                and hasattr(self.parent_window, 'student_avg_view'))
+    
+    def showing_eca_chart(self):
+        return self.display_type == "visualization" and not self.viz_buttons
+    
+    def list_rect(self):
+        # Area of the scrolling row list inside the data panel
+        top = 200 if self.display_type == "query" else 120
+        return pygame.Rect(70, top, self.width - 140, self.height - 130 - top)
+    
+    def row_count(self):
+        if self.display_type == "query":
+            return len(self.data['rows'])
+        return len(self.data)
+    
+    def visible_rows(self):
+        return max(1, self.list_rect().height // self.row_height)
+    
+    def scroll_by(self, rows):
+        limit = max(0, self.row_count() - self.visible_rows())
+        self.scroll = min(max(0, self.scroll + rows), limit)
+    
+    def draw_rows(self, row_text):
+        # Render only the rows in view; row_text(i) gives the text of row i,
+        # so the cost of a frame does not grow with the length of the list
+        area = self.list_rect()
+        count = self.row_count()
+        end = min(count, self.scroll + self.visible_rows())
+        for line, i in enumerate(range(self.scroll, end)):
+            text = self.text_font.render(row_text(i), True, COLORS['text'])
+            self.screen.blit(text, (area.x, area.y + line * self.row_height))
+        if count > self.visible_rows():
+            position = self.label_font.render(f"{self.scroll + 1}-{end} of {count} (scroll or Up/Down/PgUp/PgDn)",
+                                              True, COLORS['accent'])
+            self.screen.blit(position, (area.right - position.get_width(), area.bottom + 4))
+    
+    def student_row(self, i):
+        username, name, email, phone = self.data[i]
+        return f"{name} ({username}) - {email} - {phone}"
+    
+    def query_row(self, i):
+        data = self.data['data']
+        row = self.data['rows'][i]
+        average = data.averages[row]
+        parts = [data.usernames[row], f"avg {average:.1f}" if average == average else "no marks"]
+        for subject in self.data['subjects']:
+            grade = data.grades[row, data.matrix.subject_index[subject]]
+            parts.append(f"{subject} {grade:g}" if grade == grade else f"{subject} -")
+        parts.append(f"clubs {data.clubs[row]}")
+        return "   ".join(parts)
+    
+    def lookups(self, data, check=lambda: None):
+        # Lookups derived from the rows, rebuilt whenever they are reloaded.
+        # Touches no window state, so a background load can build them too;
+        # check() between the steps raises if that load was cancelled.
+        found = {'eca_index': None, 'standing': None}
+        
+        # Admin ECA view: index the rows once instead of scanning them every frame
+        if self.display_type == "eca" and self.is_admin:
+            found['eca_index'] = EcaIndex(data)
+        
+        # Admin marks/ECA views: a search over the students' usernames and
+        # names instead of a button per student
+        if self.student_search is not None:
+            check()
+            if self.display_type == "marks":
+                marks_by_student = found['marks_by_student'] = {}
+                for username, subject, grade in data:
+                    marks_by_student.setdefault(username, []).append(f"{subject}: {grade}")
+                usernames = sorted(marks_by_student)
+            else:
+                usernames = sorted(found['eca_index'].students)
+            check()
+            names = load_student_index().name_by_username
+            check()
+            found['student_index'] = SearchIndex((username, names.get(username, "")) for username in usernames)
+        
+        # Student marks view: where the student stands in the class
+        if self.display_type == "marks" and not self.is_admin and hasattr(self.app, 'student_standing'):
+            found['standing'] = self.app.student_standing()
+        return found
+    
+    def index_data(self, found=None):
+        if self.loading:
+            # Nothing to look up until the rows are in
+            found = {'eca_index': None, 'standing': None, 'student_index': SearchIndex()}
+        elif found is None:
+            found = self.lookups(self.data)
+        for name, value in found.items():
+            setattr(self, name, value)
+        if self.student_search is not None:
+            self.student_matches = self.student_index.search(self.student_search)
+    
+    def load_rows(self, load, progress=None):
+        # Runs in a loading.Load: the rows and their lookups
+        rows = load(progress=progress)
+        check = lambda: progress(rows)
+        check()
+        return rows, self.lookups(rows, check)
+    
+    def check_loading(self):
+        # Called every frame while loading; takes the rows once the load is done
+        load = self.loading
+        if self.display_type == "students":
+            self.data = load.rows
+        if not load.done():
+            return
+        self.loading = None
+        try:
+            self.data, found = load.result()
+        except Exception as e:
+            print(f"Error loading {self.display_type}: {e}")
+            self.data, found = [], None
+        self.index_data(found)
+        self.scroll_by(0)
+    
+    def stop_loading(self):
+        # Leaving the window: nobody will look at the rows
+        for load in (self.loading, self.refreshing):
+            if load:
+                load.cancel()
+        self.loading = self.refreshing = None
+    
+    def loading_status(self):
+        count = len(self.loading.rows)
+        return f"Loading... {count} rows so far" if count else "Loading..."
+    
+    def file_versions(self):
+        return {path: file_version(path) for path in self.watching}
+    
+    def files_changed(self):
+        # Whether a watched file changed since the view was built; at most
+        # one check per POLL_INTERVAL, and only os.stat() calls
+        now = time.monotonic()
+        if now < self.next_poll:
+            return False
+        self.next_poll = now + POLL_INTERVAL
+        versions = self.file_versions()
+        if versions == self.versions:
+            return False
+        self.versions = versions
+        return True
+    
+    def refresh_data(self, progress=None):
+        # Runs in a loading.Load once a watched file changed: everything that
+        # reads the files. Returns (what the view needs, lookups or None);
+        # charts return their data and are rendered in check_refresh.
+        app = self.app
+        if self.display_type in ("marks", "eca"):
+            return self.load_rows(app.load_marks if self.display_type == "marks" else app.load_eca, progress)
+        if self.display_type == "visualization" and self.viz_buttons:
+            kind = self.parent_window.current_marks_viz
+            return (kind, self.parent_window.chart_data(kind, self.parent_window.grade_matrix())), None
+        if self.display_type == "visualization":
+            return eca_summary(app.load_eca(), app.eca_grouping), None
+        if self.display_type == "club_overlap":
+            return app.club_overlap_data(), None
+        if self.display_type == "leaderboard":
+            return app.leaderboard_data(), None
+        return app.query_students(self.data['text']), None
+    
+    def check_refresh(self):
+        # Called every frame while refreshing; swaps the new data in when done
+        load = self.refreshing
+        if not load.done():
+            return
+        self.refreshing = None
+        try:
+            data, found = load.result()
+        except Exception as e:
+            print(f"Error reloading {self.display_type}: {e}")
+            return
+        app = self.app
+        if self.display_type == "visualization" and self.viz_buttons:
+            kind, chart_data = data
+            # A button may have picked another chart meanwhile
+            data = self.parent_window.visualize_marks(chart_data if kind == self.parent_window.current_marks_viz else None)
+        elif self.display_type == "visualization":
+            data = app.visualize_eca(data)
+        elif self.display_type == "club_overlap":
+            data = app.visualize_club_overlap(data)
+        self.data = data
+        self.index_data(found)
+        if self.scrolling:
+            self.scroll_by(0)
+    
+    def student_lines(self, username):
+        if self.display_type == "marks":
+            return self.marks_by_student.get(username, [])
+        return self.eca_index.activities_of(username)
+    
+    def draw_student_picker(self, y_offset):
+        # Search box, buttons for the first matches and the selected student's
+        # rows (or the matching students' rows while none is selected), drawn
+        # down to the bottom of the panel and no further
+        draw_search_box(self.screen, self.text_font, pygame.Rect(70, y_offset, self.width - 140, 32), self.student_search)
+        y_offset += 42
+        
+        button_width = 200
+        button_height = 30
+        button_spacing = 10
+        buttons_per_row = 3
+        max_buttons = 2 * buttons_per_row
+        
+        self.student_buttons = {}
+        usernames = self.student_index.usernames
+        for i, entry in enumerate(self.student_matches[:max_buttons]):
+            username = usernames[entry]
+            row = i // buttons_per_row
+            col = i % buttons_per_row
+            button_rect = pygame.Rect(
+                70 + col * (button_width + button_spacing),
+                y_offset + row * (button_height + button_spacing),
+                button_width,
+                button_height
+            )
+            self.student_buttons[username] = button_rect
+            
+            # Highlight selected student
+            color = COLORS['success'] if hasattr(self, 'selected_student') and self.selected_student == username else COLORS['button']
+            if button_rect.collidepoint(pygame.mouse.get_pos()):
+                color = COLORS['button_hover']
+            
+            self.draw_rounded_rect(self.screen, color, button_rect, 5)
+            self.draw_rounded_rect(self.screen, COLORS['text'], button_rect, 5, 2)
+            
+            text = self.text_font.render(username, True, WHITE)
+            text_rect = text.get_rect(center=button_rect.center)
+            self.screen.blit(text, text_rect)
+        
+        y_offset += 2 * (button_height + button_spacing)
+        count = len(self.student_matches)
+        if self.loading:
+            status = self.loading_status()
+        elif not count:
+            status = "No students match"
+        elif count > max_buttons:
+            status = f"{count} students match; type more of a username or name to narrow them down"
+        else:
+            status = f"{count} students match"
+        text = self.label_font.render(status, True, COLORS['accent'])
+        self.screen.blit(text, (70, y_offset))
+        y_offset += 30
+        
+        if hasattr(self, 'selected_student') and self.selected_student:
+            lines = self.student_lines(self.selected_student)
+        else:
+            lines = (f"{usernames[entry]} - {line}" for entry in self.student_matches
+                     for line in self.student_lines(usernames[entry]))
+        bottom = self.height - 130
+        for line in lines:
+            if y_offset > bottom:
+                break
+            text = self.text_font.render(line, True, COLORS['text'])
+            self.screen.blit(text, (70, y_offset))
+            y_offset += 30
+    
     def draw_data(self):
         # Draw background image if available
         if self.bg_image:
@@ -169,7 +518,9 @@ class DataDisplayWindow:
                     'student_avg': "Student Averages",
                     'subject_perf': "Subject Performance",
                     'grade_dist': "Grade Distribution",
-                    'subject_dist': "Subject Distribution"
+                    'subject_dist': "Subject Distribution",
+                    'heatmap': "Grade Heatmap",
+                    'correlation': "Subject Correlation"
                 }
                 
                 for key, rect in self.viz_buttons.items():
@@ -186,13 +537,24 @@ class DataDisplayWindow:
                 
                 # Draw the smaller, centered graph
                 graph_x = (self.width - self.data.get_width()) // 2
-                graph_y = 140 # Position below buttons
+                graph_y = self.graph_y # Position below buttons
                 self.screen.blit(self.data, (graph_x, graph_y))
+                
+                if self.showing_student_avg():
+                    view = self.parent_window.student_avg_view['view']
+                    hint = f"View: {view}  -  M: change view"
+                    if self.parent_window.student_avg_view['ranges']:
+                        hint += "  -  click a bar to drill in"
+                    hint_text = self.label_font.render(hint, True, COLORS['text'])
+                    self.screen.blit(hint_text, hint_text.get_rect(center=(self.width // 2, graph_y + self.data.get_height() + 12)))
             
             # For ECA visualization - just draw the pie chart without buttons
             elif self.display_type == "visualization" and hasattr(self.parent_window, 'visualize_eca'):
                 # Move graph higher (from y=150 to y=120)
                 self.screen.blit(self.data, (50, 120))
+                hint = f"Grouped by {self.app.eca_grouping}  -  G: change grouping"
+                hint_text = self.label_font.render(hint, True, COLORS['text'])
+                self.screen.blit(hint_text, hint_text.get_rect(center=(self.width // 2, 120 + self.data.get_height() + 12)))
         
         # Draw data content with a semi-transparent panel
         elif self.display_type != "visualization":
@@ -205,61 +567,7 @@ class DataDisplayWindow:
             if self.display_type == "marks":
                 # For admin, show student selection buttons
                 if self.is_admin:
-                    # Get unique usernames from marks data
-                    usernames = sorted(set(username for username, _, _ in self.data))
-                    
-                    # Create buttons for each student
-                    button_width = 200
-                    button_height = 30
-                    button_spacing = 10
-                    buttons_per_row = 3
-                    
-                    # Draw student selection buttons
-                    for i, username in enumerate(usernames):
-                        row = i // buttons_per_row
-                        col = i % buttons_per_row
-                        
-                        button_rect = pygame.Rect(
-                            70 + col * (button_width + button_spacing),
-                            y_offset + row * (button_height + button_spacing),
-                            button_width,
-                            button_height
-                        )
-                        
-                        # Store button rect for click detection
-                        if not hasattr(self, 'student_buttons'):
-                            self.student_buttons = {}
-                        self.student_buttons[username] = button_rect
-                        
-                        # Highlight selected student
-                        color = COLORS['success'] if hasattr(self, 'selected_student') and self.selected_student == username else COLORS['button']
-                        if button_rect.collidepoint(pygame.mouse.get_pos()):
-                            color = COLORS['button_hover']
-                        
-                        self.draw_rounded_rect(self.screen, color, button_rect, 5)
-                        self.draw_rounded_rect(self.screen, COLORS['text'], button_rect, 5, 2)
-                        
-                        text = self.text_font.render(username, True, WHITE)
-                        text_rect = text.get_rect(center=button_rect.center)
-                        self.screen.blit(text, text_rect)
-                    
-                    # Update y_offset for marks display
-                    y_offset += (len(usernames) // buttons_per_row + 1) * (button_height + button_spacing) + 20
-                    
-                    # Show marks for selected student or all students if none selected
-                    if hasattr(self, 'selected_student') and self.selected_student:
-                        # Filter marks for selected student
-                        student_marks = [(u, s, g) for u, s, g in self.data if u == self.selected_student]
-                        for username, subject, grade in student_marks:
-                            text = self.text_font.render(f"{subject}: {grade}", True, COLORS['text'])
-                            self.screen.blit(text, (70, y_offset))
-                            y_offset += 30
-                    else:
-                        # Show all marks
-                        for username, subject, grade in self.data:
-                            text = self.text_font.render(f"{username} - {subject}: {grade}", True, COLORS['text'])
-                            self.screen.blit(text, (70, y_offset))
-                            y_offset += 30
+                    self.draw_student_picker(y_offset)
                 else:
                     # Student view - show only their marks
                     for data in self.data:
@@ -276,64 +584,22 @@ class DataDisplayWindow:
                             text = self.text_font.render(f"{subject}: {grade}", True, COLORS['text'])
                             self.screen.blit(text, (70, y_offset))
                             y_offset += 30
+                    
+                    if self.standing:
+                        y_offset += 20
+                        lines = [f"Class rank: {self.standing['rank']} of {self.standing['of']} "
+                                 f"(average {self.standing['average']:.1f}, "
+                                 f"at or above {self.standing['percentile']:.0f}% of the class)"]
+                        lines += [f"{subject}: at or above {percentile:.0f}% of the class"
+                                  for subject, percentile in self.standing['subjects'].items()]
+                        for line in lines:
+                            text = self.label_font.render(line, True, COLORS['accent'])
+                            self.screen.blit(text, (70, y_offset))
+                            y_offset += 24
             elif self.display_type == "eca":
                 # For admin, show student selection buttons
                 if self.is_admin:
-                    # Get unique usernames from ECA data
-                    usernames = sorted(set(username for username, _ in self.data))
-                    
-                    # Create buttons for each student
-                    button_width = 200
-                    button_height = 30
-                    button_spacing = 10
-                    buttons_per_row = 3
-                    
-                    # Draw student selection buttons
-                    for i, username in enumerate(usernames):
-                        row = i // buttons_per_row
-                        col = i % buttons_per_row
-                        
-                        button_rect = pygame.Rect(
-                            70 + col * (button_width + button_spacing),
-                            y_offset + row * (button_height + button_spacing),
-                            button_width,
-                            button_height
-                        )
-                        
-                        # Store button rect for click detection
-                        if not hasattr(self, 'student_buttons'):
-                            self.student_buttons = {}
-                        self.student_buttons[username] = button_rect
-                        
-                        # Highlight selected student
-                        color = COLORS['success'] if hasattr(self, 'selected_student') and self.selected_student == username else COLORS['button']
-                        if button_rect.collidepoint(pygame.mouse.get_pos()):
-                            color = COLORS['button_hover']
-                        
-                        self.draw_rounded_rect(self.screen, color, button_rect, 5)
-                        self.draw_rounded_rect(self.screen, COLORS['text'], button_rect, 5, 2)
-                        
-                        text = self.text_font.render(username, True, WHITE)
-                        text_rect = text.get_rect(center=button_rect.center)
-                        self.screen.blit(text, text_rect)
-                    
-                    # Update y_offset for ECA display
-                    y_offset += (len(usernames) // buttons_per_row + 1) * (button_height + button_spacing) + 20
-                    
-                    # Show ECA for selected student or all students if none selected
-                    if hasattr(self, 'selected_student') and self.selected_student:
-                        # Filter ECA for selected student
-                        student_eca = [(u, a) for u, a in self.data if u == self.selected_student]
-                        for username, activity in student_eca:
-                            text = self.text_font.render(activity, True, COLORS['text'])
-                            self.screen.blit(text, (70, y_offset))
-                            y_offset += 30
-                    else:
-                        # Show all ECA
-                        for username, activity in self.data:
-                            text = self.text_font.render(f"{username} - {activity}", True, COLORS['text'])
-                            self.screen.blit(text, (70, y_offset))
-                            y_offset += 30
+                    self.draw_student_picker(y_offset)
                 else:
                     # Student view - show only their ECA
                     for data in self.data:
@@ -350,13 +616,52 @@ class DataDisplayWindow:
                             text = self.text_font.render(activity, True, COLORS['text'])
                             self.screen.blit(text, (70, y_offset))
                             y_offset += 30
+            elif self.display_type == "club_overlap":
+                self.screen.blit(self.data, ((self.width - self.data.get_width()) // 2, 100))
+            elif self.display_type == "leaderboard":
+                # Top and bottom students side by side
+                for x, heading, entries, first_rank, step in (
+                        (70, "Top students", self.data['top'], 1, 1),
+                        (self.width // 2 + 10, "Lowest averages", self.data['bottom'], self.data['of'], -1)):
+                    text = self.text_font.render(heading, True, COLORS['accent'])
+                    self.screen.blit(text, (x, y_offset))
+                    for i, (username, average) in enumerate(entries):
+                        line = f"{first_rank + i * step}. {username}  {average:.1f}"
+                        text = self.text_font.render(line, True, COLORS['text'])
+                        self.screen.blit(text, (x, y_offset + 30 + i * 28))
             elif self.display_type == "students":
-                for username, name, email, phone in self.data:
-                    # Display name, username, email, and phone
-                    display_text = f"{name} ({username}) - {email} - {phone}"
-                    text = self.text_font.render(display_text, True, COLORS['text'])
-                    self.screen.blit(text, (70, y_offset))
-                    y_offset += 30
+                # Display name, username, email, and phone
+                self.draw_rows(self.student_row)
+            elif self.display_type == "query":
+                input_rect = pygame.Rect(70, y_offset, self.width - 140, 36)
+                self.draw_rounded_rect(self.screen, COLORS['input_bg'], input_rect, 10)
+                self.draw_rounded_rect(self.screen, COLORS['input_border'], input_rect, 10, 2)
+                text = self.text_font.render(self.query_text + "|", True, COLORS['input_text'])
+                self.screen.blit(text, (input_rect.x + 10, input_rect.y + 9))
+                
+                hint = "e.g. Mathematics < 60 and in Football Team,  3+ subjects > 90,  clubs >= 2  (Enter to run)"
+                text = self.label_font.render(hint, True, COLORS['text'])
+                self.screen.blit(text, (70, y_offset + 42))
+                
+                if self.data['error']:
+                    text = self.text_font.render(self.data['error'], True, COLORS['error'])
+                else:
+                    text = self.text_font.render(f"{len(self.data['rows'])} students match", True, COLORS['accent'])
+                self.screen.blit(text, (70, y_offset + 60))
+                self.draw_rows(self.query_row)
+            
+            # The picker shows its own loading status
+            if self.loading and not (self.is_admin and self.display_type in ("marks", "eca")):
+                text = self.label_font.render(self.loading_status(), True, COLORS['accent'])
+                self.screen.blit(text, (70, self.list_rect().bottom + 4))
+        
+        if self.header_button_rect:
+            mouse_pos = pygame.mouse.get_pos()
+            color = COLORS['button_hover'] if self.header_button_rect.collidepoint(mouse_pos) else COLORS['button']
+            self.draw_rounded_rect(self.screen, color, self.header_button_rect, 5)
+            self.draw_rounded_rect(self.screen, COLORS['text'], self.header_button_rect, 5, 2)
+            text = self.text_font.render(self.header_button_label, True, WHITE)
+            self.screen.blit(text, text.get_rect(center=self.header_button_rect.center))
         
         # Draw back button with hover effect
         mouse_pos = pygame.mouse.get_pos()
@@ -368,14 +673,23 @@ class DataDisplayWindow:
         back_text_rect = back_text.get_rect(center=self.back_button_rect.center)
         self.screen.blit(back_text, back_text_rect)
     
+    @profiler.screen("DataDisplayWindow")
     def run(self):
         clock = pygame.time.Clock()
         running = True
         
         while running:
-            for event in pygame.event.get():
+            metrics.begin_frame("DataDisplayWindow", self)
+            if self.loading:
+                self.check_loading()
+            elif self.refreshing:
+                self.check_refresh()
+            elif self.watching and self.files_changed():
+                self.refreshing = Load(self.refresh_data)
+            for event in metrics.poll_events():
                 if event.type == pygame.QUIT:
                     running = False
+                    self.stop_loading()
                 
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     mouse_pos = pygame.mouse.get_pos()
@@ -386,8 +700,27 @@ class DataDisplayWindow:
                             if rect.collidepoint(mouse_pos):
                                 if hasattr(self.parent_window, 'visualize_marks'):
                                     self.parent_window.current_marks_viz = key
+                                    # Choosing Student Averages again leaves a drill-in
+                                    if key == 'student_avg':
+                                        self.parent_window.student_avg_focus = None
                                     self.data = self.parent_window.visualize_marks()
                                 # No need to handle ECA visualization buttons as they're removed
+                        
+                        # Clicking a bar of the summarized student averages drills into it
+                        if self.showing_student_avg():
+                            graph_rect = self.data.get_rect(topleft=((self.width - self.data.get_width()) // 2, self.graph_y))
+                            if graph_rect.collidepoint(mouse_pos):
+                                chart_pos = (mouse_pos[0] - graph_rect.x, mouse_pos[1] - graph_rect.y)
+                                if self.parent_window.drill_student_avg(chart_pos):
+                                    self.data = self.parent_window.visualize_marks()
+                    
+                    if self.header_button_rect and self.header_button_rect.collidepoint(mouse_pos):
+                        if self.display_type == "eca":
+                            DataDisplayWindow(self.parent_window.visualize_club_overlap(), "club_overlap", self.is_admin, self)
+                        elif self.display_type == "students":
+                            DataDisplayWindow(self.app.query_students(), "query", self.is_admin, self)
+                        else:
+                            DataDisplayWindow(self.parent_window.leaderboard_data(), "leaderboard", self.is_admin, self)
                     
                     # Handle student selection buttons for marks and ECA
                     if hasattr(self, 'student_buttons'):
@@ -399,24 +732,70 @@ class DataDisplayWindow:
                     # Handle back button click
                     if self.back_button_rect.collidepoint(mouse_pos):
                         running = False
+                        self.stop_loading()
                         if self.parent_window:
                             self.parent_window.run()
                 
+                if event.type == pygame.MOUSEWHEEL and self.scrolling:
+                    self.scroll_by(-3 * event.y)
+                
                 if event.type == pygame.KEYDOWN:
+                    scroll_keys = {pygame.K_UP: -1, pygame.K_DOWN: 1,
+                                   pygame.K_PAGEUP: -self.visible_rows(), pygame.K_PAGEDOWN: self.visible_rows()}
                     if event.key == pygame.K_ESCAPE:
                         running = False
+                        self.stop_loading()
                         if self.parent_window:
                             self.parent_window.run()
+                    elif event.key in scroll_keys and self.scrolling:
+                        self.scroll_by(scroll_keys[event.key])
+                    elif self.student_search is not None:
+                        # Typing goes to the student search; Enter picks the first match
+                        if event.key == pygame.K_RETURN:
+                            if self.student_matches:
+                                self.selected_student = self.student_index.usernames[self.student_matches[0]]
+                        elif event.key == pygame.K_BACKSPACE:
+                            self.student_search = self.student_search[:-1]
+                            self.student_matches = self.student_index.search(self.student_search)
+                        elif event.unicode and event.unicode.isprintable():
+                            self.student_search += event.unicode
+                            self.student_matches = self.student_index.search(self.student_search)
+                    elif self.display_type == "query":
+                        if event.key == pygame.K_RETURN:
+                            self.data = self.app.query_students(self.query_text)
+                            self.scroll = 0
+                        elif event.key == pygame.K_BACKSPACE:
+                            self.query_text = self.query_text[:-1]
+                        elif event.unicode and event.unicode.isprintable():
+                            self.query_text += event.unicode
+                    elif event.key == pygame.K_m and self.showing_student_avg():
+                        self.parent_window.cycle_student_avg_mode()
+                        self.data = self.parent_window.visualize_marks()
+                    elif event.key == pygame.K_g and self.showing_eca_chart():
+                        self.app.cycle_eca_grouping()
+                        self.data = self.app.visualize_eca()
             
             # Draw data
+            metrics.mark("draw")
             self.draw_data()
             
-            pygame.display.flip()
+            metrics.flip()
             clock.tick(60)
         
         pygame.quit()
 
 class UserManagement:
+    chart_backend = CHART_BACKEND
+    # student_avg chart: one of STUDENT_AVG_MODES, and the (low, high, closed)
+    # average range drilled into, if any
+    student_avg_mode = 'auto'
+    student_avg_focus = None
+    # ECA chart: wedges per 'activity' or per 'category' (ACTIVITY_TYPES),
+    # switched with G on the chart
+    eca_grouping = 'activity'
+    # (student index, search text) that delete_match_list was computed for
+    delete_matches_key = None
+
     def __init__(self, username):
         # Initialize Pygame
         pygame.init()
@@ -525,6 +904,8 @@ class UserManagement:
         self.showing_delete_student = False
         self.students_to_delete = []
         self.selected_student = None
+        self.delete_search = ""
+        self.delete_scroll = 0
         
         # Run the main loop
         self.run()
@@ -538,14 +919,10 @@ class UserManagement:
         )
         return button_rect
     
+    @metrics.timed("load")
     def check_if_admin(self):
         try:
-            with open('dataset/users.txt', 'r') as file:
-                for line in file:
-                    username, password, role, *_ = line.strip().split(',')
-                    if username == self.username and role == 'admin':
-                        return True
-            return False
+            return data_service.call('role', username=self.username) == 'admin'
         except FileNotFoundError:
             return False
     
@@ -563,54 +940,26 @@ class UserManagement:
     def draw_rounded_rect(self, surface, color, rect, radius, border=0):
         pygame.draw.rect(surface, color, rect, border, border_radius=radius)
     
-    def load_marks(self):
-        try:
-            marks = []
-            with open('dataset/grades.txt', 'r') as file:
-                for line in file:
-                    username, subject, grade = line.strip().split(',')
-                    if username == self.username or self.is_admin:
-                        marks.append((username, subject, grade))
-            return marks
-        except FileNotFoundError:
-            return []
+    # progress: see loading.Load
+    @metrics.timed("load")
+    def load_marks(self, progress=None):
+        return data_service.call('marks', progress, username=None if self.is_admin else self.username)
     
-    def load_eca(self):
-        try:
-            activities = []
-            with open('dataset/eca.txt', 'r') as file:
-                for line in file:
-                    username, activity = line.strip().split(',')
-                    if username == self.username or self.is_admin:
-                        activities.append((username, activity))
-            return activities
-        except FileNotFoundError:
-            return []
+    @metrics.timed("load")
+    def load_eca(self, progress=None):
+        return data_service.call('eca', progress, username=None if self.is_admin else self.username)
     
-    def load_all_students(self):
+    @metrics.timed("load")
+    def load_all_students(self, progress=None):
         try:
-            students = []
-            with open('dataset/users.txt', 'r') as file:
-                for line_num, line in enumerate(file):
-                    line = line.strip()
-                    if not line: # Skip empty lines
-                        continue
-                    parts = line.split(',')
-                    # Expecting: username, password, role, id, name, email, phone
-                    if len(parts) == 7:
-                        username, password, role, user_id, name, email, phone = parts
-                        if role == 'student':
-                            students.append((username, name, email, phone))
-                    else:
-                        print(f"Warning: Skipping malformed line {line_num + 1} in users.txt: {line}")
-            return students
-        except FileNotFoundError:
-            print("Warning: users.txt not found.")
-            return []
+            return data_service.call('students', progress)
+        except Cancelled:
+            raise
         except Exception as e:
             print(f"Error loading students: {e}")
             return []
     
+    @metrics.timed("write")
     def add_student(self):
         # Validate input fields
         username = self.new_student_data['username'].strip()
@@ -658,272 +1007,172 @@ class UserManagement:
                 self.error_message = f"{subjects[i]} mark should be between 0 and 100."
                 return False
 
-        # Check if username already exists
-        try:
-            with open('dataset/users.txt', 'r') as f:
-                for line in f:
-                    if line.startswith(username + ','):
-                        self.error_message = f"Username '{username}' already exists."
-                        return False
-        except FileNotFoundError:
-            pass # File doesn't exist, so username can't exist yet
-
-        # Generate user ID (example: STU001)
-        user_id_prefix = "STU"
-        next_id = 1
-        try:
-            with open('dataset/users.txt', 'r') as f:
-                 existing_ids = [line.split(',')[2] for line in f if line.strip() and len(line.split(',')) > 2]
-                 stu_ids = [int(id[len(user_id_prefix):]) for id in existing_ids if id.startswith(user_id_prefix) and id[len(user_id_prefix):].isdigit()]
-                 if stu_ids:
-                    next_id = max(stu_ids) + 1
-        except FileNotFoundError:
-            pass # Start with ID 1 if file doesn't exist
-            
-        user_id = f"{user_id_prefix}{next_id:03d}"
+        # Handle multiple activities separated by semicolons or commas
+        activities = [a.strip() for a in eca.replace(';', ',').split(',') if a.strip()]
+        new_marks = [(subject, mark) for subject, mark in zip(subjects, marks_fields) if mark]
         
-        # Append new user to users.txt
-        user_data_line = f"{username},password,student,{user_id},{name},{email},{phone}\n" # Note: Storing plain password temporarily
+        # The files are written by the data service if one is running
         try:
-            with open('dataset/users.txt', 'a') as f:
-                f.write(user_data_line)
-        except IOError as e:
-            self.error_message = f"Error writing to users file: {e}"
+            user_id = data_service.call('add_student', username=username, password=password, name=name,
+                                        email=email, phone=phone, marks=new_marks, activities=activities)
+        except RecordError as e:
+            self.error_message = str(e)
             return False
-            
-        # Append new user to passwords.txt
-        password_line = f"{username},{password}\n"
-        try:
-            with open('dataset/passwords.txt', 'a') as f:
-                f.write(password_line)
-        except IOError as e:
-             self.error_message = f"Error writing to passwords file: {e}"
-             # Attempt to clean up the entry in users.txt if password writing failed
-             try:
-                 with open('dataset/users.txt', 'r') as f:
-                     lines = f.readlines()
-                 with open('dataset/users.txt', 'w') as f:
-                     for line in lines:
-                         if not line.startswith(username + ','):
-                             f.write(line)
-             except Exception as cleanup_e:
-                 print(f"Error during cleanup: {cleanup_e}")
-             return False
         
-        # Add marks to grades.txt if provided
-        try:
-            with open('dataset/grades.txt', 'a') as f:
-                for i, mark in enumerate(marks_fields):
-                    if mark:  # Only add if mark is provided
-                        grade_line = f"{username},{subjects[i]},{mark}\n"
-                        f.write(grade_line)
-        except IOError as e:
-            self.error_message = f"Error writing to grades file: {e}"
-            # We don't delete the user at this point, just report the error
-            print(f"Warning: User created but grades not saved: {e}")
-        
-        # Add ECA activities to eca.txt if provided
-        if eca:
-            try:
-                # Handle multiple activities separated by semicolons or commas
-                activities = [a.strip() for a in eca.replace(';', ',').split(',') if a.strip()]
-                
-                with open('dataset/eca.txt', 'a') as f:
-                    for activity in activities:
-                        eca_line = f"{username},{activity}\n"
-                        f.write(eca_line)
-            except IOError as e:
-                self.error_message = f"Error writing to ECA file: {e}"
-                # We don't delete the user at this point, just report the error
-                print(f"Warning: User created but ECA not saved: {e}")
-
         print(f"Student '{name}' ({username}) added successfully with ID {user_id}.")
         self.error_message = "" # Clear error on success
+        self.refresh_live_charts()
         return True
     
-    def visualize_marks(self):
-        # Create a figure with a single plot and higher DPI
-        fig = plt.figure(figsize=(12, 8), dpi=150)
-        fig.patch.set_facecolor(MPL_COLORS['background'])  # Match background color
-        
-        # Get marks data
-        marks = self.load_marks()
-        
-        # Prepare data for different visualizations
-        student_marks = {}
-        subject_marks = {}
-        
-        for username, subject, grade in marks:
-            # For student averages
-            if username not in student_marks:
-                student_marks[username] = []
-            student_marks[username].append(float(grade))
-            
-            # For subject averages
-            if subject not in subject_marks:
-                subject_marks[subject] = []
-            subject_marks[subject].append(float(grade))
-        
-        # Create a single large plot
-        ax = fig.add_subplot(111)
-        
+    def live_chart(self, kind, width, height):
+        # One persistent chart per type; its figure and artists are reused
+        if not hasattr(self, 'live_charts'):
+            self.live_charts = {}
+        if kind not in self.live_charts:
+            self.live_charts[kind] = LIVE_CHARTS[kind](chart_figsize(width, height), CHART_DPI)
+        return self.live_charts[kind]
+    
+    def native_charts(self):
+        if not hasattr(self, 'native_renderer'):
+            self.native_renderer = NativeChartRenderer()
+        return self.native_renderer
+    
+    def refresh_live_charts(self):
+        # Push changed data into the charts that have been opened; they redraw
+        # the next time they are shown
+        charts = getattr(self, 'live_charts', {})
+        if not charts:
+            return
+        matrix = self.grade_matrix()
+        for kind, chart in charts.items():
+            if kind == 'eca':
+                chart.title = ECA_TITLES[self.eca_grouping]
+                chart.set_data(eca_summary(self.load_eca(), self.eca_grouping))
+            elif kind == 'club_overlap':
+                chart.set_data(self.club_overlap_data())
+            else:
+                chart.set_data(self.chart_data(kind, matrix))
+    
+    def grade_matrix(self):
+        # Cached per version of grades.txt for admins; students only see their own
+        if self.is_admin:
+            return load_grade_matrix()
+        return GradeMatrix(self.load_marks())
+    
+    def chart_data(self, kind, matrix):
+        # What a marks chart is drawn from. The student_avg chart gets a summary
+        # whose size doesn't grow with the roster (see summarize_student_avgs).
+        if kind != 'student_avg':
+            return matrix
+        student_avgs = matrix.student_averages()
+        mode, value_range = self.student_avg_mode, (0, 100)
+        if self.student_avg_focus:
+            student_avgs = students_in_range(student_avgs, *self.student_avg_focus)
+            value_range = self.student_avg_focus[:2]
+            # Drilled down far enough to show the students themselves
+            if len(student_avgs) <= STUDENT_AVG_LIMIT:
+                mode = 'bars'
+        self.student_avg_view = summarize_student_avgs(student_avgs, mode, value_range=value_range)
+        return self.student_avg_view
+    
+    def cycle_student_avg_mode(self):
+        index = STUDENT_AVG_MODES.index(self.student_avg_mode)
+        self.student_avg_mode = STUDENT_AVG_MODES[(index + 1) % len(STUDENT_AVG_MODES)]
+        self.student_avg_focus = None
+    
+    def cycle_eca_grouping(self):
+        groupings = list(ECA_TITLES)
+        self.eca_grouping = groupings[(groupings.index(self.eca_grouping) + 1) % len(groupings)]
+    
+    def drill_student_avg(self, pos):
+        # Narrow the student_avg chart to the students behind the bar at pos
+        # (relative to the chart). Returns True when the chart changed.
+        view = getattr(self, 'student_avg_view', None)
+        if not view:
+            return False
+        if self.chart_backend == 'native':
+            index = self.native_charts().bar_index_at((self.width - 200, self.height - 250), len(view['values']), pos)
+        else:
+            index = self.live_chart('student_avg', self.width - 200, self.height - 250).index_at(pos)
+        focus = drill_range(view, index) if index is not None else None
+        if not focus:
+            return False
+        self.student_avg_focus = focus
+        return True
+    
+    # The visualize_* methods take the chart's data when it was already
+    # loaded (by a DataDisplayWindow refresh); otherwise they load it
+    
+    @metrics.timed("chart")
+    def visualize_marks(self, data=None):
         # Determine which visualization to show based on the current selection
         if not hasattr(self, 'current_marks_viz'):
             self.current_marks_viz = 'student_avg'
         
-        if self.current_marks_viz == 'student_avg':
-            # Bar chart for student averages
-            students = list(student_marks.keys())
-            averages = [sum(marks)/len(marks) for marks in student_marks.values()]
-            
-            bars = ax.bar(students, averages, color=MPL_COLORS['primary'])
-            ax.set_title('Average Marks by Student', pad=20, color=MPL_COLORS['text'], fontsize=16)
-            ax.set_xlabel('Student', color=MPL_COLORS['text'], fontsize=14)
-            ax.set_ylabel('Average Grade', color=MPL_COLORS['text'], fontsize=14)
-            plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-            
-            # Add value labels on top of bars
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.1f}',
-                        ha='center', va='bottom')
-        
-        elif self.current_marks_viz == 'subject_perf':
-            # Line chart for subject performance
-            subjects = list(subject_marks.keys())
-            subject_averages = [sum(marks)/len(marks) for marks in subject_marks.values()]
-            
-            ax.plot(subjects, subject_averages, marker='o', color=MPL_COLORS['secondary'], linewidth=2)
-            ax.set_title('Subject-wise Performance', pad=20, color=MPL_COLORS['text'], fontsize=16)
-            ax.set_xlabel('Subject', color=MPL_COLORS['text'], fontsize=14)
-            ax.set_ylabel('Average Grade', color=MPL_COLORS['text'], fontsize=14)
-            plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-            
-            # Add value labels on points
-            for i, value in enumerate(subject_averages):
-                ax.text(i, value, f'{value:.1f}', ha='center', va='bottom')
-        
-        elif self.current_marks_viz == 'grade_dist':
-            # Pie chart for grade distribution
-            grade_ranges = {
-                'A (90-100)': 0,
-                'B (80-89)': 0,
-                'C (70-79)': 0,
-                'D (60-69)': 0,
-                'F (<60)': 0
-            }
-            
-            for grades in student_marks.values():
-                for grade in grades:
-                    if grade >= 90:
-                        grade_ranges['A (90-100)'] += 1
-                    elif grade >= 80:
-                        grade_ranges['B (80-89)'] += 1
-                    elif grade >= 70:
-                        grade_ranges['C (70-79)'] += 1
-                    elif grade >= 60:
-                        grade_ranges['D (60-69)'] += 1
-                    else:
-                        grade_ranges['F (<60)'] += 1
-            
-            colors = [MPL_COLORS['success'], MPL_COLORS['primary'], MPL_COLORS['button'], MPL_COLORS['accent'], MPL_COLORS['warning']]
-            wedges, texts, autotexts = ax.pie(grade_ranges.values(), labels=grade_ranges.keys(), autopct='%1.1f%%',
-                                          colors=colors, startangle=90)
-            ax.set_title('Grade Distribution', pad=20, color=MPL_COLORS['text'], fontsize=16)
-        
-        elif self.current_marks_viz == 'subject_dist':
-            # Box plot for grade distribution by subject
-            subjects = list(subject_marks.keys())
-            subject_data = [subject_marks[subject] for subject in subjects]
-            box = ax.boxplot(subject_data, labels=subjects, patch_artist=True)
-            
-            # Customize box plot colors
-            for patch in box['boxes']:
-                patch.set_facecolor(MPL_COLORS['primary'])
-            
-            ax.set_title('Grade Distribution by Subject', pad=20, color=MPL_COLORS['text'], fontsize=16)
-            ax.set_xlabel('Subject', color=MPL_COLORS['text'], fontsize=14)
-            ax.set_ylabel('Grade', color=MPL_COLORS['text'], fontsize=14)
-            plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
-        
-        # Adjust layout and style
-        plt.tight_layout()
-        fig.patch.set_facecolor(MPL_COLORS['background'])
-        
-        # Convert to Pygame surface
-        canvas = FigureCanvasAgg(fig)
-        canvas.draw()
-        renderer = canvas.get_renderer()
-        raw_data = renderer.tostring_rgb()
-        
-        size = canvas.get_width_height()
-        surf = pygame.image.fromstring(raw_data, size, "RGB")
-        
-        # Scale the surface to a smaller size using smoothscale
-        target_width = self.width - 200  # Reduced from -100
-        target_height = self.height - 250 # Reduced from -200
-        scaled_surf = pygame.transform.smoothscale(surf, (target_width, target_height))
-        
-        return scaled_surf
+        if data is None:
+            data = self.chart_data(self.current_marks_viz, self.grade_matrix())
+        if self.chart_backend == 'native':
+            return self.native_charts().marks_chart(self.current_marks_viz, data,
+                                                    (self.width - 200, self.height - 250))
+        
+        # Rendered straight at the size it is shown at (no downscaling afterwards)
+        chart = self.live_chart(self.current_marks_viz, self.width - 200, self.height - 250)
+        chart.set_data(data)
+        chart.render()
+        return chart_surface(chart)
     
-    def visualize_eca(self):
-        # Create a figure with a single plot and higher DPI
-        fig = plt.figure(figsize=(16, 10), dpi=150)
-        fig.patch.set_facecolor(MPL_COLORS['background'])
-        
-        # Get ECA data
-        activities = self.load_eca()
-        
-        # Prepare data for visualizations
-        activity_counts = {}
-        student_activities = {}
-        activity_types = {
-            'Sports': ['Football', 'Basketball', 'Cricket', 'Tennis'],
-            'Arts': ['Drama', 'Music', 'Dance', 'Art'],
-            'Academic': ['Debate', 'Science Club', 'Math Club'],
-            'Other': ['Community Service', 'Environmental Club']
-        }
-        
-        for username, activity in activities:
-            # Count activities
-            if activity not in activity_counts:
-                activity_counts[activity] = 0
-            activity_counts[activity] += 1
-            
-            # Group by student
-            if username not in student_activities:
-                student_activities[username] = set()
-            student_activities[username].add(activity)
-        
-        # Create a single large plot with proper margins
-        ax = fig.add_subplot(111)
-        plt.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-        
-        # Always show activity distribution (pie chart)
-        colors = plt.cm.Pastel1(np.linspace(0, 1, len(activity_counts)))
-        wedges, texts, autotexts = ax.pie(activity_counts.values(), labels=activity_counts.keys(), autopct='%1.1f%%',
-                                      colors=colors, startangle=90, textprops={'fontsize': 12})
-        ax.set_title('ECA Activity Distribution', pad=20, color=MPL_COLORS['text'], fontsize=20)
-        
-        # Adjust layout and style
-        plt.tight_layout()
-        
-        # Convert to Pygame surface with higher quality
-        canvas = FigureCanvasAgg(fig)
-        canvas.draw()
-        renderer = canvas.get_renderer()
-        raw_data = renderer.tostring_rgb()
-        
-        size = canvas.get_width_height()
-        surf = pygame.image.fromstring(raw_data, size, "RGB")
-        
-        # Scale the surface to fit the window while maintaining aspect ratio
-        target_width = self.width - 100
-        target_height = self.height - 200
-        scaled_surf = pygame.transform.smoothscale(surf, (target_width, target_height))
-        
-        return scaled_surf
+    @metrics.timed("chart")
+    def visualize_eca(self, counts=None):
+        # Top activities (or categories) plus "Other"; bounded however many clubs there are
+        if counts is None:
+            counts = eca_summary(self.load_eca(), self.eca_grouping)
+        title = ECA_TITLES[self.eca_grouping]
+        if self.chart_backend == 'native':
+            return self.native_charts().eca_chart(counts, (self.width - 100, self.height - 200), title)
+        
+        # Rendered at the size of the area the pie chart is drawn in
+        chart = self.live_chart('eca', self.width - 100, self.height - 200)
+        chart.title = title
+        chart.set_data(counts)
+        chart.render()
+        return chart_surface(chart)
+    
+    @metrics.timed("load")
+    def student_standing(self):
+        return load_leaderboard().standing(self.username)
+    
+    @metrics.timed("load")
+    def leaderboard_data(self, k=10):
+        board = load_leaderboard()
+        return {'top': board.overall.top(k), 'bottom': board.overall.bottom(k), 'of': len(board.overall)}
+    
+    @metrics.timed("query")
+    def query_students(self, text=""):
+        # Rows of load_query_data() matching the query, best average first
+        data = load_query_data()
+        try:
+            query = Query(text)
+            return {'text': text, 'data': data, 'rows': query.run(data), 'subjects': query.subjects(data), 'error': None}
+        except QueryError as e:
+            return {'text': text, 'data': data, 'rows': [], 'subjects': [], 'error': str(e)}
+    
+    def club_overlap_data(self):
+        # Students shared between each pair of the largest clubs
+        index = load_eca_index() if self.is_admin else EcaIndex(self.load_eca())
+        activities = index.top_activities()
+        return activities, index.overlap_matrix(activities)
+    
+    @metrics.timed("chart")
+    def visualize_club_overlap(self, data=None):
+        if data is None:
+            data = self.club_overlap_data()
+        if self.chart_backend == 'native':
+            return self.native_charts().club_overlap_chart(data, (self.width - 100, self.height - 200))
+        
+        chart = self.live_chart('club_overlap', self.width - 100, self.height - 200)
+        chart.set_data(data)
+        chart.render()
+        return chart_surface(chart)
     
     def draw_add_student_form(self):
         # Define input fields and positions
@@ -1074,57 +1323,25 @@ class UserManagement:
 
         return input_rects, submit_rect, back_button_rect # Return the rects
     
+    @metrics.timed("write")
     def delete_student(self, username):
         try:
-            # Read all lines from users.txt
-            with open('dataset/users.txt', 'r') as file:
-                lines = file.readlines()
-            
-            # Filter out the student to delete
-            new_lines = [line for line in lines if not line.startswith(f"{username},")]
-            
-            # Write back the filtered lines
-            with open('dataset/users.txt', 'w') as file:
-                file.writelines(new_lines)
-            
-            # Read all lines from passwords.txt
-            with open('dataset/passwords.txt', 'r') as file:
-                lines = file.readlines()
-            
-            # Filter out the student's password
-            new_lines = [line for line in lines if not line.startswith(f"{username},")]
-            
-            # Write back the filtered lines
-            with open('dataset/passwords.txt', 'w') as file:
-                file.writelines(new_lines)
-            
-            # Read all lines from grades.txt
-            with open('dataset/grades.txt', 'r') as file:
-                lines = file.readlines()
-            
-            # Filter out the student's grades
-            new_lines = [line for line in lines if not line.startswith(f"{username},")]
-            
-            # Write back the filtered lines
-            with open('dataset/grades.txt', 'w') as file:
-                file.writelines(new_lines)
-            
-            # Read all lines from eca.txt
-            with open('dataset/eca.txt', 'r') as file:
-                lines = file.readlines()
-            
-            # Filter out the student's ECA activities
-            new_lines = [line for line in lines if not line.startswith(f"{username},")]
-            
-            # Write back the filtered lines
-            with open('dataset/eca.txt', 'w') as file:
-                file.writelines(new_lines)
-            
+            data_service.call('delete_student', username=username)
+            self.refresh_live_charts()
             return True
         except Exception as e:
             print(f"Error deleting student: {e}")
             return False
     
+    def delete_matches(self):
+        # Usernames matching the delete screen's search box, recomputed only
+        # when the text or users.txt changes
+        index = load_student_index()
+        if self.delete_matches_key != (index, self.delete_search):
+            self.delete_matches_key = (index, self.delete_search)
+            self.delete_match_list = [index.usernames[i] for i in index.search(self.delete_search)]
+        return self.delete_match_list
+    
     def draw_delete_student_form(self):
         # Draw background
         if self.bg_image:
@@ -1140,8 +1357,6 @@ class UserManagement:
         self.screen.blit(shadow, shadow_rect)
         self.screen.blit(title, title_rect)
         
-        # Load students
-        students = self.load_all_students()
         student_buttons = {} # Initialize dictionary to store button rects
         
         # Layout parameters for student buttons
@@ -1151,10 +1366,31 @@ class UserManagement:
         button_spacing_v = 15
         buttons_per_row = 3
         start_x = (self.width - (buttons_per_row * button_width + (buttons_per_row - 1) * button_spacing_h)) // 2
-        y_offset = 130 # Start buttons lower
+        
+        # Search box; only the students matching it are laid out
+        search_rect = pygame.Rect(start_x, 110, buttons_per_row * button_width + (buttons_per_row - 1) * button_spacing_h, 34)
+        draw_search_box(self.screen, self.text_font, search_rect, self.delete_search)
+        matches = self.delete_matches()
+        
+        y_offset = 160
+        action_button_y = self.height - 120
+        visible_rows = (action_button_y - 30 - y_offset) // (button_height + button_spacing_v)
+        total_rows = (len(matches) + buttons_per_row - 1) // buttons_per_row
+        self.delete_scroll = min(self.delete_scroll, max(0, total_rows - visible_rows))
+        first = self.delete_scroll * buttons_per_row
+        shown = matches[first:first + visible_rows * buttons_per_row]
+        
+        if not matches:
+            status = "No students match"
+        elif total_rows > visible_rows:
+            status = f"{first + 1}-{first + len(shown)} of {len(matches)} students (scroll or Up/Down/PgUp/PgDn)"
+        else:
+            status = f"{len(matches)} students"
+        status_text = self.label_font.render(status, True, COLORS['text'])
+        self.screen.blit(status_text, (start_x, action_button_y - 26))
         
         # Draw student buttons in columns
-        for i, (username, name, email, phone) in enumerate(students):
+        for i, username in enumerate(shown):
             row = i // buttons_per_row
             col = i % buttons_per_row
             
@@ -1178,14 +1414,6 @@ class UserManagement:
             text_rect = text.get_rect(center=button_rect.center)
             self.screen.blit(text, text_rect)
             
-        # Calculate position for main buttons based on student list height
-        num_rows = (len(students) + buttons_per_row - 1) // buttons_per_row
-        last_button_y = y_offset + (num_rows - 1) * (button_height + button_spacing_v) + button_height
-        action_button_y = last_button_y + 40
-        
-        # Ensure buttons don't go off screen, position near bottom if list is short
-        action_button_y = max(action_button_y, self.height - 120)
-        
         # Draw delete button
         delete_button_rect = pygame.Rect(
             (self.width - self.button_width) // 2,
@@ -1223,15 +1451,17 @@ class UserManagement:
         
         return delete_button_rect, back_button_rect, student_buttons
     
+    @profiler.screen("UserManagement")
     def run(self):
         clock = pygame.time.Clock()
         running = True
         showing_add_student = False
         
         while running:
+            metrics.begin_frame("UserManagement", self)
             mouse_pos = pygame.mouse.get_pos() # Get mouse position once per frame
             
-            for event in pygame.event.get():
+            for event in metrics.poll_events():
                 if event.type == pygame.QUIT:
                     running = False
                 
@@ -1336,6 +1566,24 @@ class UserManagement:
                                 if rect.collidepoint(mouse_pos):
                                     self.selected_student = username
                                     break
+                    
+                    elif event.type == pygame.MOUSEWHEEL:
+                        self.delete_scroll = max(0, self.delete_scroll - event.y)
+                    
+                    elif event.type == pygame.KEYDOWN and event.key != pygame.K_ESCAPE:
+                        # Typing goes to the search box; Enter picks the first match
+                        scroll_keys = {pygame.K_UP: -1, pygame.K_DOWN: 1, pygame.K_PAGEUP: -6, pygame.K_PAGEDOWN: 6}
+                        if event.key in scroll_keys:
+                            self.delete_scroll = max(0, self.delete_scroll + scroll_keys[event.key])
+                        elif event.key == pygame.K_RETURN:
+                            if self.delete_matches():
+                                self.selected_student = self.delete_matches()[0]
+                        elif event.key == pygame.K_BACKSPACE:
+                            self.delete_search = self.delete_search[:-1]
+                            self.delete_scroll = 0
+                        elif event.unicode and event.unicode.isprintable():
+                            self.delete_search += event.unicode
+                            self.delete_scroll = 0
                 else:
                     # Main menu event handling
                     if event.type == pygame.MOUSEBUTTONDOWN:
@@ -1347,15 +1595,17 @@ class UserManagement:
                             elif self.delete_student_button_rect.collidepoint(mouse_pos):
                                 self.showing_delete_student = True
                                 self.selected_student = None # Reset selected student
+                                self.delete_search = ""
+                                self.delete_scroll = 0
                             elif self.view_students_button_rect.collidepoint(mouse_pos):
-                                DataDisplayWindow(self.load_all_students(), "students", self.is_admin, self)
+                                DataDisplayWindow(self.load_all_students, "students", self.is_admin, self)
                             elif self.visualize_marks_button_rect.collidepoint(mouse_pos):
                                 DataDisplayWindow(self.visualize_marks(), "visualization", self.is_admin, self)
                         
                         if self.marks_button_rect.collidepoint(mouse_pos):
-                            DataDisplayWindow(self.load_marks(), "marks", self.is_admin, self)
+                            DataDisplayWindow(self.load_marks, "marks", self.is_admin, self)
                         elif self.eca_button_rect.collidepoint(mouse_pos):
-                            DataDisplayWindow(self.load_eca(), "eca", self.is_admin, self)
+                            DataDisplayWindow(self.load_eca, "eca", self.is_admin, self)
                         elif self.logout_button_rect.collidepoint(mouse_pos):
                             running = False
                             pygame.quit()
@@ -1394,6 +1644,7 @@ class UserManagement:
                             MenuUI()
             
             # Draw background
+            metrics.mark("draw")
             if self.bg_image:
                 self.screen.blit(self.bg_image, (0, 0))
             else:
@@ -1490,7 +1741,7 @@ class UserManagement:
                 back_text_rect = back_text.get_rect(center=self.back_button_rect.center)
                 self.screen.blit(back_text, back_text_rect)
             
-            pygame.display.flip()
+            metrics.flip()
             clock.tick(60)
         
         pygame.quit()